@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Producer, Species, Plot, Tree, Measurement
+from .models import CalcJob, Producer, Species, Plot, PlotAccumulator, Tree, Measurement
 
 
 @admin.register(Producer)
@@ -26,7 +26,21 @@ class TreeAdmin(admin.ModelAdmin):
     list_filter = ("plot",)
 
 
+@admin.register(PlotAccumulator)
+class PlotAccumulatorAdmin(admin.ModelAdmin):
+    list_display = ("plot", "trees_count", "stale", "updated_at")
+    list_filter = ("stale",)
+
+
 @admin.register(Measurement)
 class MeasurementAdmin(admin.ModelAdmin):
     list_display = ("id", "plot", "created_at")
     list_filter = ("plot",)
+    raw_id_fields = ("input_blob", "metrics_blob")
+
+
+@admin.register(CalcJob)
+class CalcJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "progress_done", "progress_total", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    exclude = ("payload", "result")
@@ -0,0 +1,133 @@
+import hashlib
+import math
+from typing import Any, Dict, List, Sequence
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import Ceil, Floor, RowNumber, TruncMonth
+
+
+# Estadísticas agrupadas sobre las columnas de resumen de Measurement, calculadas en la
+# base de datos (GROUP BY + funciones de ventana para percentiles): no se cargan
+# registros ni se decodifica JSON en Python.
+
+GROUPINGS = {
+    # group_by -> (expresión de la clave, campo de etiqueta o None)
+    'producer': (F('plot__producer_id'), 'plot__producer__name'),
+    'species': (F('plot__species_id'), 'plot__species__name'),
+    'site_class': (F('plot__site_class'), None),
+    'month': (TruncMonth('created_at'), None),
+}
+
+DEFAULT_METRICS = ('vol_total_cc_per_ha_m3', 'biomass_total_tn_per_ha', 'c_bosque_tn_per_ha')
+DEFAULT_PERCENTILES = (50.0, 90.0)
+
+VERSION_KEY = 'ciefap:analytics:version'
+
+
+def bump_version() -> None:
+    # Invalida todas las respuestas cacheadas (se llama al guardar o borrar mediciones)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    version = cache.get(VERSION_KEY, 0)
+    raw = repr(sorted(params.items())).encode('utf-8')
+    return f'ciefap:analytics:{version}:{hashlib.sha256(raw).hexdigest()}'
+
+
+def _percentile_values(queryset, group_expr, metric: str, keys: Sequence[Any], percentiles: Sequence[float]) -> Dict[Any, Dict[str, float]]:
+    # Percentil con interpolación lineal (igual que numpy.percentile): para cada grupo se
+    # piden solo las filas de rango floor/ceil de p*(n-1) con ROW_NUMBER() OVER (PARTITION BY ...).
+    ranked = (
+        queryset.exclude(**{f'{metric}__isnull': True})
+        .annotate(_group=group_expr)
+        .filter(_group__in=keys)
+        .annotate(
+            _rn=Window(RowNumber(), partition_by=[F('_group')], order_by=[F(metric).asc(), F('id').asc()]),
+            _n=Window(Count('id'), partition_by=[F('_group')]),
+        )
+    )
+    condition = Q()
+    for p in percentiles:
+        position = (F('_n') - 1) * (p / 100.0)
+        condition |= Q(_rn=Floor(position) + 1) | Q(_rn=Ceil(position) + 1)
+    by_group: Dict[Any, Dict[int, float]] = {}
+    counts: Dict[Any, int] = {}
+    for group, rn, n, value in ranked.filter(condition).values_list('_group', '_rn', '_n', metric):
+        by_group.setdefault(group, {})[rn - 1] = value
+        counts[group] = n
+
+    out: Dict[Any, Dict[str, float]] = {}
+    for group, ranks in by_group.items():
+        values = {}
+        for p in percentiles:
+            position = (counts[group] - 1) * (p / 100.0)
+            lo, hi = math.floor(position), math.ceil(position)
+            value = ranks[lo] + (ranks[hi] - ranks[lo]) * (position - lo)
+            values[f'p{p:g}'] = round(value, 4)
+        out[group] = values
+    return out
+
+
+def grouped_statistics(
+    queryset,
+    group_by: str,
+    metrics: Sequence[str] = DEFAULT_METRICS,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    offset: int = 0,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    group_expr, label_field = GROUPINGS[group_by]
+    grouped = queryset.annotate(_group=group_expr).values('_group')
+    if label_field:
+        grouped = grouped.annotate(_label=F(label_field)).values('_group', '_label')
+
+    aggregates = {'_measurements': Count('id')}
+    for metric in metrics:
+        aggregates[f'{metric}__count'] = Count(metric)
+        aggregates[f'{metric}__mean'] = Avg(metric)
+        aggregates[f'{metric}__min'] = Min(metric)
+        aggregates[f'{metric}__max'] = Max(metric)
+        aggregates[f'{metric}__sum'] = Sum(metric)
+
+    total_groups = grouped.order_by().distinct().count()
+    rows = list(grouped.annotate(**aggregates).order_by(F('_group').asc(nulls_first=True))[offset:offset + limit])
+    keys = [row['_group'] for row in rows if row['_group'] is not None]
+
+    percentile_values = {}
+    if percentiles and keys:
+        for metric in metrics:
+            percentile_values[metric] = _percentile_values(queryset, group_expr, metric, keys, percentiles)
+
+    results: List[Dict[str, Any]] = []
+    for row in rows:
+        group = row['_group']
+        stats = {}
+        for metric in metrics:
+            mean = row[f'{metric}__mean']
+            stats[metric] = {
+                'count': row[f'{metric}__count'],
+                'mean': round(mean, 4) if mean is not None else None,
+                'min': row[f'{metric}__min'],
+                'max': row[f'{metric}__max'],
+                'sum': round(row[f'{metric}__sum'], 4) if row[f'{metric}__sum'] is not None else None,
+                **percentile_values.get(metric, {}).get(group, {}),
+            }
+        results.append({
+            'key': group.date().isoformat() if group_by == 'month' and group is not None else group,
+            'label': row.get('_label'),
+            'measurements': row['_measurements'],
+            'metrics': stats,
+        })
+
+    return {
+        'group_by': group_by,
+        'count': total_groups,
+        'offset': offset,
+        'limit': limit,
+        'results': results,
+    }
@@ -7,3 +7,6 @@ class ApiConfig(AppConfig):
     name = 'api'
     # Conservamos la etiqueta 'ciefap' para no romper el historial de migraciones
     label = 'ciefap'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_result_cache
+from .conditional import has_conditional_headers, not_modified_response, set_validators
+from .instrumentation import phase
+from .models import Measurement, Plot
+from .services import compute_plot_metrics, compute_record_metrics
+from .species import registry as species_registry
+from .views import MeasurementListCreateView, MeasurementRetrieveUpdateDeleteView, PlotMetricsView
+
+
+# Vistas asíncronas para el despliegue ASGI (uvicorn): mismas rutas, validaciones y
+# respuestas que las vistas de api/views.py, pero las consultas usan el ORM asíncrono
+# (afirst, acreate, async for) y el parseo del cuerpo y el cálculo van a un pool de hilos,
+# así un worker sigue atendiendo otros pedidos mientras espera a MySQL. Se activan con
+# CIEFAP_ASYNC_VIEWS (ver api/urls.py). PUT/PATCH/DELETE del detalle ejecutan la vista
+# sincrónica en un hilo.
+
+_executor = None
+_executor_lock = Lock()
+
+
+def worker_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, "CIEFAP_ASYNC_CPU_WORKERS", None) or os.cpu_count() or 1
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ciefap-cpu")
+    return _executor
+
+
+async def run_in_worker(func, *args):
+    # Copia el contexto para que las fases de instrumentación lleguen al hilo
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(worker_executor(), functools.partial(context.run, func, *args))
+
+
+def _request_data(request):
+    with phase("parse"):
+        return request.data or {}
+
+
+class AsyncAPIViewMixin:
+    # dispatch asíncrono de DRF. initial() (autenticación, permisos, negociación) se
+    # ejecuta en el event loop: con la configuración de REST_FRAMEWORK de este proyecto
+    # (sin autenticación ni throttling) no accede a la base.
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+            method = request.method.lower()
+            handler = getattr(self, method, self.http_method_not_allowed) if method in self.http_method_names else self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+class AsyncPlotMetricsView(AsyncAPIViewMixin, PlotMetricsView):
+    async def post(self, request):
+        data = await run_in_worker(_request_data, request)
+        try:
+            default_per_tree, output_format = self.output_formats(request, data)
+        except (TypeError, ValueError, AttributeError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        species_version, allometries = await sync_to_async(species_registry.snapshot)()
+        result_cache = get_result_cache()
+        cache_key = await run_in_worker(self.result_cache_key, result_cache, data, output_format, species_version)
+        cached = await run_in_worker(result_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK, headers={"X-Cache": "HIT"})
+
+        try:
+            result = await run_in_worker(compute_plot_metrics, data, default_per_tree, allometries)
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if cache_key:
+            await run_in_worker(result_cache.set, cache_key, result)
+        return Response(result, status=status.HTTP_200_OK, headers={"X-Cache": "MISS"} if cache_key else None)
+
+
+class AsyncMeasurementListCreateView(AsyncAPIViewMixin, MeasurementListCreateView):
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if has_conditional_headers(request, by_date=False):
+            page_size = self.paginator.get_page_size(request)
+            rows = [row async for row in self.paginator.page_queryset(queryset, request).values_list('id', 'updated_at')]
+            not_modified = not_modified_response(request, *self.page_validators(rows[:page_size], len(rows) > page_size))
+            if not_modified is not None:
+                return not_modified
+
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        set_validators(response, *self.page_validators([(m.pk, m.updated_at) for m in page], self.paginator.has_next))
+        return response
+
+    async def post(self, request, *args, **kwargs):
+        payload = await run_in_worker(_request_data, request)
+        input_data = payload.get('input_data')
+        metrics = payload.get('metrics')
+        plot_id = payload.get('plot_id')
+
+        if not metrics and input_data:
+            allometries = await sync_to_async(species_registry.allometries)()
+            try:
+                metrics = await run_in_worker(compute_record_metrics, input_data, allometries)
+            except ValueError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with phase("db_write"):
+            plot = await Plot.objects.filter(pk=plot_id).afirst() if plot_id else None
+            measurement = await Measurement.objects.acreate(plot=plot, input_data=input_data, metrics=metrics)
+        with phase("serialize"):
+            data = self.get_serializer(measurement).data
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+
+class AsyncMeasurementRetrieveUpdateDeleteView(AsyncAPIViewMixin, MeasurementRetrieveUpdateDeleteView):
+    async def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        if has_conditional_headers(request):
+            updated_at = await queryset.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).afirst()
+            if updated_at is None:
+                raise Http404
+            not_modified = not_modified_response(request, *self.record_validators(self.kwargs['pk'], updated_at))
+            if not_modified is not None:
+                return not_modified
+
+        instance = await aget_object_or_404(queryset, pk=self.kwargs['pk'])
+        self.check_object_permissions(request, instance)
+        response = Response(self.get_serializer(instance).data)
+        set_validators(response, *self.record_validators(instance.pk, instance.updated_at))
+        return response
+
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(super().put)(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await sync_to_async(super().patch)(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(super().delete)(request, *args, **kwargs)
@@ -0,0 +1,253 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .calculations import (
+    aggregate_plot_metrics,
+    basal_area_m2,
+    biomass_above_kg,
+    biomass_root_kg,
+    volume_merchantable15_cc_m3,
+    volume_merchantable15_sc_m3,
+    volume_total_cc_m3,
+    volume_total_sc_m3,
+)
+from .engine import PER_TREE_NONE, plot_metrics
+from .models import Measurement, Plot, summary_from_metrics
+from .renderers import FastJSONRenderer
+from .services import compute_plot_metrics
+
+
+# Benchmarks reproducibles de los caminos críticos (cálculo y API). Cada escenario mide
+# latencia (percentiles sobre las repeticiones), throughput y memoria pico (tracemalloc)
+# y el resultado se guarda como JSON; compare_to_baseline marca las regresiones que
+# superan el umbral. Los datos son sintéticos pero con forma de inventario real.
+
+DEFAULT_SIZES = (10, 1000, 100_000, 1_000_000)
+DEFAULT_API_SIZES = (10, 1000, 100_000)
+DEFAULT_RECORDS = 100_000
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+NO_RESULT_CACHE = {"BACKEND": "none", "ALIAS": "default", "MAX_ENTRIES": 0, "TTL": 0}
+
+
+def synthetic_trees(n: int, seed: int = 0, age_years: float = 15.0) -> List[Dict[str, float]]:
+    # Inventario sintético: DAP log-normal según la edad y altura por una curva
+    # altura-diámetro (Michaelis-Menten) con ruido, redondeados como en planilla de campo
+    rng = np.random.default_rng(seed)
+    mean_dap = 2.0 + 1.6 * age_years
+    dap = np.clip(rng.lognormal(np.log(mean_dap), 0.25, n), 2.5, 120.0)
+    height = 1.3 + 32.0 * dap / (28.0 + dap) * rng.normal(1.0, 0.08, n)
+    height = np.clip(height, 1.5, 55.0)
+    return [
+        {"dap_cm": d, "height_m": h}
+        for d, h in zip(np.round(dap, 1).tolist(), np.round(height, 1).tolist())
+    ]
+
+
+def synthetic_plot(n: int, seed: int = 0) -> Dict[str, Any]:
+    return {
+        "trees": synthetic_trees(n, seed),
+        "distance_in_row_m": 3.0,
+        "distance_between_rows_m": 3.0,
+        "age_years": 15,
+        "dominant_height_m": 18.5,
+    }
+
+
+def measure(func: Callable[[], Any], repeat: int = DEFAULT_REPEAT, items: int = 1) -> Dict[str, Any]:
+    # Una ejecución de calentamiento; luego 'repeat' mediciones de tiempo y una de memoria
+    func()
+    timings = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    percentiles = np.percentile(timings, [50, 95, 99]).tolist()
+    median = statistics.median(timings)
+    return {
+        "items": items,
+        "repeat": len(timings),
+        "latency_ms": {
+            "min": round(timings[0] * 1000.0, 4),
+            "p50": round(percentiles[0] * 1000.0, 4),
+            "p95": round(percentiles[1] * 1000.0, 4),
+            "p99": round(percentiles[2] * 1000.0, 4),
+        },
+        "throughput_per_s": round(items / median, 2) if median > 0 else None,
+        "peak_memory_mb": round(peak / 2 ** 20, 3),
+    }
+
+
+def _per_tree_loop(trees: Sequence[Mapping[str, float]], root_ratio: float = 0.263) -> List[Dict[str, float]]:
+    # Bucle por árbol con las funciones escalares de referencia (como lo hacía la vista original)
+    rows = []
+    for t in trees:
+        dap = float(t.get("dap_cm", 0))
+        h = float(t.get("height_m", 0))
+        b_above = biomass_above_kg(dap, h)
+        b_root = biomass_root_kg(b_above, root_ratio)
+        rows.append({
+            "dap_cm": dap,
+            "height_m": h,
+            "ab_m2": round(basal_area_m2(dap), 4),
+            "vol_total_cc_m3": round(volume_total_cc_m3(dap, h), 4),
+            "vol_total_sc_m3": round(volume_total_sc_m3(dap, h), 4),
+            "vol_maderable15_cc_m3": round(volume_merchantable15_cc_m3(dap, h), 4),
+            "vol_maderable15_sc_m3": round(volume_merchantable15_sc_m3(dap, h), 4),
+            "biomass_above_kg": round(b_above, 3),
+            "biomass_root_kg": round(b_root, 3),
+            "biomass_total_kg": round(b_above + b_root, 3),
+        })
+    return rows
+
+
+def calculation_benchmarks(sizes: Iterable[int], repeat: int = DEFAULT_REPEAT, seed: int = 0) -> Dict[str, Any]:
+    results = {}
+    for n in sizes:
+        trees = synthetic_trees(n, seed)
+        results[f"calc.aggregate_plot_metrics[{n}]"] = measure(
+            lambda: aggregate_plot_metrics(trees, 3.0, 3.0, age_years=15), repeat, n,
+        )
+        results[f"calc.per_tree_loop[{n}]"] = measure(lambda: _per_tree_loop(trees), repeat, n)
+        results[f"engine.plot_metrics[{n}]"] = measure(lambda: plot_metrics(trees, 3.0, 3.0), repeat, n)
+        # Serialización de la respuesta de /api/calc/metrics con per_tree por filas
+        if n <= 100_000:
+            response = compute_plot_metrics(synthetic_plot(n, seed), "rows")
+            results[f"render.json_drf[{n}]"] = measure(lambda: JSONRenderer().render(response), repeat, n)
+            results[f"render.json_fast[{n}]"] = measure(lambda: FastJSONRenderer().render(response), repeat, n)
+    return results
+
+
+def api_benchmarks(
+    sizes: Iterable[int],
+    records: int = DEFAULT_RECORDS,
+    repeat: int = DEFAULT_REPEAT,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    # Requiere una base de datos descartable (el comando usa una base de pruebas)
+    client = APIClient()
+    results = {}
+    with override_settings(CIEFAP_RESULT_CACHE=NO_RESULT_CACHE):
+        for n in sizes:
+            payload = synthetic_plot(n, seed)
+
+            def post_metrics():
+                response = client.post(reverse("plot-metrics"), data=payload, format="json")
+                assert response.status_code == 200, response.content[:200]
+
+            results[f"api.calc_metrics[{n}]"] = measure(post_metrics, repeat, n)
+
+        populate_measurements(records, seed)
+        url = reverse("measurement-list-create")
+        for name, params in (("records_list", {}), ("records_list_fields", {"fields": "id,plot,created_at"})):
+            def list_page(params=params):
+                response = client.get(url, params)
+                assert response.status_code == 200, response.content[:200]
+
+            results[f"api.{name}[{records}]"] = measure(list_page, repeat, 1)
+
+        record_payload = {"input_data": synthetic_plot(200, seed)}
+
+        def create_record():
+            response = client.post(url, data=record_payload, format="json")
+            assert response.status_code == 201, response.content[:200]
+
+        results[f"api.records_create[{records}]"] = measure(create_record, repeat, 1)
+    return results
+
+
+def populate_measurements(count: int, seed: int = 0, batch_size: int = 5000) -> None:
+    # Tabla de mediciones grande con métricas y columnas de resumen realistas
+    existing = Measurement.objects.count()
+    if existing >= count:
+        return
+    plots = [Plot.objects.create(distance_in_row_m=3.0, distance_between_rows_m=3.0) for _ in range(20)]
+    _, metrics = plot_metrics(synthetic_trees(50, seed), 3.0, 3.0, per_tree_format=PER_TREE_NONE)
+    input_data = synthetic_plot(50, seed)
+    summary = summary_from_metrics(metrics)
+    pending = count - existing
+    while pending > 0:
+        size = min(batch_size, pending)
+        Measurement.objects.bulk_create([
+            Measurement(
+                plot=plots[(pending - i) % len(plots)],
+                input_data=input_data,
+                metrics=metrics,
+                **summary,
+            )
+            for i in range(size)
+        ], batch_size=size)
+        pending -= size
+
+
+def environment() -> Dict[str, Any]:
+    import django
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "django": django.get_version(),
+    }
+
+
+def compare_to_baseline(
+    current: Mapping[str, Any],
+    baseline: Mapping[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    # Regresión: throughput menor, p95 o memoria pico mayores que el baseline por más del umbral
+    regressions = []
+    for name, result in current.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        old, new = reference.get("throughput_per_s"), result.get("throughput_per_s")
+        if old and new is not None and new < old * (1.0 - threshold):
+            regressions.append(f"{name}: throughput {new:.1f}/s < {old:.1f}/s")
+        old, new = reference["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        if old and new > old * (1.0 + threshold):
+            regressions.append(f"{name}: p95 {new:.3f} ms > {old:.3f} ms")
+        old, new = reference["peak_memory_mb"], result["peak_memory_mb"]
+        # Por debajo de 1 MB las variaciones son ruido del intérprete
+        if max(old, new) >= 1.0 and new > old * (1.0 + threshold):
+            regressions.append(f"{name}: memoria pico {new:.2f} MB > {old:.2f} MB")
+    return regressions
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path: str, results: Mapping[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"environment": environment(), "results": results}, fh, indent=2, sort_keys=True)
+        fh.write("\n")
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .engine import trees_to_arrays
+
+
+# Caché de resultados de /api/calc/metrics indexada por el hash canónico de la entrada.
+# Dos cuerpos equivalentes (mismo orden de árboles, números iguales aunque vengan como
+# texto o entero) producen la misma clave.
+
+KEY_PREFIX = "ciefap:calc:"
+
+# Bytes aproximados en memoria de una respuesta (medidos con tracemalloc): encabezado y
+# agregados, y por árbol según el formato de per_tree (filas: un dict por árbol)
+BASE_RESULT_BYTES = 4096
+ROW_BYTES = 520
+COLUMN_BYTES = 320
+
+# Parámetros de parcela que afectan el resultado (valor por defecto = el de services.plot_parameters)
+KEY_PARAMETERS = (
+    ("distance_in_row_m", 0.0),
+    ("distance_between_rows_m", 0.0),
+    ("plot_area_m2", 0.0),
+    ("min_trees_for_plot", 20),
+    ("age_years", 0.0),
+    ("animal_emission_kg_day", 5.0),
+    ("species_root_ratio", 0.263),
+    ("site_index_m", None),
+    ("dominant_height_m", None),
+    ("species", None),
+)
+
+
+def _canonical_number(value: Any) -> Any:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def payload_key(data: Mapping[str, Any], per_tree: str, species_version: int = 0) -> str:
+    digest = hashlib.sha256()
+    params = [[name, _canonical_number(data.get(name, default))] for name, default in KEY_PARAMETERS]
+    # Las opciones de incertidumbre (con semilla) también determinan el resultado
+    uncertainty = data.get("uncertainty") or None
+    # La versión del registro de especies cambia al editar coeficientes (species.py)
+    header = [params, per_tree, uncertainty, species_version]
+    digest.update(json.dumps(header, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    # Los árboles se hashean como bytes de los arrays (mucho más rápido que serializarlos)
+    trees = data.get("trees") or []
+    dap, height = trees_to_arrays(trees)
+    digest.update(dap.tobytes())
+    digest.update(height.tobytes())
+    tree_species = [t.get("species") for t in trees]
+    if any(value not in (None, "") for value in tree_species):
+        digest.update(json.dumps(tree_species, separators=(",", ":")).encode("utf-8"))
+    return KEY_PREFIX + digest.hexdigest()
+
+
+def result_size(value: Any) -> int:
+    # Estimación sin recorrer el resultado: las filas por árbol dominan el tamaño
+    per_tree = value.get("per_tree") if isinstance(value, Mapping) else None
+    if isinstance(per_tree, list):
+        return BASE_RESULT_BYTES + len(per_tree) * ROW_BYTES
+    if isinstance(per_tree, Mapping) and per_tree:
+        column = next(iter(per_tree.values()))
+        return BASE_RESULT_BYTES + (len(column) if isinstance(column, list) else 0) * COLUMN_BYTES
+    return BASE_RESULT_BYTES
+
+
+class LocalResultCache:
+    # LRU acotado por cantidad de entradas y por bytes (estimados con result_size), con
+    # vencimiento por TTL, en memoria del proceso. Los resultados de más de
+    # max_entry_bytes (parcelas muy grandes con per_tree) no se guardan.
+
+    backend = "local"
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 4 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._bytes -= self._entries.pop(key)[2]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        size = result_size(value)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (self._clock() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = _stats(self.backend, self.hits, self.misses, len(self._entries), self.max_entries, self.ttl)
+            return {**stats, "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class DjangoResultCache:
+    # Usa el framework de caché de Django (compartido entre workers si el backend lo es:
+    # Redis, Memcached, base de datos). LRU/TTL quedan a cargo de ese backend. Los
+    # resultados se guardan con la generación actual como versión de la clave: clear()
+    # incrementa la generación y los anteriores dejan de leerse (vencen por TTL).
+
+    backend = "django"
+
+    def __init__(
+        self,
+        alias: str = "default",
+        ttl: float = 600.0,
+        max_entries: Optional[int] = None,
+        max_entry_bytes: int = 4 * 1024 * 1024,
+    ):
+        self.alias = alias
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _count(self, name: str) -> None:
+        key = KEY_PREFIX + name
+        self._cache.add(key, 0, timeout=None)
+        try:
+            self._cache.incr(key)
+        except ValueError:
+            self._cache.set(key, 1, timeout=None)
+
+    def _generation(self) -> int:
+        return self._cache.get(KEY_PREFIX + "generation", 1)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._cache.get(key, version=self._generation())
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if result_size(value) > self.max_entry_bytes:
+            return
+        self._cache.set(key, value, timeout=self.ttl, version=self._generation())
+
+    def clear(self) -> None:
+        key = KEY_PREFIX + "generation"
+        self._cache.add(key, 1, timeout=None)
+        try:
+            self._cache.incr(key)
+        except ValueError:
+            self._cache.set(key, 2, timeout=None)
+        self._cache.delete_many([KEY_PREFIX + "hits", KEY_PREFIX + "misses"])
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self._cache.get_many([KEY_PREFIX + "hits", KEY_PREFIX + "misses"])
+        hits = counters.get(KEY_PREFIX + "hits", 0)
+        misses = counters.get(KEY_PREFIX + "misses", 0)
+        return _stats(self.backend, hits, misses, None, self.max_entries, self.ttl)
+
+
+def _stats(backend: str, hits: int, misses: int, entries: Optional[int], max_entries: Optional[int], ttl: float) -> Dict[str, Any]:
+    total = hits + misses
+    return {
+        "backend": backend,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0,
+        "entries": entries,
+        "max_entries": max_entries,
+        "ttl_seconds": ttl,
+    }
+
+
+_result_cache = None
+_result_cache_config = None
+
+
+def get_result_cache():
+    # Se reconstruye si cambia la configuración (p. ej. override_settings en tests)
+    global _result_cache, _result_cache_config
+    config = dict(getattr(settings, "CIEFAP_RESULT_CACHE", {}) or {})
+    if _result_cache_config != config:
+        backend = config.get("BACKEND", "local")
+        ttl = float(config.get("TTL", 600))
+        max_entries = int(config.get("MAX_ENTRIES", 512))
+        max_bytes = int(config.get("MAX_BYTES", 64 * 1024 * 1024))
+        max_entry_bytes = int(config.get("MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+        if backend == "django":
+            _result_cache = DjangoResultCache(config.get("ALIAS", "default"), ttl, max_entries, max_entry_bytes)
+        elif backend == "local":
+            _result_cache = LocalResultCache(max_entries, ttl, max_bytes=max_bytes, max_entry_bytes=max_entry_bytes)
+        else:
+            _result_cache = None
+        _result_cache_config = config
+    return _result_cache
@@ -136,18 +136,25 @@ def aggregate_plot_metrics(
 
 
 # Curvas de sitio / altura dominante
+# Hd = (SI * (1 - e^(-0.14 * edad))^(1/0.67)) / (1 - e^(-0.14 * 10))^(1/0.67)
+SITE_CURVE_RATE = 0.14
+SITE_CURVE_EXPONENT = 1 / 0.67
+SITE_INDEX_BASE_AGE = 10
+# Término de la edad base (constante): se calcula una sola vez
+SITE_CURVE_BASE_TERM = (1 - math.exp(-SITE_CURVE_RATE * SITE_INDEX_BASE_AGE)) ** SITE_CURVE_EXPONENT
+
+
+def site_curve_term(age_years: float) -> float:
+    return (1 - math.exp(-SITE_CURVE_RATE * age_years)) ** SITE_CURVE_EXPONENT
+
+
 def dominant_height_from_site_index(site_index_m: float, age_years: float) -> float:
-    # Hd = (SI * (1 - e^(-0.14 * edad))^(1/0.67)) / (1 - e^(-0.14 * 10))^(1/0.67)
-    numerator = site_index_m * ((1 - math.exp(-0.14 * age_years)) ** (1 / 0.67))
-    denominator = ((1 - math.exp(-0.14 * 10)) ** (1 / 0.67))
-    return numerator / denominator
+    return site_index_m * site_curve_term(age_years) / SITE_CURVE_BASE_TERM
 
 
 def site_index_from_dominant_height(dominant_height_m: float, age_years: float) -> float:
     # SI = (Hd * (1 - e^(-0.14 * 10))^(1/0.67)) / (1 - e^(-0.14 * edad))^(1/0.67)
-    numerator = dominant_height_m * ((1 - math.exp(-0.14 * 10)) ** (1 / 0.67))
-    denominator = ((1 - math.exp(-0.14 * age_years)) ** (1 / 0.67))
-    return numerator / denominator
+    return dominant_height_m * SITE_CURVE_BASE_TERM / site_curve_term(age_years)
 
 
 def recommended_plot_area_m2(dist_in_row_m: float, dist_between_rows_m: float, min_trees: int = 20) -> float:
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import datetime
+from typing import Any, Optional
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# GET condicional para /api/records: ETag fuerte (hash de lo que determina el cuerpo:
+# URL, formato y (id, updated_at) de las filas) y, solo en el detalle, Last-Modified.
+# La lista no usa Last-Modified: la fecha más reciente de la página no refleja las
+# mediciones borradas ni las que entran desde la página siguiente (el ETag sí, porque
+# incluye los ids). Con If-None-Match (o If-Modified-Since en el detalle) la vista calcula
+# los validadores con una consulta liviana (sin las columnas JSON) y responde 304 sin
+# serializar. La compresión agrega al ETag un sufijo por codificación ("...-gzip"); al
+# comparar se ignora.
+
+# Cambiarlo si cambia el formato de salida de las mediciones (invalida los ETag emitidos)
+ETAG_VERSION = 1
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def has_conditional_headers(request, by_date: bool = True) -> bool:
+    # by_date=False: solo cuenta If-None-Match (vistas sin Last-Modified)
+    return "HTTP_IF_NONE_MATCH" in request.META or (by_date and "HTTP_IF_MODIFIED_SINCE" in request.META)
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha256(repr((ETAG_VERSION,) + parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _strip_encoding(etag: str) -> str:
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+
+def not_modified_response(request, etag: str, last_modified: Optional[datetime]) -> Optional[Response]:
+    # 304 si el cliente ya tiene esta representación; None si hay que responder el cuerpo
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        # Comparación débil (RFC 9110 13.1.2): se ignoran W/ y el sufijo de codificación
+        for candidate in parse_etags(if_none_match):
+            if candidate == "*" or _strip_encoding(candidate.removeprefix("W/")) == etag:
+                return _not_modified(candidate if candidate != "*" else etag, last_modified)
+        return None
+    since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    if since is not None and last_modified is not None and int(last_modified.timestamp()) <= since:
+        return _not_modified(etag, last_modified)
+    return None
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime]) -> Response:
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag: str, last_modified: Optional[datetime]) -> None:
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
@@ -0,0 +1,303 @@
+import math
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .calculations import trees_per_hectare
+from .instrumentation import count, phase
+
+
+# Motor columnar: mismas fórmulas que calculations.py (implementación de referencia
+# escalar) pero evaluadas sobre arrays de DAP/altura en una sola pasada.
+
+PER_TREE_COLUMNS: Tuple[str, ...] = (
+    "ab_m2",
+    "vol_total_cc_m3",
+    "vol_total_sc_m3",
+    "vol_maderable15_cc_m3",
+    "vol_maderable15_sc_m3",
+    "biomass_above_kg",
+    "biomass_root_kg",
+    "biomass_total_kg",
+)
+
+# Formatos de salida por árbol
+PER_TREE_ROWS = "rows"
+PER_TREE_COLUMNS_FORMAT = "columns"
+PER_TREE_NONE = "none"
+PER_TREE_FORMATS = (PER_TREE_ROWS, PER_TREE_COLUMNS_FORMAT, PER_TREE_NONE)
+
+# Redondeo por columna (el mismo que usaba el bucle por árbol de la vista)
+PER_TREE_DECIMALS: Dict[str, int] = {
+    "ab_m2": 4,
+    "vol_total_cc_m3": 4,
+    "vol_total_sc_m3": 4,
+    "vol_maderable15_cc_m3": 4,
+    "vol_maderable15_sc_m3": 4,
+    "biomass_above_kg": 3,
+    "biomass_root_kg": 3,
+    "biomass_total_kg": 3,
+}
+
+
+class Allometry(NamedTuple):
+    # Coeficientes de las ecuaciones por árbol (por defecto, los de calculations.py).
+    # Cada campo puede ser un escalar (una especie) o un array con un valor por árbol.
+    vol_total_cc_a: Any = 0.0006
+    vol_total_cc_b: Any = 0.3348
+    vol_total_sc_a: Any = -0.0021
+    vol_total_sc_b: Any = 0.3127
+    vol_merchantable15_cc_a: Any = -0.0136
+    vol_merchantable15_cc_b: Any = 0.3247
+    biomass_above_c: Any = -0.0808
+    biomass_above_a: Any = 0.0206
+    biomass_above_b: Any = 2.337
+    biomass_above_h: Any = 0.614
+    root_ratio: Any = 0.263
+
+
+DEFAULT_ALLOMETRY = Allometry()
+
+
+def species_key(value: Any) -> str:
+    # Las especies se identifican por id o por nombre (sin distinguir mayúsculas)
+    return str(value).strip().lower()
+
+
+def per_tree_allometry(
+    trees: Sequence[Mapping[str, Any]],
+    plot_species: Any,
+    allometries: Mapping[str, Allometry],
+) -> Allometry:
+    # Parcelas mixtas: cada árbol toma la especie de su campo 'species' (o la de la
+    # parcela). Se arma una tabla especies × coeficientes y se indexa con un array,
+    # sin consultas ni bucles por árbol sobre las ecuaciones.
+    keys = [species_key(plot_species)] if plot_species not in (None, "") else [None]
+    position = {keys[0]: 0}
+    index = np.empty(len(trees), dtype=np.intp)
+    for i, tree in enumerate(trees):
+        value = tree.get("species")
+        key = species_key(value) if value not in (None, "") else keys[0]
+        if key not in position:
+            position[key] = len(keys)
+            keys.append(key)
+        index[i] = position[key]
+    table = []
+    for key in keys:
+        if key is None:
+            table.append(DEFAULT_ALLOMETRY)
+        elif key in allometries:
+            table.append(allometries[key])
+        else:
+            raise ValueError(f"Especie desconocida: {key}")
+    if len(table) == 1:
+        return table[0]
+    if (index == index[0]).all():
+        return table[int(index[0])]  # todos los árboles de una misma especie
+    return Allometry(*np.asarray(table, dtype=np.float64)[index].T)
+
+
+def trees_to_arrays(trees: Iterable[Mapping[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    trees = list(trees)
+    n = len(trees)
+    dap = np.fromiter((float(t.get("dap_cm", 0.0)) for t in trees), dtype=np.float64, count=n)
+    height = np.fromiter((float(t.get("height_m", 0.0)) for t in trees), dtype=np.float64, count=n)
+    check_tree_arrays(dap, height)
+    return dap, height
+
+
+TREE_VALUES_MESSAGE = "'dap_cm' y 'height_m' deben ser números finitos mayores que 0."
+
+
+def invalid_trees(dap_cm: np.ndarray, height_m: np.ndarray) -> np.ndarray:
+    # DAP y altura finitos y > 0: con valores negativos las potencias de la biomasa dan NaN,
+    # que no tiene representación en JSON
+    return ~(np.isfinite(dap_cm) & np.isfinite(height_m) & (dap_cm > 0) & (height_m > 0))
+
+
+def check_tree_arrays(dap_cm: np.ndarray, height_m: np.ndarray) -> None:
+    invalid = invalid_trees(dap_cm, height_m)
+    if invalid.any():
+        raise ValueError(f"Árbol {int(invalid.argmax())}: {TREE_VALUES_MESSAGE}")
+
+
+def tree_columns(
+    dap_cm: np.ndarray,
+    height_m: np.ndarray,
+    root_ratio: Optional[float] = 0.263,
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Dict[str, np.ndarray]:
+    # root_ratio=None usa la relación raíz/aérea de 'allometry' (la de cada especie)
+    dap_cm = np.asarray(dap_cm, dtype=np.float64)
+    height_m = np.asarray(height_m, dtype=np.float64)
+    eq = allometry
+    if root_ratio is None:
+        root_ratio = eq.root_ratio
+
+    dap_m2 = (dap_cm / 100.0) ** 2
+    dap_m2_h = dap_m2 * height_m
+
+    vt_cc = eq.vol_total_cc_a + eq.vol_total_cc_b * dap_m2_h
+    vt_sc = eq.vol_total_sc_a + eq.vol_total_sc_b * dap_m2_h
+    vm15_cc = eq.vol_merchantable15_cc_a + eq.vol_merchantable15_cc_b * dap_m2_h
+    # Misma aproximación que volume_merchantable15_sc_m3: razón s/c vs c/c, 0.93 si c/c <= 0
+    positive = vt_cc > 0
+    ratio = np.where(positive, vt_sc / np.where(positive, vt_cc, 1.0), 0.93)
+    vm15_sc = vm15_cc * ratio
+
+    b_above = eq.biomass_above_c + eq.biomass_above_a * np.power(dap_cm, eq.biomass_above_b) * np.power(height_m, eq.biomass_above_h)
+    b_root = b_above * root_ratio
+
+    return {
+        "dap_cm": dap_cm,
+        "height_m": height_m,
+        "ab_m2": (math.pi * dap_m2) / 4.0,
+        "vol_total_cc_m3": vt_cc,
+        "vol_total_sc_m3": vt_sc,
+        "vol_maderable15_cc_m3": vm15_cc,
+        "vol_maderable15_sc_m3": vm15_sc,
+        "biomass_above_kg": b_above,
+        "biomass_root_kg": b_root,
+        "biomass_total_kg": b_above + b_root,
+    }
+
+
+def per_tree_rows(columns: Dict[str, np.ndarray]) -> List[Dict[str, float]]:
+    names = ("dap_cm", "height_m") + PER_TREE_COLUMNS
+    values = [columns["dap_cm"].tolist(), columns["height_m"].tolist()]
+    values += [np.round(columns[name], PER_TREE_DECIMALS[name]).tolist() for name in PER_TREE_COLUMNS]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def per_tree_column_lists(columns: Dict[str, np.ndarray]) -> Dict[str, List[float]]:
+    # Formato columnar: una lista por métrica, mismas claves y redondeos que per_tree_rows
+    out = {"dap_cm": columns["dap_cm"].tolist(), "height_m": columns["height_m"].tolist()}
+    for name in PER_TREE_COLUMNS:
+        out[name] = np.round(columns[name], PER_TREE_DECIMALS[name]).tolist()
+    return out
+
+
+SUM_COLUMNS: Tuple[str, ...] = ("dap_cm", "height_m") + PER_TREE_COLUMNS
+
+
+def column_sums(columns: Dict[str, np.ndarray]) -> Dict[str, float]:
+    sums = {name: float(columns[name].sum()) for name in SUM_COLUMNS}
+    sums["dap2"] = float(np.dot(columns["dap_cm"], columns["dap_cm"]))
+    return sums
+
+
+def aggregate_columns(
+    columns: Dict[str, np.ndarray],
+    dist_in_row_m: float,
+    dist_between_rows_m: float,
+    plot_area_m2: float = 0.0,
+) -> Dict[str, float]:
+    n = int(columns["dap_cm"].shape[0])
+    return aggregate_from_sums(n, column_sums(columns), dist_in_row_m, dist_between_rows_m, plot_area_m2)
+
+
+class RunningAggregate:
+    # Acumula las sumas suficientes de aggregate_from_sums bloque a bloque, sin
+    # conservar los árboles: memoria constante para listas de cualquier tamaño.
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.sums: Dict[str, float] = {name: 0.0 for name in SUM_COLUMNS + ("dap2",)}
+
+    def update(self, columns: Dict[str, np.ndarray]) -> None:
+        self.n += int(columns["dap_cm"].shape[0])
+        for name, value in column_sums(columns).items():
+            self.sums[name] += value
+
+    def aggregates(self, dist_in_row_m: float, dist_between_rows_m: float, plot_area_m2: float = 0.0) -> Dict[str, float]:
+        return aggregate_from_sums(self.n, self.sums, dist_in_row_m, dist_between_rows_m, plot_area_m2)
+
+
+def stand_density(
+    n: int,
+    dist_in_row_m: float,
+    dist_between_rows_m: float,
+    plot_area_m2: float = 0.0,
+) -> Tuple[float, float, float]:
+    # Árboles/ha sin redondear: (el que se usa, por marco, por área de parcela o 0)
+    try:
+        tph_spacing = trees_per_hectare(dist_in_row_m, dist_between_rows_m)
+        tph_plot = (n * 10000.0) / plot_area_m2 if plot_area_m2 and plot_area_m2 > 0 else 0.0
+    except ZeroDivisionError:  # marco minúsculo: el producto de las distancias da 0
+        tph_spacing = tph_plot = math.inf
+    if not (math.isfinite(tph_spacing) and math.isfinite(tph_plot)):
+        raise ValueError("El marco de plantación o el área de la parcela dan una densidad (árboles/ha) fuera de rango.")
+    return (tph_plot if tph_plot > 0 else tph_spacing), tph_spacing, tph_plot
+
+
+def aggregate_from_sums(
+    n: int,
+    sums: Mapping[str, float],
+    dist_in_row_m: float,
+    dist_between_rows_m: float,
+    plot_area_m2: float = 0.0,
+) -> Dict[str, float]:
+    # Mismo resultado (claves y redondeos) que aggregate_plot_metrics
+    tph, tph_spacing, tph_plot = stand_density(n, dist_in_row_m, dist_between_rows_m, plot_area_m2)
+    if n == 0:
+        return {
+            "trees_count": 0,
+            "dap_mean_cm": 0.0,
+            "height_mean_m": 0.0,
+            "dap2_mean": 0.0,
+            "ab_per_tree_m2": 0.0,
+            "ab_per_ha_m2": 0.0,
+            "vol_total_cc_per_ha_m3": 0.0,
+            "vol_total_sc_per_ha_m3": 0.0,
+            "vol_merchantable15_cc_per_ha_m3": 0.0,
+            "vol_merchantable15_sc_per_ha_m3": 0.0,
+            "trees_per_ha": tph_spacing,
+        }
+
+    ab_per_tree = sums["ab_m2"] / n
+    b_above = sums["biomass_above_kg"]
+    b_root = sums["biomass_root_kg"]
+
+    return {
+        "trees_count": n,
+        "dap_mean_cm": round(sums["dap_cm"] / n, 2),
+        "height_mean_m": round(sums["height_m"] / n, 2),
+        "dap2_mean": round(sums["dap2"] / n, 2),
+        "ab_per_tree_m2": round(ab_per_tree, 4),
+        "ab_per_ha_m2": round(ab_per_tree * tph, 2),
+        "vol_total_cc_per_ha_m3": round(sums["vol_total_cc_m3"] / n * tph, 2),
+        "vol_total_sc_per_ha_m3": round(sums["vol_total_sc_m3"] / n * tph, 2),
+        "vol_merchantable15_cc_per_ha_m3": round(sums["vol_maderable15_cc_m3"] / n * tph, 2),
+        "vol_merchantable15_sc_per_ha_m3": round(sums["vol_maderable15_sc_m3"] / n * tph, 2),
+        "biomass_above_tn_per_ha": round((b_above / n) * tph / 1000.0, 2),
+        "biomass_root_tn_per_ha": round((b_root / n) * tph / 1000.0, 2),
+        "biomass_total_tn_per_ha": round(((b_above + b_root) / n) * tph / 1000.0, 2),
+        "trees_per_ha": round(tph),
+        "trees_per_ha_by_spacing": round(tph_spacing),
+        "trees_per_ha_by_plot": round(tph_plot) if tph_plot > 0 else None,
+    }
+
+
+def plot_metrics(
+    trees: Iterable[Mapping[str, float]],
+    dist_in_row_m: float,
+    dist_between_rows_m: float,
+    plot_area_m2: float = 0.0,
+    root_ratio: Optional[float] = 0.263,
+    per_tree_format: str = PER_TREE_ROWS,
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Tuple[Any, Dict[str, float]]:
+    # per_tree_format: 'rows' (lista de dicts), 'columns' (dict de listas) o 'none'
+    with phase("per_tree"):
+        dap, height = trees_to_arrays(trees)
+        count("trees", int(dap.size))
+        columns = tree_columns(dap, height, root_ratio, allometry)
+        if per_tree_format == PER_TREE_NONE:
+            per_tree = None
+        elif per_tree_format == PER_TREE_COLUMNS_FORMAT:
+            per_tree = per_tree_column_lists(columns)
+        else:
+            per_tree = per_tree_rows(columns)
+    with phase("aggregate"):
+        agg = aggregate_columns(columns, dist_in_row_m, dist_between_rows_m, plot_area_m2)
+    return per_tree, agg
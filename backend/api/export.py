@@ -0,0 +1,275 @@
+import csv
+import io
+from datetime import datetime
+from itertools import islice, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .engine import PER_TREE_COLUMNS, per_tree_column_lists, tree_columns, trees_to_arrays
+from .models import SUMMARY_FIELDS, PayloadBlob
+from .payloads import decode_payload
+from .services import plot_allometry
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow es opcional: sin él solo se exporta CSV
+    pyarrow = None
+
+
+# Exportación de mediciones (GET /api/records/export y comando export_measurements).
+# Se lee la tabla en páginas de id y se escribe por bloques de filas:
+# la memoria no depende de la cantidad de mediciones. Dos tablas posibles: una fila
+# por medición (datos de parcela de input_data + columnas de resumen) o una fila por
+# árbol de input_data.trees con sus resultados recalculados por el motor columnar.
+
+EXPORT_CSV = "csv"
+EXPORT_PARQUET = "parquet"
+EXPORT_ARROW = "arrow"
+EXPORT_FORMATS = (EXPORT_CSV, EXPORT_PARQUET, EXPORT_ARROW)
+
+CONTENT_TYPES = {
+    EXPORT_CSV: "text/csv; charset=utf-8",
+    EXPORT_PARQUET: "application/vnd.apache.parquet",
+    EXPORT_ARROW: "application/vnd.apache.arrow.stream",
+}
+EXTENSIONS = {EXPORT_CSV: "csv", EXPORT_PARQUET: "parquet", EXPORT_ARROW: "arrows"}
+
+# Filas por bloque: grupo de filas en Parquet, lote en Arrow, escritura en CSV
+BATCH_ROWS = 5000
+# Mediciones por consulta
+FETCH_SIZE = 1000
+
+# Datos de parcela que se extraen de input_data
+INPUT_FIELDS = (
+    "distance_in_row_m",
+    "distance_between_rows_m",
+    "plot_area_m2",
+    "age_years",
+    "site_index_m",
+    "dominant_height_m",
+    "stand_area_ha",
+)
+
+# Columnas (nombre, tipo) de cada tabla; tipos: int, float, str, datetime
+MEASUREMENT_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("id", "int"),
+    ("plot_id", "int"),
+    ("created_at", "datetime"),
+    ("updated_at", "datetime"),
+    ("species", "str"),
+    *((name, "float") for name in INPUT_FIELDS),
+    *((name, "int" if name == "trees_count" else "float") for name in SUMMARY_FIELDS),
+)
+TREE_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("measurement_id", "int"),
+    ("plot_id", "int"),
+    ("created_at", "datetime"),
+    ("tree_index", "int"),
+    ("number", "int"),
+    ("species", "str"),
+    ("dap_cm", "float"),
+    ("height_m", "float"),
+    *((name, "float") for name in PER_TREE_COLUMNS),
+)
+
+
+def export_available(fmt: str) -> bool:
+    return fmt == EXPORT_CSV or (fmt in EXPORT_FORMATS and pyarrow is not None)
+
+
+def export_filename(fmt: str, trees: bool = False) -> str:
+    return f"{'measurement_trees' if trees else 'measurements'}.{EXTENSIONS[fmt]}"
+
+
+def _float(value: Any) -> Optional[float]:
+    # Valores de input_data: números o texto numérico; lo demás queda vacío
+    if value is None or value == "" or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value: Any) -> Optional[int]:
+    number = _float(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None or value == "" else str(value)
+
+
+def _pages_by_pk(queryset, fields: Sequence[str]) -> Iterator[List[tuple]]:
+    # Páginas por id (id > último ORDER BY id LIMIT n) en lugar de un solo .iterator():
+    # con MySQL/PyMySQL el cursor del iterador trae el resultado completo al cliente
+    queryset = queryset.order_by("pk")
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page.values_list("pk", *fields)[:FETCH_SIZE])
+        if rows:
+            yield rows
+        if len(rows) < FETCH_SIZE:
+            return
+        last = rows[-1][0]
+
+
+def _rows_with_input(queryset, fields: Sequence[str]) -> Iterator[tuple]:
+    # Filas (pk, *fields, input_data): los blobs de la página se leen en una consulta y
+    # cada contenido distinto se decodifica una vez (las parcelas repetidas comparten blob)
+    for rows in _pages_by_pk(queryset, [*fields, "input_blob_id"]):
+        blobs = PayloadBlob.objects.filter(pk__in={row[-1] for row in rows}).values_list("pk", "encoding", "data")
+        inputs = {pk: decode_payload(encoding, data) for pk, encoding, data in blobs}
+        for row in rows:
+            yield (*row[:-1], inputs.get(row[-1]))
+
+
+def measurement_rows(queryset) -> Iterator[tuple]:
+    fields = ["plot_id", "created_at", "updated_at", *SUMMARY_FIELDS]
+    for row in _rows_with_input(queryset, fields):
+        input_data = row[-1] if isinstance(row[-1], dict) else {}
+        yield (
+            *row[:4],
+            _str(input_data.get("species")),
+            *(_float(input_data.get(name)) for name in INPUT_FIELDS),
+            *row[4:-1],
+        )
+
+
+def _tree_results(input_data: Mapping[str, Any], trees: List[Any], allometries) -> Optional[Dict[str, List[float]]]:
+    # Mismas ecuaciones y redondeos que per_tree en /api/calc/metrics; None si algún árbol es inválido
+    try:
+        allometry, root_ratio = plot_allometry(input_data, trees, allometries)
+        dap, height = trees_to_arrays(trees)
+        return per_tree_column_lists(tree_columns(dap, height, root_ratio, allometry))
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return None
+
+
+def tree_rows(queryset, allometries: Optional[Mapping[str, Any]] = None) -> Iterator[tuple]:
+    # Una fila por árbol; las mediciones sin árboles no aportan filas
+    empty = (None,) * len(PER_TREE_COLUMNS)
+    for pk, plot_id, created_at, input_data in _rows_with_input(queryset, ("plot_id", "created_at")):
+        trees = input_data.get("trees") if isinstance(input_data, dict) else None
+        if not isinstance(trees, list) or not trees:
+            continue
+        results = _tree_results(input_data, trees, allometries)
+        # Resultados por árbol: columnas -> filas, una sola transposición por medición
+        per_tree = zip(*(results[name] for name in PER_TREE_COLUMNS)) if results else repeat(empty)
+        plot_species = input_data.get("species")
+        for index, (tree, values) in enumerate(zip(trees, per_tree)):
+            tree = tree if isinstance(tree, dict) else {}
+            yield (
+                pk, plot_id, created_at, index,
+                _int(tree.get("number")),
+                _str(tree.get("species", plot_species)),
+                _float(tree.get("dap_cm")),
+                _float(tree.get("height_m")),
+                *values,
+            )
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def csv_chunks(columns: Sequence[Tuple[str, str]], rows: Iterable[tuple]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    dates = [index for index, (_, kind) in enumerate(columns) if kind == "datetime"]
+    # En la tabla por árbol las fechas se repiten en cada árbol de la medición
+    formatted: Dict[datetime, str] = {}
+    for batch in _batches(rows, BATCH_ROWS):
+        for row in batch:
+            row = list(row)
+            for index in dates:
+                value = row[index]
+                if isinstance(value, datetime):
+                    if value not in formatted:
+                        formatted[value] = value.isoformat()
+                    row[index] = formatted[value]
+            writer.writerow(row)
+        formatted.clear()
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Sin filas: solo el encabezado
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ByteSink:
+    # Archivo de salida para pyarrow que acumula lo escrito hasta que se entrega con drain()
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def arrow_schema(columns: Sequence[Tuple[str, str]]):
+    types = {
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "str": pyarrow.string(),
+        "datetime": pyarrow.timestamp("us", tz="UTC"),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def arrow_chunks(columns: Sequence[Tuple[str, str]], rows: Iterable[tuple], fmt: str) -> Iterator[bytes]:
+    # Parquet: un grupo de filas por bloque (el pie con los metadatos va al final).
+    # Arrow: formato IPC de streaming, legible a medida que llega.
+    if pyarrow is None:
+        raise ValueError("Exportar en Parquet/Arrow requiere el paquete pyarrow.")
+    schema = arrow_schema(columns)
+    sink = _ByteSink()
+    if fmt == EXPORT_PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="snappy")
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        for batch in _batches(rows, BATCH_ROWS):
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(queryset, fmt: str = EXPORT_CSV, trees: bool = False, allometries: Optional[Mapping[str, Any]] = None) -> Iterator[bytes]:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato desconocido: {fmt} (use {', '.join(EXPORT_FORMATS)}).")
+    columns = TREE_COLUMNS if trees else MEASUREMENT_COLUMNS
+    rows = tree_rows(queryset, allometries) if trees else measurement_rows(queryset)
+    if fmt == EXPORT_CSV:
+        return csv_chunks(columns, rows)
+    return arrow_chunks(columns, rows, fmt)
@@ -0,0 +1,101 @@
+import csv
+import json
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from django.db import connection, transaction
+
+from .models import Plot, Tree
+from .stored_metrics import mark_accumulators_stale
+from .streaming import RowError, text_lines, tree_values
+
+
+# Carga masiva de inventarios (CSV o NDJSON) en Plot/Tree. Columnas: plot, number,
+# dap_cm, height_m ('plot' es opcional si se indica una parcela por defecto). La carga
+# es idempotente: (plot, number) es único y las filas repetidas actualizan DAP/altura.
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _tree_row(number: int, row: Dict[str, Any], default_plot: Optional[int]) -> Dict[str, Any]:
+    try:
+        plot = row.get("plot", row.get("plot_id"))
+        plot = int(plot) if plot not in (None, "") else default_plot
+        if plot is None:
+            raise ValueError("falta la parcela (columna 'plot')")
+        tree_number = int(row["number"])
+        if tree_number < 0:
+            raise ValueError("'number' debe ser un entero mayor o igual que 0.")
+        dap_cm, height_m = tree_values(float(row["dap_cm"]), float(row["height_m"]))
+        return {"plot": plot, "number": tree_number, "dap_cm": dap_cm, "height_m": height_m}
+    except KeyError as exc:
+        raise RowError(number, f"falta la columna {exc}") from exc
+    except (TypeError, ValueError, OverflowError) as exc:
+        raise RowError(number, str(exc)) from exc
+
+
+def iter_inventory_rows(lines: Iterable[Any], fmt: str, default_plot: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    if fmt == "ndjson":
+        for number, line in enumerate(text_lines(lines), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                raise RowError(number, str(exc)) from exc
+            if not isinstance(row, dict):
+                raise RowError(number, "se esperaba un objeto JSON")
+            yield _tree_row(number, row, default_plot)
+    else:
+        reader = csv.DictReader(text_lines(lines))
+        for number, row in enumerate(reader, start=2):
+            yield _tree_row(number, {key.strip().lower(): value for key, value in row.items() if key}, default_plot)
+
+
+def _ensure_plots(plot_ids, create_plots: bool) -> int:
+    existing = set(Plot.objects.filter(pk__in=plot_ids).values_list("pk", flat=True))
+    missing = sorted(set(plot_ids) - existing)
+    if missing and not create_plots:
+        raise ValueError(f"Parcelas inexistentes: {', '.join(map(str, missing[:20]))}")
+    if missing:
+        Plot.objects.bulk_create([Plot(pk=pk) for pk in missing], ignore_conflicts=True)
+    return len(missing)
+
+
+def import_trees(
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    create_plots: bool = False,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    batch_size = max(1, batch_size)
+    # MySQL hace upsert con ON DUPLICATE KEY (no acepta unique_fields); SQLite/PostgreSQL con ON CONFLICT
+    upsert = {"update_conflicts": True, "update_fields": ["dap_cm", "height_m"]}
+    if connection.features.supports_update_conflicts_with_target:
+        upsert["unique_fields"] = ["plot", "number"]
+
+    stats = {"rows": 0, "batches": 0, "plots_created": 0}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        # Dentro del lote gana la última fila de cada (plot, number)
+        unique = {(row["plot"], row["number"]): row for row in batch}
+        with transaction.atomic():
+            stats["plots_created"] += _ensure_plots({plot for plot, _ in unique}, create_plots)
+            Tree.objects.bulk_create(
+                [
+                    Tree(plot_id=row["plot"], number=row["number"], dap_cm=row["dap_cm"], height_m=row["height_m"])
+                    for row in unique.values()
+                ],
+                batch_size=batch_size,
+                **upsert,
+            )
+            # bulk_create no dispara señales: los acumuladores se recalculan en la próxima lectura
+            mark_accumulators_stale({plot for plot, _ in unique})
+        stats["rows"] += len(batch)
+        stats["batches"] += 1
+        if progress is not None:
+            progress(dict(stats))
+    return stats
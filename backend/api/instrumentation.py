@@ -0,0 +1,159 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Instrumentación por pedido: tiempos por fase, consultas SQL y árboles procesados.
+# El código de cálculo marca fases con `with phase("nombre"):` y conteos con `count()`;
+# si el pedido no está instrumentado (middleware deshabilitado) ambas llamadas solo leen
+# una ContextVar y no hacen nada. Los datos se exponen en la cabecera Server-Timing y se
+# acumulan en métricas estilo Prometheus (por proceso) que sirve /api/ops/metrics.
+# Sin dependencias de Django: el motor de cálculo lo importa (ver api/middleware.py).
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_count(self, name: str, value: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in self.phases.items()]
+        parts.append(f'db;dur={self.db_seconds * 1000.0:.2f};desc="{self.queries} queries"')
+        parts.extend(f'{name};desc="{value}"' for name, value in self.counts.items())
+        parts.append(f"total;dur={total * 1000.0:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("ciefap_request_timings", default=None)
+
+
+class _NoPhase:
+    # Contexto vacío reutilizable: costo casi nulo cuando no hay instrumentación
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+@contextmanager
+def _timed_phase(timings: RequestTimings, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_phase(name, time.perf_counter() - start)
+
+
+def activate(timings: RequestTimings):
+    return _current.set(timings)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+def phase(name: str):
+    timings = _current.get()
+    if timings is None:
+        return _NO_PHASE
+    return _timed_phase(timings, name)
+
+
+def count(name: str, value: int) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_count(name, value)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    # execute_wrapper permanente de las conexiones: el pedido se toma de la ContextVar, que
+    # también llega a los hilos donde el ORM asíncrono ejecuta las consultas
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db_seconds += time.perf_counter() - start
+
+
+class MetricsRegistry:
+    # Contadores e histogramas en memoria del proceso, con formato de exposición de Prometheus
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            state = self.histograms.get(key)
+            if state is None:
+                # [conteo por bucket..., +Inf, suma]
+                state = self.histograms[key] = [0.0] * (len(DURATION_BUCKETS) + 2)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ""
+        escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in items)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(state)) for key, state in self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), state in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, bucket in zip(DURATION_BUCKETS, state):
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', f'{bound:g}'),))} {bucket:g}")
+            lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {state[-2]:g}")
+            lines.append(f"{name}_count{self._labels(labels)} {state[-2]:g}")
+            lines.append(f"{name}_sum{self._labels(labels)} {state[-1]:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,316 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .engine import PER_TREE_ROWS
+from .models import CalcJob, JobKind, JobStatus
+from .services import compute_batch_chunk, estate_rollup, per_tree_format
+from .species import registry as species_registry
+
+
+# Trabajos de cálculo en segundo plano. POST /api/jobs guarda el trabajo en la tabla
+# CalcJob (la cola: no hace falta un broker externo) y responde enseguida con su id; el
+# comando run_calc_jobs (JobRunner) toma los trabajos en orden de llegada y reparte las
+# parcelas en bloques entre los procesos de un pool local. Los procesos del pool solo
+# calculan (services.compute_batch_chunk, sin Django); avance, cancelación, resultado y
+# expiración los escribe el runner en la base. Así un recálculo del establecimiento
+# completo no ocupa un worker de gunicorn ni choca con su timeout.
+
+JOB_DEFAULTS = {
+    # Trabajos en ejecución a la vez por runner
+    "MAX_CONCURRENT": 2,
+    # Procesos del pool (None = cantidad de CPUs)
+    "WORKERS": None,
+    # Parcelas por tarea del pool: granularidad del avance y de la cancelación
+    "CHUNK_SIZE": 50,
+    # Trabajos en cola admitidos; con más, POST /api/jobs responde 503
+    "MAX_QUEUED": 100,
+    "MAX_PLOTS": 100000,
+    # Segundos que se conserva el resultado de un trabajo terminado
+    "RESULT_TTL": 86400,
+    # Espera entre consultas a la cola cuando no hay trabajos
+    "POLL_INTERVAL": 2.0,
+    "HEARTBEAT_INTERVAL": 15,
+    # Un trabajo en ejecución sin latido durante este tiempo (runner caído) vuelve a la cola
+    "STALE_AFTER": 300,
+}
+PURGE_INTERVAL = 60.0
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def job_settings() -> Dict[str, Any]:
+    return {**JOB_DEFAULTS, **getattr(settings, "CIEFAP_JOBS", {})}
+
+
+def job_plots(kind: Any, payload: Any) -> Tuple[List[Any], str]:
+    # Parcelas del trabajo y formato per_tree por defecto; ValueError si el cuerpo no sirve
+    if kind == JobKind.METRICS:
+        if not isinstance(payload, dict):
+            raise ValueError("El trabajo 'metrics' espera el cuerpo de /api/calc/metrics (un objeto JSON).")
+        per_tree_format(payload.get("per_tree"))
+        return [payload], PER_TREE_ROWS
+    if kind != JobKind.BATCH:
+        raise ValueError(f"'kind' debe ser uno de: {', '.join(JobKind.values)}.")
+    plots = payload.get("plots") if isinstance(payload, dict) else payload
+    if not isinstance(plots, list) or len(plots) == 0:
+        raise ValueError("Debe proporcionar una lista 'plots' con los datos de cada parcela.")
+    default_per_tree = per_tree_format(payload.get("per_tree")) if isinstance(payload, dict) else PER_TREE_ROWS
+    return plots, default_per_tree
+
+
+def submit_job(kind: Any, payload: Any) -> CalcJob:
+    config = job_settings()
+    plots, _ = job_plots(kind, payload)
+    max_plots = int(config["MAX_PLOTS"])
+    if len(plots) > max_plots:
+        raise ValueError(f"El trabajo admite como máximo {max_plots} parcelas.")
+    if CalcJob.objects.filter(status=JobStatus.QUEUED).count() >= int(config["MAX_QUEUED"]):
+        raise QueueFull("La cola de trabajos está llena; reintente más tarde.")
+    return CalcJob.objects.create(kind=kind, payload=payload, progress_total=len(plots))
+
+
+def is_expired(job: CalcJob, now: Optional[datetime] = None) -> bool:
+    return job.expires_at is not None and job.expires_at <= (now or timezone.now())
+
+
+def job_status(job: CalcJob) -> Dict[str, Any]:
+    total = job.progress_total
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": {
+            "done": job.progress_done,
+            "total": total,
+            "percent": round(100.0 * job.progress_done / total, 1) if total else 0.0,
+        },
+        "cancel_requested": job.cancel_requested,
+        "error": job.error or None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "expired": is_expired(job),
+    }
+
+
+def cancel_job(job_id: Any) -> Optional[CalcJob]:
+    # En cola: se cancela en el acto. En ejecución: se marca y el runner descarta los
+    # bloques pendientes en su próxima vuelta. Terminado: no cambia.
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=int(job_settings()["RESULT_TTL"]))
+    CalcJob.objects.filter(pk=job_id, status=JobStatus.QUEUED).update(
+        status=JobStatus.CANCELLED, cancel_requested=True, finished_at=now, expires_at=expires_at,
+    )
+    CalcJob.objects.filter(pk=job_id, status=JobStatus.RUNNING).update(cancel_requested=True)
+    return CalcJob.objects.defer("payload", "result").filter(pk=job_id).first()
+
+
+def purge_expired() -> int:
+    deleted, _ = CalcJob.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+class _ActiveJob:
+    def __init__(self, job: CalcJob, plots: Sequence[Any], chunks: List[Tuple[Future, int]]) -> None:
+        self.kind = job.kind
+        self.plots = plots
+        self.chunks = chunks
+        self.done = 0
+
+
+class JobRunner:
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        self.config = job_settings()
+        self.max_concurrent = max(1, int(max_concurrent or self.config["MAX_CONCURRENT"]))
+        self.workers = max(1, int(workers or self.config["WORKERS"] or os.cpu_count() or 1))
+        self.chunk_size = max(1, int(self.config["CHUNK_SIZE"]))
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.active: Dict[Any, _ActiveJob] = {}
+        self.stopping = threading.Event()
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._last_heartbeat = 0.0
+        self._last_purge = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _finish(self, job_id: Any, status: str, result: Any = None, error: str = "", done: Optional[int] = None) -> None:
+        now = timezone.now()
+        fields = {
+            "status": status,
+            "result": result,
+            "error": error,
+            "finished_at": now,
+            "heartbeat_at": now,
+            "expires_at": now + timedelta(seconds=int(self.config["RESULT_TTL"])),
+        }
+        if done is not None:
+            fields["progress_done"] = done
+        # Solo si sigue siendo de este runner (no se lo reencoló por falta de latido)
+        CalcJob.objects.filter(pk=job_id, status=JobStatus.RUNNING, worker=self.name).update(**fields)
+
+    def recover_stale(self) -> int:
+        limit = timezone.now() - timedelta(seconds=int(self.config["STALE_AFTER"]))
+        stale = CalcJob.objects.filter(status=JobStatus.RUNNING, heartbeat_at__lt=limit).exclude(pk__in=list(self.active))
+        now = timezone.now()
+        stale.filter(cancel_requested=True).update(
+            status=JobStatus.CANCELLED, finished_at=now,
+            expires_at=now + timedelta(seconds=int(self.config["RESULT_TTL"])),
+        )
+        return stale.update(status=JobStatus.QUEUED, worker="", started_at=None, heartbeat_at=None, progress_done=0)
+
+    def claim(self) -> Optional[CalcJob]:
+        candidates = list(
+            CalcJob.objects.filter(status=JobStatus.QUEUED).order_by("created_at").values_list("pk", flat=True)[:self.max_concurrent]
+        )
+        for job_id in candidates:
+            now = timezone.now()
+            # UPDATE condicional: si otro runner lo tomó primero no se modifica ninguna fila
+            claimed = CalcJob.objects.filter(pk=job_id, status=JobStatus.QUEUED).update(
+                status=JobStatus.RUNNING, worker=self.name, started_at=now, heartbeat_at=now,
+            )
+            if claimed:
+                return CalcJob.objects.get(pk=job_id)
+        return None
+
+    def start(self, job: CalcJob) -> None:
+        try:
+            plots, default_per_tree = job_plots(job.kind, job.payload)
+        except (TypeError, ValueError) as exc:
+            self._finish(job.pk, JobStatus.FAILED, error=str(exc))
+            return
+        allometries = species_registry.allometries()
+        chunks = []
+        for start in range(0, len(plots), self.chunk_size):
+            chunk = plots[start:start + self.chunk_size]
+            future = self.executor.submit(compute_batch_chunk, start, chunk, default_per_tree, allometries)
+            chunks.append((future, len(chunk)))
+        self.active[job.pk] = _ActiveJob(job, plots, chunks)
+
+    def _complete(self, job_id: Any, active: _ActiveJob) -> None:
+        results = [item for future, _ in active.chunks for item in future.result()]
+        if active.kind == JobKind.METRICS:
+            item = results[0]
+            if item["ok"]:
+                self._finish(job_id, JobStatus.SUCCEEDED, result=item["result"], done=1)
+            else:
+                self._finish(job_id, JobStatus.FAILED, error=item["error"], done=1)
+            return
+        result = {"results": results, "estate": estate_rollup(active.plots, results)}
+        self._finish(job_id, JobStatus.SUCCEEDED, result=result, done=len(results))
+
+    def poll(self) -> None:
+        if not self.active:
+            return
+        cancelled = set(
+            CalcJob.objects.filter(pk__in=list(self.active), cancel_requested=True).values_list("pk", flat=True)
+        )
+        for job_id, active in list(self.active.items()):
+            if job_id in cancelled:
+                for future, _ in active.chunks:
+                    future.cancel()
+                del self.active[job_id]
+                self._finish(job_id, JobStatus.CANCELLED, done=active.done)
+                continue
+            failed = next((f for f, _ in active.chunks if f.done() and f.exception() is not None), None)
+            if failed is not None:
+                for future, _ in active.chunks:
+                    future.cancel()
+                del self.active[job_id]
+                self._finish(job_id, JobStatus.FAILED, error=str(failed.exception()) or type(failed.exception()).__name__, done=active.done)
+                continue
+            done = sum(size for future, size in active.chunks if future.done())
+            if done == len(active.plots):
+                del self.active[job_id]
+                try:
+                    with transaction.atomic():
+                        self._complete(job_id, active)
+                except Exception as exc:
+                    # Un resultado que no se puede armar o guardar (p. ej. NaN en el JSON) hace
+                    # fallar este trabajo, no el runner ni los demás trabajos
+                    self._finish(job_id, JobStatus.FAILED, error=str(exc) or type(exc).__name__, done=done)
+            elif done != active.done:
+                active.done = done
+                CalcJob.objects.filter(pk=job_id, status=JobStatus.RUNNING).update(progress_done=done, heartbeat_at=timezone.now())
+
+    def _maintenance(self) -> None:
+        clock = time.monotonic()
+        if self.active and clock - self._last_heartbeat >= float(self.config["HEARTBEAT_INTERVAL"]):
+            CalcJob.objects.filter(pk__in=list(self.active), status=JobStatus.RUNNING).update(heartbeat_at=timezone.now())
+            self._last_heartbeat = clock
+        if clock - self._last_purge >= PURGE_INTERVAL:
+            purge_expired()
+            self._last_purge = clock
+
+    def run_once(self) -> bool:
+        # Una vuelta: avance/cancelación de los activos y nuevos trabajos hasta el límite.
+        # Devuelve True si quedó algo en ejecución.
+        self.poll()
+        while len(self.active) < self.max_concurrent:
+            job = self.claim()
+            if job is None:
+                break
+            self.start(job)
+        self._maintenance()
+        return bool(self.active)
+
+    def _wait(self, timeout: float) -> None:
+        pending = [future for active in self.active.values() for future, _ in active.chunks if not future.done()]
+        if pending:
+            wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        elif not self.active:
+            self.stopping.wait(timeout)
+
+    def drain(self) -> None:
+        # Procesa la cola hasta vaciarla (run_calc_jobs --once)
+        while self.run_once() and not self.stopping.is_set():
+            self._wait(float(self.config["POLL_INTERVAL"]))
+
+    def run(self) -> None:
+        poll_interval = float(self.config["POLL_INTERVAL"])
+        self.recover_stale()
+        try:
+            while not self.stopping.is_set():
+                if not self.run_once():
+                    # Sin trabajos: no retener una conexión que MySQL puede cerrar por inactividad
+                    close_old_connections()
+                self._wait(poll_interval)
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        # Los trabajos interrumpidos vuelven a la cola para otro runner (o el próximo arranque)
+        if self.active:
+            for active in self.active.values():
+                for future, _ in active.chunks:
+                    future.cancel()
+            CalcJob.objects.filter(pk__in=list(self.active), status=JobStatus.RUNNING, worker=self.name).update(
+                status=JobStatus.QUEUED, worker="", started_at=None, heartbeat_at=None, progress_done=0,
+            )
+            self.active.clear()
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
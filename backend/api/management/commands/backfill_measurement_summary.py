@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from api.analytics import bump_version
+from api.models import SUMMARY_FIELDS, Measurement, summary_from_metrics
+
+
+class Command(BaseCommand):
+    help = "Completa las columnas de resumen de Measurement a partir del JSON 'metrics'."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Registros por lote (por defecto 1000).')
+        parser.add_argument('--only-missing', action='store_true', help='Procesar solo registros sin trees_count.')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        queryset = Measurement.objects.select_related(None).select_related('metrics_blob').order_by('pk')
+        if options['only_missing']:
+            queryset = queryset.filter(trees_count__isnull=True)
+
+        # Lotes por rango de pk: sin OFFSET y sin cargar la tabla completa en memoria
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for measurement in batch:
+                for name, value in summary_from_metrics(measurement.metrics).items():
+                    setattr(measurement, name, value)
+            Measurement.objects.bulk_update(batch, SUMMARY_FIELDS)
+            updated += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'{updated} registros actualizados (último id {last_pk})')
+
+        if updated:
+            bump_version()  # bulk_update no dispara señales: la analítica cacheada se invalida acá
+        self.stdout.write(self.style.SUCCESS(f'Listo: {updated} registros.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Plot
+from api.stored_metrics import accumulator_drift, rebuild_accumulator
+
+
+class Command(BaseCommand):
+    help = "Compara los acumuladores por parcela con un recálculo completo (pensado para cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Reconstruir los acumuladores con diferencias.')
+        parser.add_argument('--rel-tol', type=float, default=1e-9, help='Tolerancia relativa (por defecto 1e-9).')
+        parser.add_argument('--plot', type=int, action='append', help='Revisar solo esta parcela (se puede repetir).')
+
+    def handle(self, *args, **options):
+        plots = Plot.objects.filter(accumulator__isnull=False).order_by('pk')
+        if options['plot']:
+            plots = plots.filter(pk__in=options['plot'])
+
+        checked = drifted = 0
+        for plot in plots.iterator():
+            checked += 1
+            drift = accumulator_drift(plot, options['rel_tol'])
+            if not drift:
+                continue
+            drifted += 1
+            details = ', '.join(f'{name}: {stored!r} != {exact!r}' for name, (stored, exact) in drift.items())
+            self.stdout.write(self.style.WARNING(f'Parcela #{plot.pk}: {details}'))
+            if options['fix']:
+                rebuild_accumulator(plot)
+
+        message = f'{checked} parcelas revisadas, {drifted} con diferencias'
+        if options['fix'] and drifted:
+            message += ' (reconstruidas)'
+        self.stdout.write(self.style.SUCCESS(message) if not drifted else message)
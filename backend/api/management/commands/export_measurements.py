@@ -0,0 +1,51 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api.export import EXPORT_FORMATS, EXTENSIONS, export_available, export_chunks
+from api.models import Measurement
+from api.species import registry as species_registry
+from api.views import filter_measurements
+
+
+class Command(BaseCommand):
+    help = "Exporta las mediciones (o sus árboles) a CSV, Parquet o Arrow, en streaming."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo de salida ('-' para escribir en stdout).")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help='Formato (por defecto según la extensión; si no, csv).')
+        parser.add_argument('--trees', action='store_true', help='Una fila por árbol de input_data.trees, con sus resultados.')
+        parser.add_argument('--plot', help='Solo las mediciones de esa parcela.')
+        parser.add_argument('--created-after', help='Fecha ISO 8601 (inclusive).')
+        parser.add_argument('--created-before', help='Fecha ISO 8601 (exclusive).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        by_extension = {f'.{extension}': name for name, extension in EXTENSIONS.items()}
+        fmt = options['format'] or next((name for extension, name in by_extension.items() if path.endswith(extension)), 'csv')
+        if not export_available(fmt):
+            raise CommandError('Exportar en Parquet/Arrow requiere el paquete pyarrow (pip install pyarrow).')
+        params = {name: options[name] for name in ('plot', 'created_after', 'created_before')}
+        try:
+            queryset = filter_measurements(Measurement.objects.all(), params)
+        except ValidationError as exc:
+            raise CommandError(str(exc.detail))
+
+        started = time.monotonic()
+        allometries = species_registry.allometries() if options['trees'] else None
+        written = 0
+        handle = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in export_chunks(queryset, fmt, options['trees'], allometries):
+                handle.write(chunk)
+                written += len(chunk)
+        finally:
+            if path == '-':
+                handle.flush()
+            else:
+                handle.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(f'Listo: {path} ({fmt}, {written:,} bytes, {time.monotonic() - started:.1f} s).'))
@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importing import DEFAULT_BATCH_SIZE, import_trees, iter_inventory_rows
+
+
+class Command(BaseCommand):
+    help = "Carga masiva de árboles desde CSV o NDJSON (columnas plot, number, dap_cm, height_m)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo CSV/NDJSON ('-' para leer de stdin).")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Formato (por defecto según la extensión).')
+        parser.add_argument('--plot', type=int, help="Parcela para las filas sin columna 'plot'.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f'Filas por transacción (por defecto {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--create-plots', action='store_true', help='Crear las parcelas inexistentes.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        started = time.monotonic()
+
+        def progress(stats):
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"{stats['rows']} filas en {stats['batches']} lotes ({stats['rows'] / elapsed * 60:,.0f} filas/min)")
+
+        handle = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            stats = import_trees(
+                iter_inventory_rows(handle, fmt, options['plot']),
+                batch_size=options['batch_size'],
+                create_plots=options['create_plots'],
+                progress=progress,
+            )
+        except ValueError as exc:
+            # Incluye RowError (fila inválida); los lotes anteriores ya quedaron guardados
+            raise CommandError(str(exc))
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {stats['rows']} filas, {stats['plots_created']} parcelas creadas, {time.monotonic() - started:.1f} s."
+        ))
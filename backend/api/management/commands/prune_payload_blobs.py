@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError, Sum
+from django.utils import timezone
+
+from api.models import Measurement, PayloadBlob
+
+
+class Command(BaseCommand):
+    help = "Borra los PayloadBlob que ya no usa ninguna medición (contenidos reemplazados o mediciones borradas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa cuántos blobs se borrarían.')
+        parser.add_argument('--grace', type=int, default=3600, help='Segundos de antigüedad mínima (por defecto 3600).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Blobs por transacción (por defecto 1000).')
+
+    def handle(self, *args, **options):
+        # Los blobs recientes se respetan: pueden pertenecer a una medición que se está guardando
+        cutoff = timezone.now() - timedelta(seconds=max(0, options['grace']))
+        measurements = Measurement.objects.select_related(None)
+        orphans = (
+            PayloadBlob.objects.filter(created_at__lt=cutoff)
+            .exclude(pk__in=measurements.values('input_blob'))
+            .exclude(pk__in=measurements.values('metrics_blob'))
+            .order_by('pk')
+        )
+        if options['dry_run']:
+            stats = orphans.aggregate(size=Sum('size'))
+            self.stdout.write(f'{orphans.count()} blobs sin uso ({stats["size"] or 0:,} bytes sin comprimir).')
+            return
+
+        deleted = skipped = 0
+        last = 0
+        while True:
+            ids = list(orphans.filter(pk__gt=last).values_list('pk', flat=True)[:max(1, options['batch_size'])])
+            if not ids:
+                break
+            last = ids[-1]
+            try:
+                with transaction.atomic():
+                    # Se vuelve a comprobar dentro de la transacción
+                    count, _ = orphans.filter(pk__in=ids).delete()
+            except (IntegrityError, ProtectedError):
+                # Alguno se volvió a usar mientras tanto: el lote queda para la próxima pasada
+                skipped += len(ids)
+                continue
+            deleted += count
+        self.stdout.write(self.style.SUCCESS(f'Listo: {deleted} blobs borrados' + (f', {skipped} omitidos (en uso).' if skipped else '.')))
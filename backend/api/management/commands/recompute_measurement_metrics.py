@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+
+from api.analytics import bump_version
+from api.models import Measurement
+from api.processes import init_django_worker
+from api.recompute import empty_stats, load_checkpoint, merge_stats, plan_ranges, recompute_range, save_checkpoint
+from api.species import registry as species_registry
+
+
+class Command(BaseCommand):
+    help = "Recalcula Measurement.metrics (y sus columnas de resumen) a partir de input_data, en paralelo y con checkpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Ids por rango (por defecto 2000).')
+        parser.add_argument('--workers', type=int, default=0, help='Procesos (por defecto la cantidad de CPUs; 1 = sin pool).')
+        parser.add_argument('--dry-run', action='store_true', help='No guarda nada: muestra qué valores cambiarían.')
+        parser.add_argument('--show', type=int, default=20, help='Registros de ejemplo a mostrar con --dry-run (por defecto 20).')
+        parser.add_argument('--tolerance', type=float, default=0.0, help='Diferencia absoluta por debajo de la cual un valor no cuenta como cambio.')
+        parser.add_argument('--checkpoint', default='recompute_measurements.checkpoint.json', help='Archivo de avance para reanudar.')
+        parser.add_argument('--restart', action='store_true', help='Ignorar el checkpoint y empezar desde el primer registro.')
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        workers = max(1, options['workers'] or os.cpu_count() or 1)
+        dry_run = options['dry_run']
+        show = max(0, options['show']) if dry_run else 0
+        checkpoint_path = options['checkpoint']
+
+        stats = empty_stats()
+        done_through = 0
+        finished = []
+        # El dry-run no escribe checkpoint: no hay nada que reanudar
+        if not dry_run and not options['restart']:
+            try:
+                checkpoint = load_checkpoint(checkpoint_path)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            if checkpoint is not None:
+                done_through = checkpoint['done_through']
+                # Rangos posteriores ya terminados (con el mismo --chunk-size se saltean)
+                finished = checkpoint['finished']
+                stats = merge_stats(stats, checkpoint['stats'])
+                self.stdout.write(f'Reanudando desde el id {done_through} ({stats["records"]} registros ya procesados).')
+
+        max_pk = Measurement.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        ranges = plan_ranges(done_through, max_pk, chunk_size, finished)
+        allometries = species_registry.allometries()
+        task = dict(allometries=allometries, dry_run=dry_run, tolerance=options['tolerance'], max_samples=show)
+
+        self.stats, self.done_through, self.processed = stats, done_through, 0
+        self.finished = set(finished)
+        self.started = time.perf_counter()
+        try:
+            if workers == 1 or len(ranges) <= 1:
+                for lo, hi in ranges:
+                    self._merge(recompute_range(lo, hi, **task), show)
+                    self._advance(checkpoint_path, hi, dry_run, max_pk)
+            else:
+                self._run_parallel(ranges, workers, task, show, checkpoint_path, dry_run, max_pk)
+        except KeyboardInterrupt:
+            raise CommandError(f'Interrumpido. Ejecutar de nuevo el comando para reanudar desde el id {self.done_through}.')
+
+        if not dry_run:
+            if stats['changed']:
+                bump_version()
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+        self._report(stats, dry_run, time.perf_counter() - self.started, self.processed)
+
+    def _run_parallel(self, ranges, workers, task, show, checkpoint_path, dry_run, max_pk):
+        # Procesos nuevos (spawn) con su propia conexión: no heredan la del proceso principal
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_django_worker)
+        pending = {}
+        queue = iter(ranges)
+        watermark_index = 0
+        try:
+            while True:
+                # Como mucho dos rangos por proceso en vuelo: memoria acotada
+                while len(pending) < workers * 2:
+                    bounds = next(queue, None)
+                    if bounds is None:
+                        break
+                    pending[pool.submit(recompute_range, *bounds, **task)] = bounds
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.finished.add(pending.pop(future))
+                    self._merge(future.result(), show)
+                # Checkpoint: último id hasta el que todos los rangos anteriores terminaron
+                advanced = None
+                while watermark_index < len(ranges) and ranges[watermark_index] in self.finished:
+                    self.finished.discard(ranges[watermark_index])
+                    advanced = ranges[watermark_index][1]
+                    watermark_index += 1
+                if advanced is not None:
+                    self._advance(checkpoint_path, advanced, dry_run, max_pk)
+        except KeyboardInterrupt:
+            # Se descartan los rangos que no empezaron; los que estaban en curso terminan y
+            # quedan anotados para no repetirlos al reanudar
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future, bounds in pending.items():
+                if not future.cancelled() and future.exception() is None:
+                    self.finished.add(bounds)
+                    self._merge(future.result(), show)
+            if not dry_run:
+                save_checkpoint(checkpoint_path, self.done_through, self.stats, self.finished)
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _merge(self, part, show):
+        self.processed += part['records']
+        merge_stats(self.stats, part, show)
+
+    def _advance(self, checkpoint_path, done_through, dry_run, max_pk):
+        self.done_through = done_through
+        if not dry_run:
+            save_checkpoint(checkpoint_path, done_through, self.stats, self.finished)
+        elapsed = time.perf_counter() - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(f'id {done_through}/{max_pk}: {self.stats["records"]} registros, {self.stats["changed"]} con cambios ({rate:,.0f} registros/s)')
+
+    def _report(self, stats, dry_run, elapsed, processed):
+        verb = 'cambiarían' if dry_run else 'actualizados'
+        self.stdout.write(
+            f'{stats["records"]} registros: {stats["changed"]} {verb}, {stats["skipped"]} sin árboles, '
+            f'{stats["failed"]} con error ({processed} en {elapsed:.1f} s).'
+        )
+        if stats['fields']:
+            self.stdout.write('Campos con cambios (registros, diferencia absoluta máxima):')
+            for path, (count, max_delta) in sorted(stats['fields'].items()):
+                self.stdout.write(f'  {path}: {count} ({max_delta:.6g})')
+        for sample in stats['samples']:
+            self.stdout.write(f'Medición #{sample["id"]}:')
+            for path, (before, after) in sample['changes'].items():
+                self.stdout.write(f'  {path}: {before} -> {after}' if path != 'per_tree' else '  per_tree: cambió')
+        self.stdout.write(self.style.SUCCESS('Simulación terminada (no se guardó nada).' if dry_run else 'Listo.'))
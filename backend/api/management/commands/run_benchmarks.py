@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmarking import (
+    DEFAULT_API_SIZES,
+    DEFAULT_RECORDS,
+    DEFAULT_REPEAT,
+    DEFAULT_SIZES,
+    DEFAULT_THRESHOLD,
+    api_benchmarks,
+    calculation_benchmarks,
+    compare_to_baseline,
+    load_baseline,
+    save_results,
+)
+
+
+def _sizes(value):
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise CommandError('Los tamaños deben ser enteros separados por coma.')
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks de cálculo y API (latencia p50/p95/p99, throughput y memoria pico). "
+            "Compara con un baseline JSON y falla si hay regresiones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='Árboles por escenario de cálculo.')
+        parser.add_argument('--api-sizes', default=','.join(map(str, DEFAULT_API_SIZES)), help='Árboles por POST /api/calc/metrics.')
+        parser.add_argument('--records', type=int, default=DEFAULT_RECORDS, help='Mediciones en la tabla para /api/records.')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', choices=['calc', 'api'], help='Ejecutar solo un grupo.')
+        parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Archivo de baseline.')
+        parser.add_argument('--output', help='Guardar los resultados en este archivo JSON.')
+        parser.add_argument('--save-baseline', action='store_true', help='Reemplazar el baseline con esta corrida.')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Regresión tolerada (0.25 = 25%%).')
+
+    def handle(self, *args, **options):
+        results = {}
+        if options['only'] in (None, 'calc'):
+            results.update(calculation_benchmarks(_sizes(options['sizes']), options['repeat'], options['seed']))
+        if options['only'] in (None, 'api'):
+            results.update(self._api(options))
+
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name}: p50 {latency['p50']:.3f} ms, p95 {latency['p95']:.3f} ms, "
+                f"{result['throughput_per_s']}/s, pico {result['peak_memory_mb']} MB"
+            )
+        if options['output']:
+            save_results(options['output'], results)
+        if options['save_baseline']:
+            save_results(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline guardado en {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(f"Sin baseline en {options['baseline']} (usar --save-baseline)."))
+            return
+        regressions = compare_to_baseline(results, baseline.get('results', {}), options['threshold'])
+        if regressions:
+            raise CommandError('Regresiones de rendimiento:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Sin regresiones respecto del baseline.'))
+
+    def _api(self, options):
+        # Base de datos de pruebas descartable: no se tocan los datos reales
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return api_benchmarks(_sizes(options['api_sizes']), options['records'], options['repeat'], options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
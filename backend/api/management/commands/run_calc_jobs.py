@@ -0,0 +1,34 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import JobRunner
+
+
+class Command(BaseCommand):
+    help = "Ejecuta los trabajos de cálculo en cola (/api/jobs) en un pool de procesos local."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Procesar la cola hasta vaciarla y terminar.')
+        parser.add_argument('--max-concurrent', type=int, default=None, help='Trabajos en ejecución a la vez (por defecto CIEFAP_JOBS).')
+        parser.add_argument('--workers', type=int, default=None, help='Procesos del pool (por defecto CIEFAP_JOBS o la cantidad de CPUs).')
+
+    def handle(self, *args, **options):
+        runner = JobRunner(max_concurrent=options['max_concurrent'], workers=options['workers'])
+        self.stdout.write(f'Runner {runner.name}: hasta {runner.max_concurrent} trabajos, {runner.workers} procesos.')
+        if options['once']:
+            runner.recover_stale()
+            try:
+                runner.drain()
+            finally:
+                runner.shutdown()
+            self.stdout.write(self.style.SUCCESS('Cola vacía.'))
+            return
+
+        # SIGTERM (reinicio del servicio): los trabajos en curso vuelven a la cola
+        signal.signal(signal.SIGTERM, lambda *_: runner.stopping.set())
+        try:
+            runner.run()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Runner detenido.'))
@@ -0,0 +1,268 @@
+import cProfile
+import gzip
+import hmac
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .conditional import ENCODING_SUFFIXES
+from .instrumentation import RequestTimings, activate, deactivate, metrics, phase, query_wrapper
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+
+# Middlewares propios: instrumentación y compresión de respuestas.
+# Instrumentación (ver api/instrumentation.py): deshabilitada por defecto; en ese caso
+# Django la descarta al arrancar y el único costo es el de las llamadas phase()/count()
+# vacías del código de cálculo.
+
+INSTRUMENTATION_DEFAULTS = {
+    "ENABLED": False,
+    # cProfile a pedido: cabecera X-Ciefap-Profile con este token (vacío = deshabilitado)
+    "PROFILE_TOKEN": "",
+    # Fracción de pedidos perfilados automáticamente (0 = solo a pedido)
+    "PROFILE_SAMPLE_RATE": 0.0,
+    # Directorio de los volcados .prof (sin directorio no se perfila)
+    "PROFILE_DIR": "",
+}
+PROFILE_HEADER = "HTTP_X_CIEFAP_PROFILE"
+
+
+def instrumentation_settings() -> Dict[str, object]:
+    return {**INSTRUMENTATION_DEFAULTS, **getattr(settings, "CIEFAP_INSTRUMENTATION", {})}
+
+
+def install_query_wrapper(sender=None, connection=None, **kwargs) -> None:
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+class TimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = instrumentation_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed()  # deshabilitado: Django no lo incluye en la cadena
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.profile_token = str(config["PROFILE_TOKEN"] or "")
+        self.sample_rate = float(config["PROFILE_SAMPLE_RATE"] or 0.0)
+        self.profile_dir = str(config["PROFILE_DIR"] or "")
+        # Conteo de consultas: en las conexiones que se abran desde ahora y en las ya abiertas
+        connection_created.connect(install_query_wrapper, dispatch_uid="ciefap-query-timing")
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection=connection)
+
+    def _should_profile(self, request) -> bool:
+        if not self.profile_dir:
+            return False
+        provided = request.META.get(PROFILE_HEADER)
+        if self.profile_token and provided and hmac.compare_digest(provided, self.profile_token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _start(self, request):
+        timings = RequestTimings()
+        request._ciefap_timings = timings
+        profiler = cProfile.Profile() if self._should_profile(request) else None
+        if profiler is not None:
+            profiler.enable()
+        return timings, activate(timings), profiler, time.perf_counter()
+
+    def _finish(self, request, response, timings, token, profiler, start):
+        total = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        deactivate(token)
+        if response is None:
+            return None
+        response["Server-Timing"] = timings.server_timing(total)
+        if profiler is not None:
+            response["X-Ciefap-Profile-Dump"] = self._dump(profiler, request)
+        self._record(request, response, timings, total)
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self._start(request)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            response = self._finish(request, response, *state)
+        return response
+
+    async def __acall__(self, request):
+        # En modo asíncrono el perfil de cProfile incluye a los demás pedidos del event loop
+        state = self._start(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            response = self._finish(request, response, *state)
+        return response
+
+    def process_template_response(self, request, response):
+        # Las respuestas de DRF se renderizan (JSON) después de la vista: se mide con un callback
+        timings = getattr(request, "_ciefap_timings", None)
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda r: timings.add_phase("render", time.perf_counter() - start))
+        return response
+
+    def _dump(self, profiler: cProfile.Profile, request) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.path.strip('/').replace('/', '_') or 'root'}.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
+        return name
+
+    def _record(self, request, response, timings: RequestTimings, total: float) -> None:
+        match = getattr(request, "resolver_match", None)
+        view = match.url_name if match is not None and match.url_name else "unmatched"
+        labels = {"view": view, "method": request.method}
+        metrics.observe("ciefap_request_duration_seconds", total, **labels)
+        metrics.inc("ciefap_requests_total", status=str(response.status_code), **labels)
+        metrics.inc("ciefap_db_queries_total", timings.queries, **labels)
+        metrics.observe("ciefap_db_duration_seconds", timings.db_seconds, **labels)
+        for name, seconds in timings.phases.items():
+            metrics.observe("ciefap_phase_duration_seconds", seconds, phase=name, **labels)
+        for name, value in timings.counts.items():
+            metrics.inc(f"ciefap_{name}_total", value, **labels)
+
+
+COMPRESSION_DEFAULTS = {
+    "ENABLED": True,
+    # Respuestas más chicas no se comprimen (el encabezado gzip no compensa)
+    "MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "BROTLI_QUALITY": 5,
+}
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def compression_settings() -> Dict[str, object]:
+    return {**COMPRESSION_DEFAULTS, **getattr(settings, "CIEFAP_COMPRESSION", {})}
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    # "gzip;q=0.8, br" -> {"gzip": 0.8, "br": 1.0} (q=0 significa no aceptada)
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    # gzip (o brotli si está instalado y el cliente lo acepta) para respuestas JSON/texto
+    # desde MIN_SIZE bytes. Las respuestas en streaming se dejan pasar sin comprimir para no
+    # retener filas. El ETag fuerte recibe un sufijo por codificación (ver api/conditional.py).
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = compression_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.min_size = int(config["MIN_SIZE"])
+        self.gzip_level = int(config["GZIP_LEVEL"])
+        self.brotli_quality = int(config["BROTLI_QUALITY"])
+
+    def choose_encoding(self, header: str) -> Optional[str]:
+        accepted = accepted_encodings(header)
+        wildcard = accepted.get("*", 0.0)
+        candidates = [("br", accepted.get("br", wildcard))] if brotli is not None else []
+        candidates.append(("gzip", accepted.get("gzip", wildcard)))
+        encoding, quality = max(candidates, key=lambda item: item[1])
+        return encoding if quality > 0 else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+            or len(response.content) < self.min_size
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = self.choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        with phase("compress"):
+            if encoding == "br":
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and not etag.startswith("W/") and etag.endswith('"') and not etag.endswith(tuple(s + '"' for s in ENCODING_SUFFIXES)):
+            response["ETag"] = f'{etag[:-1]}-{encoding}"'
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    # WhiteNoise con soporte asíncrono: bajo ASGI un middleware solo sincrónico obliga a
+    # Django a pasar cada pedido por un hilo y anula las vistas asíncronas
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0002_measurement'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['-created_at', '-id'], name='measurement_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['plot', '-created_at', '-id'], name='measurement_plot_created_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0003_measurement_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='ab_per_ha_m2',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='biomass_above_tn_per_ha',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='biomass_root_tn_per_ha',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='biomass_total_tn_per_ha',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='c_bosque_tn_per_ha',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='dap_mean_cm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='height_mean_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='trees_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='trees_per_ha',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='vol_merchantable15_cc_per_ha_m3',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='vol_merchantable15_sc_per_ha_m3',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='vol_total_cc_per_ha_m3',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='vol_total_sc_per_ha_m3',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def renumber_duplicate_trees(apps, schema_editor):
+    # Antes de la restricción única: los árboles repetidos (plot, number) de una parcela
+    # reciben números nuevos a continuación del máximo existente.
+    Tree = apps.get_model('ciefap', 'Tree')
+    duplicated = (
+        Tree.objects.values('plot_id', 'number')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .values_list('plot_id', flat=True)
+        .distinct()
+    )
+    for plot_id in list(duplicated):
+        trees = Tree.objects.filter(plot_id=plot_id)
+        next_number = (trees.aggregate(m=Max('number'))['m'] or 0) + 1
+        seen = set()
+        for tree in trees.order_by('number', 'id'):
+            if tree.number in seen:
+                tree.number = next_number
+                next_number += 1
+                tree.save(update_fields=['number'])
+            seen.add(tree.number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0004_measurement_summary_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicate_trees, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tree',
+            constraint=models.UniqueConstraint(fields=('plot', 'number'), name='tree_plot_number_uniq'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0005_tree_plot_number_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlotAccumulator',
+            fields=[
+                ('plot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='accumulator', serialize=False, to='ciefap.plot')),
+                ('trees_count', models.PositiveIntegerField(default=0)),
+                ('dap_sum', models.FloatField(default=0)),
+                ('height_sum', models.FloatField(default=0)),
+                ('dap2_sum', models.FloatField(default=0)),
+                ('ab_sum', models.FloatField(default=0)),
+                ('vol_total_cc_sum', models.FloatField(default=0)),
+                ('vol_total_sc_sum', models.FloatField(default=0)),
+                ('vol_merchantable15_cc_sum', models.FloatField(default=0)),
+                ('vol_merchantable15_sc_sum', models.FloatField(default=0)),
+                ('biomass_above_sum', models.FloatField(default=0)),
+                ('stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
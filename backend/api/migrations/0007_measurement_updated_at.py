@@ -0,0 +1,25 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    # Las mediciones existentes se consideran sin modificar desde su creación
+    Measurement = apps.get_model('ciefap', 'Measurement')
+    Measurement.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0006_plot_accumulator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.analytics import bump_version
+from api.payloads import decode_payload, encode_payload, intern_payloads, payload_settings
+
+BATCH_SIZE = 500
+
+
+def compact_payloads(apps, schema_editor):
+    # input_data / metrics de cada medición -> blob deduplicado (y comprimido si es grande)
+    Measurement = apps.get_model('ciefap', 'Measurement')
+    PayloadBlob = apps.get_model('ciefap', 'PayloadBlob')
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s WHERE {} = %s'.format(
+        qn(Measurement._meta.db_table), qn('input_blob_id'), qn('metrics_blob_id'), qn(Measurement._meta.pk.column),
+    )
+    options = payload_settings()
+    last = 0
+    while True:
+        rows = list(Measurement.objects.filter(pk__gt=last).order_by('pk').values_list('pk', 'input_data', 'metrics')[:BATCH_SIZE])
+        if not rows:
+            break
+        ids = intern_payloads(PayloadBlob, [encode_payload(value, options) for _, input_data, metrics in rows for value in (input_data, metrics)])
+        params = [(ids[2 * index], ids[2 * index + 1], pk) for index, (pk, _, _) in enumerate(rows)]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        last = rows[-1][0]
+    bump_version()
+
+
+def expand_payloads(apps, schema_editor):
+    Measurement = apps.get_model('ciefap', 'Measurement')
+    rows = Measurement.objects.order_by('pk').values_list(
+        'pk', 'input_blob__encoding', 'input_blob__data', 'metrics_blob__encoding', 'metrics_blob__data',
+    )
+    for pk, input_encoding, input_raw, metrics_encoding, metrics_raw in rows.iterator(chunk_size=BATCH_SIZE):
+        Measurement.objects.filter(pk=pk).update(
+            input_data=decode_payload(input_encoding, input_raw),
+            metrics=decode_payload(metrics_encoding, metrics_raw),
+        )
+    bump_version()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ciefap', '0008_calcjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayloadBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 del JSON canónico', max_length=64, unique=True)),
+                ('encoding', models.CharField(choices=[('json', 'JSON'), ('zlib1', 'JSON comprimido (zlib con diccionario v1)')], max_length=8)),
+                ('size', models.PositiveIntegerField(help_text='Bytes del JSON sin comprimir')),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='input_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ciefap.payloadblob'),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='metrics_blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ciefap.payloadblob'),
+        ),
+        # Nulables durante la conversión para que la migración se pueda revertir
+        migrations.AlterField(
+            model_name='measurement',
+            name='input_data',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='metrics',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(compact_payloads, expand_payloads),
+        migrations.RemoveField(
+            model_name='measurement',
+            name='input_data',
+        ),
+        migrations.RemoveField(
+            model_name='measurement',
+            name='metrics',
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='input_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ciefap.payloadblob'),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='metrics_blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ciefap.payloadblob'),
+        ),
+    ]
@@ -1,4 +1,10 @@
-from django.db import models
+import math
+import uuid
+
+from django.db import models, transaction
+
+from .calculations import carbon_forest_tn_per_ha
+from .payloads import ENCODING_JSON, ENCODING_ZLIB, decode_payload, store_values
 
 
 class Producer(models.Model):
@@ -19,6 +25,13 @@ class Species(models.Model):
         return self.name
 
 
+class SpeciesVersion(models.Model):
+    # Fila única: se incrementa al guardar o borrar una Species, en la misma transacción.
+    # Todos los procesos (workers, run_calc_jobs, comandos) la comparan con la versión del
+    # registro que tienen en memoria.
+    version = models.PositiveBigIntegerField(default=0)
+
+
 class SiteClass(models.TextChoices):
     I = 'I', 'I'
     II = 'II', 'II'
@@ -46,17 +59,285 @@ class Tree(models.Model):
     dap_cm = models.FloatField()
     height_m = models.FloatField()
 
+    class Meta:
+        constraints = [
+            # Clave natural para la carga masiva idempotente (upsert por parcela + número)
+            models.UniqueConstraint(fields=['plot', 'number'], name='tree_plot_number_uniq'),
+        ]
+
     def __str__(self):
         return f"Árbol {self.number} (DAP {self.dap_cm} cm)"
 
 
+class PlotAccumulator(models.Model):
+    # Estadísticos suficientes de aggregate_plot_metrics por parcela, actualizados en O(1)
+    # con cada alta/cambio/baja de Tree. 'stale' fuerza un recálculo completo en la próxima
+    # lectura (p. ej. tras una carga masiva, que no dispara señales).
+    plot = models.OneToOneField(Plot, on_delete=models.CASCADE, primary_key=True, related_name='accumulator')
+    trees_count = models.PositiveIntegerField(default=0)
+    dap_sum = models.FloatField(default=0)
+    height_sum = models.FloatField(default=0)
+    dap2_sum = models.FloatField(default=0)
+    ab_sum = models.FloatField(default=0)
+    vol_total_cc_sum = models.FloatField(default=0)
+    vol_total_sc_sum = models.FloatField(default=0)
+    vol_merchantable15_cc_sum = models.FloatField(default=0)
+    vol_merchantable15_sc_sum = models.FloatField(default=0)
+    biomass_above_sum = models.FloatField(default=0)
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Acumulador parcela #{self.plot_id} ({self.trees_count} árboles)"
+
+
+# Agregados de aggregate_plot_metrics materializados como columnas de Measurement
+SUMMARY_FIELDS = (
+    'trees_count',
+    'dap_mean_cm',
+    'height_mean_m',
+    'trees_per_ha',
+    'ab_per_ha_m2',
+    'vol_total_cc_per_ha_m3',
+    'vol_total_sc_per_ha_m3',
+    'vol_merchantable15_cc_per_ha_m3',
+    'vol_merchantable15_sc_per_ha_m3',
+    'biomass_above_tn_per_ha',
+    'biomass_root_tn_per_ha',
+    'biomass_total_tn_per_ha',
+    'c_bosque_tn_per_ha',
+)
+
+
+def summary_from_metrics(metrics):
+    # Acepta tanto los agregados sueltos como la respuesta completa de /api/calc/metrics
+    # ({"aggregates": {...}, "carbon": {...}}). Valores ausentes, no numéricos, no finitos o
+    # negativos (todas las columnas son conteos, medias o existencias) -> None.
+    metrics = metrics if isinstance(metrics, dict) else {}
+    sources = [metrics.get('aggregates'), metrics.get('carbon'), metrics]
+    summary = {}
+    for name in SUMMARY_FIELDS:
+        value = None
+        for source in sources:
+            if isinstance(source, dict) and source.get(name) is not None:
+                value = source[name]
+                break
+        try:
+            value = float(value) if value is not None else None
+        except (TypeError, ValueError):
+            value = None
+        summary[name] = value if value is not None and math.isfinite(value) and value >= 0 else None
+    if summary['trees_count'] is not None:
+        # PositiveIntegerField: entero de 32 bits en todos los motores
+        trees_count = int(summary['trees_count'])
+        summary['trees_count'] = trees_count if trees_count <= 2147483647 else None
+    if summary['c_bosque_tn_per_ha'] is None and summary['biomass_total_tn_per_ha'] is not None:
+        summary['c_bosque_tn_per_ha'] = round(carbon_forest_tn_per_ha(summary['biomass_total_tn_per_ha']), 2)
+    return summary
+
+
+class PayloadEncoding(models.TextChoices):
+    JSON = ENCODING_JSON, 'JSON'
+    ZLIB = ENCODING_ZLIB, 'JSON comprimido (zlib con diccionario v1)'
+
+
+class PayloadBlob(models.Model):
+    # Contenido JSON de mediciones (input_data / metrics), guardado una vez por hash (ver api/payloads.py)
+    digest = models.CharField(max_length=64, unique=True, help_text="SHA-256 del JSON canónico")
+    encoding = models.CharField(max_length=8, choices=PayloadEncoding.choices)
+    size = models.PositiveIntegerField(help_text="Bytes del JSON sin comprimir")
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def value(self):
+        return decode_payload(self.encoding, self.data)
+
+    def __str__(self):
+        return f"Blob {self.digest[:12]} ({self.size} bytes, {self.encoding})"
+
+
+# Columnas de PayloadBlob que no hacen falta para leer el contenido
+BLOB_METADATA = tuple(f'{relation}__{name}' for relation in ('input_blob', 'metrics_blob') for name in ('digest', 'size', 'created_at'))
+
+
+class MeasurementManager(models.Manager):
+    # Los blobs se leen con la medición (como antes las columnas JSON): acceder a input_data
+    # o metrics no hace otra consulta, tampoco desde el ORM asíncrono.
+    # Para no leerlos: .select_related(None)
+    def get_queryset(self):
+        return super().get_queryset().select_related('input_blob', 'metrics_blob').defer(*BLOB_METADATA)
+
+    # bulk_create/bulk_update no pasan por save(): los contenidos se guardan acá
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic():
+            store_payloads(objs)
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        names = [name for name in fields if name in Measurement.PAYLOAD_FIELDS]
+        fields = [Measurement.PAYLOAD_FIELDS.get(name, name) for name in fields]
+        with transaction.atomic():
+            if names:
+                store_payloads(objs, names)
+            return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Measurement(models.Model):
+    # Atributo JSON -> relación con su blob. input_data y metrics se leen y asignan como
+    # antes (también en Measurement(...) y objects.create(...)); save() los guarda en PayloadBlob.
+    PAYLOAD_FIELDS = {'input_data': 'input_blob', 'metrics': 'metrics_blob'}
+
     plot = models.ForeignKey(Plot, on_delete=models.SET_NULL, null=True, blank=True, related_name='measurements')
     # Datos que llegan del frontend: árboles, distancias, área, edad, site index/altura dominante, etc.
-    input_data = models.JSONField()
+    input_blob = models.ForeignKey(PayloadBlob, on_delete=models.PROTECT, related_name='+')
     # Métricas calculadas (por árbol y agregadas por ha) que el frontend ya calculó o que el backend recalcula.
-    metrics = models.JSONField()
+    metrics_blob = models.ForeignKey(PayloadBlob, on_delete=models.PROTECT, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Última modificación: Last-Modified/ETag de /api/records (las mediciones se pueden editar)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Resumen tipado de 'metrics' (se completa en save(); ver backfill_measurement_summary)
+    trees_count = models.PositiveIntegerField(null=True, blank=True)
+    dap_mean_cm = models.FloatField(null=True, blank=True)
+    height_mean_m = models.FloatField(null=True, blank=True)
+    trees_per_ha = models.FloatField(null=True, blank=True)
+    ab_per_ha_m2 = models.FloatField(null=True, blank=True, db_index=True)
+    vol_total_cc_per_ha_m3 = models.FloatField(null=True, blank=True, db_index=True)
+    vol_total_sc_per_ha_m3 = models.FloatField(null=True, blank=True)
+    vol_merchantable15_cc_per_ha_m3 = models.FloatField(null=True, blank=True)
+    vol_merchantable15_sc_per_ha_m3 = models.FloatField(null=True, blank=True)
+    biomass_above_tn_per_ha = models.FloatField(null=True, blank=True)
+    biomass_root_tn_per_ha = models.FloatField(null=True, blank=True)
+    biomass_total_tn_per_ha = models.FloatField(null=True, blank=True, db_index=True)
+    c_bosque_tn_per_ha = models.FloatField(null=True, blank=True, db_index=True)
+
+    objects = MeasurementManager()
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor (created_at, id) y filtros por parcela / rango de fechas
+            models.Index(fields=['-created_at', '-id'], name='measurement_created_idx'),
+            models.Index(fields=['plot', '-created_at', '-id'], name='measurement_plot_created_idx'),
+        ]
+
+    def _get_payload(self, name):
+        # Se decodifica una vez por instancia (en el primer acceso)
+        payloads = self.__dict__.setdefault('_payloads', {})
+        if name not in payloads:
+            relation = self.PAYLOAD_FIELDS[name]
+            blob_id = getattr(self, f'{relation}_id')
+            payloads[name] = getattr(self, relation).value() if blob_id is not None else None
+        return payloads[name]
+
+    def _set_payload(self, name, value):
+        self.__dict__.setdefault('_payloads', {})[name] = value
+
+    @property
+    def input_data(self):
+        return self._get_payload('input_data')
+
+    @input_data.setter
+    def input_data(self, value):
+        self._set_payload('input_data', value)
+
+    @property
+    def metrics(self):
+        return self._get_payload('metrics')
+
+    @metrics.setter
+    def metrics(self, value):
+        self._set_payload('metrics', value)
+
+    def store_payloads(self):
+        # Guarda en PayloadBlob los JSON asignados o leídos (pueden haberse modificado en el
+        # lugar); si el contenido no cambió, el hash lleva al mismo blob
+        store_payloads([self])
+
+    def refresh_summary(self):
+        for name, value in summary_from_metrics(self.metrics).items():
+            setattr(self, name, value)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_payloads', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.refresh_summary()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'updated_at'}
+            if 'metrics' in update_fields:
+                update_fields |= set(SUMMARY_FIELDS)
+            update_fields = {self.PAYLOAD_FIELDS.get(name, name) for name in update_fields}
+            kwargs['update_fields'] = update_fields
+        # Blobs y fila en la misma transacción (los blobs quedan bloqueados hasta guardarla)
+        with transaction.atomic():
+            self.store_payloads()
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Measurement #{self.pk} - {self.created_at:%Y-%m-%d %H:%M}"
+
+
+def store_payloads(measurements, names=None):
+    # Versión en bloque de Measurement.store_payloads(): un INSERT/SELECT para todos los
+    # contenidos del lote (lo usa también el recálculo masivo de métricas)
+    names = names or tuple(Measurement.PAYLOAD_FIELDS)
+    targets = [
+        (measurement, Measurement.PAYLOAD_FIELDS[name], measurement._payloads[name])
+        for measurement in measurements
+        for name in names
+        if name in measurement.__dict__.get('_payloads', {})
+    ]
+    if not targets:
+        return
+    ids = store_values(PayloadBlob, [value for _, _, value in targets])
+    for (measurement, relation, _), blob_id in zip(targets, ids):
+        if getattr(measurement, f'{relation}_id') != blob_id:
+            setattr(measurement, f'{relation}_id', blob_id)
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = 'queued', 'En cola'
+    RUNNING = 'running', 'En ejecución'
+    SUCCEEDED = 'succeeded', 'Terminado'
+    FAILED = 'failed', 'Con error'
+    CANCELLED = 'cancelled', 'Cancelado'
+
+
+class JobKind(models.TextChoices):
+    # Mismo cuerpo y resultado que /api/calc/metrics y /api/calc/metrics/batch
+    METRICS = 'metrics', 'Métricas de parcela'
+    BATCH = 'batch', 'Lote de parcelas'
+
+
+class CalcJob(models.Model):
+    # Cola de cálculos en segundo plano (ver api/jobs.py y el comando run_calc_jobs)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=16, choices=JobKind.choices)
+    status = models.CharField(max_length=16, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    payload = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Avance en parcelas calculadas
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    # Proceso que lo ejecuta y último latido (un trabajo sin latido se vuelve a encolar)
+    worker = models.CharField(max_length=120, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Después de esta fecha el resultado ya no se entrega y el runner borra el trabajo
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='calcjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.kind}, {self.status})"
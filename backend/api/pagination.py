@@ -0,0 +1,89 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Paginación por cursor sobre (created_at, id) descendente: cada página es un rango
+    # del índice, sin OFFSET, así que el costo no crece con la profundidad.
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, created_at, pk):
+        raw = f'{created_at.isoformat()}|{pk}'.encode('ascii')
+        return urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+            position = parse_datetime(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def page_queryset(self, queryset, request):
+        # Filas de la página pedida más una extra para saber si hay página siguiente sin
+        # hacer COUNT(*) (también la usa el GET condicional para leer solo id/updated_at)
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        queryset = queryset.order_by('-created_at', '-id')
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        return queryset[:page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return self.split_page(list(self.page_queryset(queryset, request)), request)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Versión para vistas asíncronas (iteración asíncrona del ORM)
+        self.request = request
+        return self.split_page([row async for row in self.page_queryset(queryset, request)], request)
+
+    def split_page(self, rows, request):
+        page_size = self.get_page_size(request)
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = (rows[-1].created_at, rows[-1].pk) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
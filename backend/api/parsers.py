@@ -0,0 +1,36 @@
+import io
+
+from rest_framework.parsers import JSONParser, get_encoding
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el JSONParser de DRF
+    orjson = None
+
+
+# Parser JSON rápido (orjson) con el mismo resultado que el JSONParser de DRF: orjson
+# también rechaza NaN/Infinity y convierte los números con redondeo correcto. Los
+# enteros de 19 dígitos o más los lee como float, así que en ese caso (o con cualquier
+# error, para conservar los mensajes de DRF) se usa json.load. Las corridas de dígitos se
+# buscan pasando todos los dígitos a '0' con bytes.translate y buscando 19 ceros.
+
+_DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+_LONG_DIGITS = b"0" * 19
+_UTF8 = ("utf-8", "utf8")
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        if get_encoding(parser_context).lower() not in _UTF8:
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if _LONG_DIGITS not in body.translate(_DIGITS_TO_ZERO):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
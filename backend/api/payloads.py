@@ -0,0 +1,125 @@
+import hashlib
+import json
+import zlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence
+
+from django.conf import settings
+from django.db import transaction
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se decodifica con json
+    orjson = None
+
+
+# Almacenamiento de input_data / metrics de Measurement en PayloadBlob: cada contenido JSON
+# se guarda una sola vez, identificado por el SHA-256 de su forma canónica (claves
+# ordenadas, sin espacios), y comprimido con zlib. Reenviar la misma parcela o el mismo
+# resultado reutiliza el blob existente. El JSON guardado conserva el orden de claves del
+# primero que lo envió; el hash no depende de ese orden.
+
+ENCODING_JSON = "json"
+# zlib con el diccionario ZLIB_DICTIONARY_V1
+ENCODING_ZLIB = "zlib1"
+
+# Diccionario inicial de zlib: las claves que se repiten en todas las mediciones (árboles,
+# datos de parcela y respuesta de /api/calc/metrics). Con él un JSON de pocos cientos de
+# bytes se comprime ~5 veces en lugar de ~2. NO MODIFICAR: los blobs 'zlib1' guardados
+# solo se pueden leer con estos mismos bytes (otro diccionario = otra codificación).
+ZLIB_DICTIONARY_V1 = (
+    b'"site":{"dominant_height_from_site_index_m":,"site_index_from_dominant_height_m":null,'
+    b'"plot":{"recommended_area_m2_for_min_trees":,"recommended_radius_m":,"provided_area_m2":,'
+    b'"radius_from_provided_area_m":,"min_trees_for_plot":20},"carbon":{"c_bosque_tn_per_ha":,'
+    b'"capture_kg_per_day_per_ha":,"animal_emission_kg_day":5.0,"animals_per_ha_equilibrium":},'
+    b'"species":,"species_root_ratio":,"stand_area_ha":,"plot_area_m2":,'
+    b'"site_index_m":,"dominant_height_m":,"age_years":,"number":,'
+    b'"distance_in_row_m":,"distance_between_rows_m":5.0,'
+    b'"aggregates":{"trees_count":,"dap_mean_cm":,"height_mean_m":,"dap2_mean":,'
+    b'"ab_per_tree_m2":,"ab_per_ha_m2":,"vol_total_cc_per_ha_m3":,"vol_total_sc_per_ha_m3":,'
+    b'"vol_merchantable15_cc_per_ha_m3":,"vol_merchantable15_sc_per_ha_m3":,'
+    b'"biomass_above_tn_per_ha":,"biomass_root_tn_per_ha":,"biomass_total_tn_per_ha":,'
+    b'"trees_per_ha":,"trees_per_ha_by_spacing":,"trees_per_ha_by_plot":null},'
+    b'"per_tree":[{"dap_cm":,"height_m":,"ab_m2":0.0,"vol_total_cc_m3":0.,"vol_total_sc_m3":0.,'
+    b'"vol_maderable15_cc_m3":0.,"vol_maderable15_sc_m3":0.,"biomass_above_kg":,'
+    b'"biomass_root_kg":,"biomass_total_kg":},'
+    b'{"trees":[{"dap_cm":,"height_m":},{"dap_cm":,"height_m":},{"dap_cm":'
+)
+
+PAYLOAD_DEFAULTS = {
+    # JSON más chicos se guardan sin comprimir (el encabezado de zlib no compensa)
+    "COMPRESS_MIN_SIZE": 64,
+    "COMPRESS_LEVEL": 6,
+}
+
+
+class EncodedPayload(NamedTuple):
+    digest: str
+    encoding: str
+    size: int
+    data: bytes
+
+
+def payload_settings() -> Dict[str, Any]:
+    return {**PAYLOAD_DEFAULTS, **getattr(settings, "CIEFAP_PAYLOADS", {})}
+
+
+def payload_digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def encode_payload(value: Any, options: Dict[str, Any] = None) -> EncodedPayload:
+    options = options or payload_settings()
+    raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    encoding, data = ENCODING_JSON, raw
+    if len(raw) >= options["COMPRESS_MIN_SIZE"]:
+        compressor = zlib.compressobj(options["COMPRESS_LEVEL"], zdict=ZLIB_DICTIONARY_V1)
+        compressed = compressor.compress(raw) + compressor.flush()
+        if len(compressed) < len(raw):
+            encoding, data = ENCODING_ZLIB, compressed
+    return EncodedPayload(payload_digest(value), encoding, len(raw), data)
+
+
+def decode_payload(encoding: str, data: Any) -> Any:
+    # BinaryField devuelve memoryview en algunos backends
+    data = bytes(data)
+    if encoding == ENCODING_ZLIB:
+        decompressor = zlib.decompressobj(zdict=ZLIB_DICTIONARY_V1)
+        data = decompressor.decompress(data) + decompressor.flush()
+    elif encoding != ENCODING_JSON:
+        raise ValueError(f"Codificación de blob desconocida: {encoding}")
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Enteros de más de 64 bits, NaN/Infinity: mismo resultado que antes con json
+            pass
+    return json.loads(data)
+
+
+def intern_payloads(blob_model, payloads: Sequence[EncodedPayload]) -> List[int]:
+    # Id del blob de cada contenido, creando los que faltan. Recibe el modelo para que lo
+    # pueda usar la migración (modelo histórico). Los blobs quedan bloqueados (FOR UPDATE,
+    # solo por pk: sin bloqueos de rango sobre el índice de digest) hasta el final de la
+    # transacción de quien llama, así prune_payload_blobs no borra uno que se está por
+    # referenciar. Dos escrituras simultáneas del mismo contenido nuevo: la segunda
+    # inserción se ignora y la relectura ve la primera.
+    by_digest = {payload.digest: payload for payload in payloads}
+    found = dict(blob_model.objects.filter(digest__in=list(by_digest)).values_list("digest", "pk"))
+    with transaction.atomic():
+        locked = set(blob_model.objects.select_for_update().filter(pk__in=list(found.values())).values_list("pk", flat=True)) if found else set()
+        ids = {digest: pk for digest, pk in found.items() if pk in locked}
+        missing = [payload for digest, payload in by_digest.items() if digest not in ids]
+        if missing:
+            blob_model.objects.bulk_create(
+                [blob_model(digest=p.digest, encoding=p.encoding, size=p.size, data=p.data) for p in missing],
+                ignore_conflicts=True,
+            )
+            created = blob_model.objects.select_for_update().filter(digest__in=[p.digest for p in missing])
+            ids.update(created.values_list("digest", "pk"))
+    return [ids[payload.digest] for payload in payloads]
+
+
+def store_values(blob_model, values: Iterable[Any]) -> List[int]:
+    options = payload_settings()
+    return intern_payloads(blob_model, [encode_payload(value, options) for value in values])
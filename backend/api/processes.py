@@ -0,0 +1,11 @@
+import signal
+
+import django
+
+
+def init_django_worker() -> None:
+    # Inicializador de los procesos hijos (spawn) que usan el ORM. Este módulo no importa
+    # modelos: se carga en el hijo antes de django.setup(). Ctrl+C llega a todo el grupo de
+    # procesos; lo atiende solo el principal, que cancela lo pendiente y deja el checkpoint.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
@@ -0,0 +1,256 @@
+import copy
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .calculations import (
+    SITE_CURVE_BASE_TERM,
+    SITE_CURVE_EXPONENT,
+    SITE_CURVE_RATE,
+    carbon_forest_tn_per_ha,
+    site_curve_term,
+)
+from .engine import Allometry, stand_density, trees_to_arrays
+from .services import plot_allometry, plot_parameters
+
+
+# Proyección de crecimiento sobre la curva de sitio. Supuesto del modelo: la estructura
+# medida del rodal (DAP y altura de cada árbol) escala con la altura dominante de la
+# curva, r(edad) = Hd(SI, edad) / Hd_ref, y la densidad (árboles/ha) se mantiene.
+# Con ese supuesto los términos lineales y de potencia tienen forma cerrada en r:
+#   Σ AB ∝ r², Σ volumen = n·a + b·r³·Σ(DAP/100)²·H, Σ biomasa = n·c + a·r^(b+h)·Σ DAP^b·H^h
+# y solo el volumen maderable s/c (no lineal por árbol) se evalúa sobre edades × árboles.
+# Los coeficientes son los de la especie de la parcela (species.registry); una sola especie
+# por parcela, para que las sumas en forma cerrada sigan valiendo.
+
+# Máximo de celdas edades × árboles evaluadas a la vez para el volumen maderable s/c
+MAX_BLOCK_CELLS = 1_000_000
+
+TRAJECTORY_DECIMALS = {
+    "dominant_height_m": 2,
+    "scale": 4,
+    "ab_per_ha_m2": 2,
+    "vol_total_cc_per_ha_m3": 2,
+    "vol_total_sc_per_ha_m3": 2,
+    "vol_merchantable15_cc_per_ha_m3": 2,
+    "vol_merchantable15_sc_per_ha_m3": 2,
+    "biomass_above_tn_per_ha": 2,
+    "biomass_root_tn_per_ha": 2,
+    "biomass_total_tn_per_ha": 2,
+    "c_bosque_tn_per_ha": 2,
+    "capture_kg_per_day_per_ha": 3,
+    "animals_per_ha_equilibrium": 2,
+}
+
+
+def site_curve_terms(ages: np.ndarray) -> np.ndarray:
+    # Versión vectorizada de calculations.site_curve_term
+    return (1.0 - np.exp(-SITE_CURVE_RATE * np.asarray(ages, dtype=np.float64))) ** SITE_CURVE_EXPONENT
+
+
+def age_grid(start: float = 1.0, stop: float = 40.0, step: float = 1.0, max_points: int = None) -> np.ndarray:
+    if not all(math.isfinite(value) for value in (start, stop, step)):
+        raise ValueError("La grilla de edades requiere start, stop y step finitos.")
+    if step <= 0 or stop < start:
+        raise ValueError("La grilla de edades requiere start <= stop y step > 0.")
+    # Cantidad de puntos antes de construir el array: una grilla enorme no llega a reservarse
+    count = math.floor((stop - start) / step + 0.5) + 1
+    if max_points is not None and count > max_points:
+        raise ValueError(f"La proyección admite como máximo {max_points} edades.")
+    return np.round(start + step * np.arange(count, dtype=np.float64), 6)
+
+
+class ProjectionPlot:
+    # Estadísticos de una parcela necesarios para proyectarla (se calculan una vez)
+
+    def __init__(self, data: Mapping[str, Any], allometries: Optional[Mapping[str, Allometry]] = None):
+        trees = data.get("trees", [])
+        if not isinstance(trees, list) or len(trees) == 0:
+            raise ValueError("Debe proporcionar una lista 'trees' con dap_cm y height_m.")
+        self.dap, self.height = trees_to_arrays(trees)
+        self.n = int(self.dap.shape[0])
+        params = plot_parameters(data)
+        allometry, root_ratio = plot_allometry(data, trees, allometries)
+        if np.ndim(allometry.vol_total_cc_a) != 0:
+            raise ValueError("La proyección admite una sola especie por parcela ('species' de la parcela, no por árbol).")
+        self.allometry = allometry
+        self.age_years = params["age_years"]
+        self.root_ratio = float(allometry.root_ratio if root_ratio is None else root_ratio)
+        self.animal_emission_kg_day = params["animal_emission_kg_day"]
+        # Misma densidad que aggregate_plot_metrics: la del área de la parcela, o la del marco
+        self.tph, _, _ = stand_density(self.n, params["dist_in_row_m"], params["dist_between_rows_m"], params["plot_area_m2"])
+        if self.tph <= 0:
+            raise ValueError("Indique 'plot_area_m2' o el marco de plantación para obtener árboles/ha.")
+
+        site_index_m = params["site_index_m"]
+        dominant_height_m = params["dominant_height_m"]
+        if self.age_years <= 0:
+            raise ValueError("La proyección requiere 'age_years' > 0 (edad de la medición).")
+        if site_index_m is None and dominant_height_m is None:
+            raise ValueError("La proyección requiere 'site_index_m' o 'dominant_height_m'.")
+        if site_index_m is not None and float(site_index_m) <= 0:
+            raise ValueError("'site_index_m' debe ser mayor que 0.")
+        current_term = site_curve_term(self.age_years)
+        if site_index_m is not None:
+            self.site_index_m = float(site_index_m)
+        else:
+            self.site_index_m = float(dominant_height_m) * SITE_CURVE_BASE_TERM / current_term
+        # Altura dominante de referencia: la medida, o la de la curva a la edad actual
+        self.reference_height_m = (
+            float(dominant_height_m) if dominant_height_m is not None
+            else self.site_index_m * current_term / SITE_CURVE_BASE_TERM
+        )
+        if self.reference_height_m <= 0:
+            raise ValueError("La altura dominante de referencia debe ser mayor que 0.")
+
+        dap_m2_h = (self.dap / 100.0) ** 2 * self.height
+        self.dap2_sum_m = float(((self.dap / 100.0) ** 2).sum())
+        self.dap2_h_sum = float(dap_m2_h.sum())
+        self.biomass_power_sum = float(
+            (np.power(self.dap, allometry.biomass_above_b) * np.power(self.height, allometry.biomass_above_h)).sum()
+        )
+        self.dap2_h = dap_m2_h
+
+    def with_site_index(self, site_index_m: float) -> "ProjectionPlot":
+        # Misma estructura medida proyectada sobre otra curva de sitio (comparte los arrays)
+        clone = copy.copy(self)
+        clone.site_index_m = float(site_index_m)
+        return clone
+
+
+def _merchantable15_sc_sums(plot: ProjectionPlot, scale: np.ndarray) -> np.ndarray:
+    # Σ por edad de vm15_cc · (vt_sc / vt_cc), por bloques de árboles para acotar memoria
+    a = plot.allometry
+    r3 = scale[:, None] ** 3
+    block = max(1, MAX_BLOCK_CELLS // max(1, scale.shape[0]))
+    total = np.zeros(scale.shape[0])
+    for start in range(0, plot.n, block):
+        x = r3 * plot.dap2_h[None, start:start + block]
+        vt_cc = a.vol_total_cc_a + a.vol_total_cc_b * x
+        vt_sc = a.vol_total_sc_a + a.vol_total_sc_b * x
+        positive = vt_cc > 0
+        ratio = np.where(positive, vt_sc / np.where(positive, vt_cc, 1.0), 0.93)
+        total += ((a.vol_merchantable15_cc_a + a.vol_merchantable15_cc_b * x) * ratio).sum(axis=1)
+    return total
+
+
+def trajectory_arrays(plots: Sequence[ProjectionPlot], ages: np.ndarray) -> Dict[str, np.ndarray]:
+    # Matrices parcelas × edades sin redondear
+    ages = np.asarray(ages, dtype=np.float64)
+    terms = site_curve_terms(ages)  # común a todas las parcelas
+
+    # Matrices parcelas × edades
+    site_index = np.array([p.site_index_m for p in plots])[:, None]
+    reference = np.array([p.reference_height_m for p in plots])[:, None]
+    n = np.array([p.n for p in plots], dtype=np.float64)[:, None]
+    tph = np.array([p.tph for p in plots])[:, None]
+    root_ratio = np.array([p.root_ratio for p in plots])[:, None]
+    emission = np.array([p.animal_emission_kg_day for p in plots])[:, None]
+    # Coeficientes por parcela (campo de Allometry -> columna parcelas × 1)
+    coef = {
+        name: np.array([getattr(p.allometry, name) for p in plots], dtype=np.float64)[:, None]
+        for name in Allometry._fields
+    }
+
+    dominant = site_index * terms[None, :] / SITE_CURVE_BASE_TERM
+    scale = dominant / reference
+    per_ha = tph / n
+
+    dap2_sum = np.array([p.dap2_sum_m for p in plots])[:, None]
+    dap2_h_sum = np.array([p.dap2_h_sum for p in plots])[:, None]
+    biomass_power = np.array([p.biomass_power_sum for p in plots])[:, None]
+    r3 = scale ** 3
+
+    ab = np.pi / 4.0 * dap2_sum * scale ** 2
+    vt_cc = coef["vol_total_cc_a"] * n + coef["vol_total_cc_b"] * r3 * dap2_h_sum
+    vt_sc = coef["vol_total_sc_a"] * n + coef["vol_total_sc_b"] * r3 * dap2_h_sum
+    vm15_cc = coef["vol_merchantable15_cc_a"] * n + coef["vol_merchantable15_cc_b"] * r3 * dap2_h_sum
+    vm15_sc = np.vstack([_merchantable15_sc_sums(p, scale[i]) for i, p in enumerate(plots)])
+    b_above = coef["biomass_above_c"] * n + coef["biomass_above_a"] * scale ** (
+        coef["biomass_above_b"] + coef["biomass_above_h"]
+    ) * biomass_power
+    b_root = b_above * root_ratio
+
+    biomass_total_tn = (b_above + b_root) * per_ha / 1000.0
+    carbon = carbon_forest_tn_per_ha(biomass_total_tn)
+    days = ages[None, :] * 365.0
+    capture = np.where(days > 0, carbon / np.where(days > 0, days, 1.0) * 1000.0, 0.0)
+    animals = np.where(emission > 0, capture / np.where(emission > 0, emission, 1.0), 0.0)
+
+    return {
+        "dominant_height_m": dominant,
+        "scale": scale,
+        "ab_per_ha_m2": ab * per_ha,
+        "vol_total_cc_per_ha_m3": vt_cc * per_ha,
+        "vol_total_sc_per_ha_m3": vt_sc * per_ha,
+        "vol_merchantable15_cc_per_ha_m3": vm15_cc * per_ha,
+        "vol_merchantable15_sc_per_ha_m3": vm15_sc * per_ha,
+        "biomass_above_tn_per_ha": b_above * per_ha / 1000.0,
+        "biomass_root_tn_per_ha": b_root * per_ha / 1000.0,
+        "biomass_total_tn_per_ha": biomass_total_tn,
+        "c_bosque_tn_per_ha": carbon,
+        "capture_kg_per_day_per_ha": capture,
+        "animals_per_ha_equilibrium": animals,
+    }
+
+
+def project_plots(plots: Sequence[ProjectionPlot], ages: np.ndarray) -> List[Dict[str, List[float]]]:
+    series = trajectory_arrays(plots, ages)
+    return [
+        {name: np.round(values[i], TRAJECTORY_DECIMALS[name]).tolist() for name, values in series.items()}
+        for i in range(len(plots))
+    ]
+
+
+def ages_from_payload(
+    data: Mapping[str, Any],
+    max_points: int = 500,
+    default_grid: Tuple[float, float, float] = (1.0, 40.0, 1.0),
+) -> np.ndarray:
+    # 'ages': lista explícita, o grilla {"start", "stop", "step"} (por defecto 1..40 años)
+    ages = data.get("ages")
+    start, stop, step = default_grid
+    if isinstance(ages, dict):
+        grid = age_grid(
+            float(ages.get("start", start)), float(ages.get("stop", stop)), float(ages.get("step", step)), max_points,
+        )
+    elif ages is None:
+        grid = age_grid(start, stop, step, max_points)
+    elif isinstance(ages, list) and ages:
+        if len(ages) > max_points:
+            raise ValueError(f"La proyección admite como máximo {max_points} edades.")
+        grid = np.asarray([float(age) for age in ages], dtype=np.float64)
+    else:
+        raise ValueError("'ages' debe ser una lista de edades o una grilla {start, stop, step}.")
+    if not np.all(np.isfinite(grid)):
+        raise ValueError("Las edades deben ser números finitos.")
+    if np.any(grid <= 0):
+        raise ValueError("Las edades deben ser mayores que 0.")
+    return grid
+
+
+def project_payload(
+    plots: Sequence[Mapping[str, Any]],
+    ages: np.ndarray,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> List[Dict[str, Any]]:
+    # Valida todas las parcelas antes de proyectar: un error se informa con su índice
+    prepared = []
+    for index, data in enumerate(plots):
+        if not isinstance(data, Mapping):
+            raise ValueError(f"Parcela {index}: se esperaba un objeto JSON.")
+        try:
+            prepared.append(ProjectionPlot(data, allometries))
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise ValueError(f"Parcela {index}: {exc}") from exc
+    trajectories = project_plots(prepared, ages)
+    return [
+        {
+            "site_index_m": round(plot.site_index_m, 2),
+            "reference_height_m": round(plot.reference_height_m, 2),
+            "trees_per_ha": round(plot.tph, 2),
+            "trajectory": trajectory,
+        }
+        for plot, trajectory in zip(prepared, trajectories)
+    ]
@@ -0,0 +1,44 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el JSONRenderer de DRF
+    orjson = None
+
+
+# Renderer JSON rápido (orjson) con salida idéntica byte a byte a la del JSONRenderer de DRF.
+# orjson y Python escriben los floats con la misma representación mínima de ida y vuelta,
+# salvo en notación: Python usa exponente con signo y dos dígitos por debajo de 1e-4
+# ('1e-05') y desde 1e16 ('1e+16'), y orjson escribe '0.00001' y '1e16'. Si la salida
+# contiene alguno de esos patrones ('0.0000' o un dígito seguido de 'e', también dentro de
+# un texto) se renderiza con json.dumps; para buscarlos sin una regex sobre MB de salida se
+# pasan todos los dígitos a '0' con bytes.translate y se busca '0e'. Lo mismo si orjson no
+# puede serializar algo (enteros de más de 64 bits, claves no textuales). Las opciones no
+# compactas, indentadas o no estrictas van siempre por json.dumps. NaN/Infinity no deben
+# llegar acá (orjson los escribiría como null): el motor rechaza con 400 las entradas que
+# los producen (DAP o altura no positivos, parámetros no finitos).
+
+_DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+_JS_LINE_SEPARATORS = (b"\xe2\x80\xa8", b"\xe2\x80\xa9")
+# Fechas y dataclasses van al encoder de DRF (formato 'Z' en UTC, error en dataclasses)
+_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson is not None else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"0.0000" in ret or b"0e" in ret.translate(_DIGITS_TO_ZERO):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Igual que DRF: U+2028 y U+2029 escapados para que la salida sea JavaScript válido
+        if _JS_LINE_SEPARATORS[0] in ret or _JS_LINE_SEPARATORS[1] in ret:
+            ret = ret.replace(_JS_LINE_SEPARATORS[0], b"\\u2028").replace(_JS_LINE_SEPARATORS[1], b"\\u2029")
+        return ret
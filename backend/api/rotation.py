@@ -0,0 +1,119 @@
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .engine import Allometry
+from .projection import ProjectionPlot, trajectory_arrays
+
+
+# Edad de rotación: la que maximiza el incremento medio anual (IMA = valor(edad) / edad)
+# de volumen o carbono. Se evalúa una grilla fina de edades para todos los índices de sitio
+# a la vez (matriz sitios × edades, edades ordenadas), se toma el máximo de cada fila y se
+# refina con la parábola que pasa por el máximo y sus dos vecinos.
+# La trayectoria es la de projection.py, que escala la estructura medida: la rotación
+# requiere los árboles de la parcela además del índice de sitio y el marco (sin un modelo
+# altura-diámetro no hay un rodal por defecto del cual partir).
+
+ROTATION_METRICS = {
+    "volume": "vol_total_cc_per_ha_m3",
+    "carbon": "c_bosque_tn_per_ha",
+}
+ROTATION_COLUMNS = (
+    "vol_total_cc_per_ha_m3",
+    "vol_total_sc_per_ha_m3",
+    "vol_merchantable15_cc_per_ha_m3",
+    "vol_merchantable15_sc_per_ha_m3",
+    "biomass_total_tn_per_ha",
+    "c_bosque_tn_per_ha",
+)
+DEFAULT_ROTATION_GRID = (1.0, 60.0, 0.25)
+
+
+def rotation_column(metric: Optional[str]) -> str:
+    if metric in (None, ""):
+        return ROTATION_METRICS["volume"]
+    if metric in ROTATION_METRICS:
+        return ROTATION_METRICS[metric]
+    if metric in ROTATION_COLUMNS:
+        return metric
+    allowed = ", ".join(list(ROTATION_METRICS) + list(ROTATION_COLUMNS))
+    raise ValueError(f"'metric' debe ser uno de: {allowed}.")
+
+
+def refine_maximum(ages: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+    # Máximo por fila con refinamiento parabólico; 'ages' creciente, no necesariamente
+    # uniforme (vértice de la parábola por tres puntos). En los bordes queda el nodo.
+    best = values.argmax(axis=1)
+    rows = np.arange(values.shape[0])
+    peak_age = ages[best].astype(np.float64)
+    peak_value = values[rows, best].astype(np.float64)
+    interior = (best > 0) & (best < ages.shape[0] - 1)
+    if ages.shape[0] >= 3 and interior.any():
+        i = best[interior]
+        r = rows[interior]
+        x0, x1, x2 = ages[i - 1], ages[i], ages[i + 1]
+        y0, y1, y2 = values[r, i - 1], values[r, i], values[r, i + 1]
+        # Forma de Newton: p(x) = y0 + s0·(x - x0) + c·(x - x0)·(x - x1)
+        s0 = (y1 - y0) / (x1 - x0)
+        curvature = ((y2 - y1) / (x2 - x1) - s0) / (x2 - x0)
+        safe = curvature < 0
+        vertex = np.where(safe, 0.5 * (x0 + x1 - s0 / np.where(safe, curvature, -1.0)), x1)
+        peak_age[interior] = vertex
+        peak_value[interior] = np.where(safe, y0 + s0 * (vertex - x0) + curvature * (vertex - x0) * (vertex - x1), y1)
+    return {"age": peak_age, "value": peak_value, "at_edge": ~interior}
+
+
+def optimize_rotation(
+    plot: ProjectionPlot,
+    site_indices: Sequence[float],
+    ages: np.ndarray,
+    column: str,
+) -> List[Dict[str, Any]]:
+    # Edades explícitas en cualquier orden o repetidas: el refinamiento requiere una grilla creciente
+    ages = np.unique(np.asarray(ages, dtype=np.float64))
+    series = trajectory_arrays([plot.with_site_index(si) for si in site_indices], ages)
+    mai = series[column] / ages[None, :]
+    rotation = refine_maximum(ages, mai)
+    animals = refine_maximum(ages, series["animals_per_ha_equilibrium"])
+
+    results = []
+    for k, site_index in enumerate(site_indices):
+        age = float(rotation["age"][k])
+        results.append({
+            "site_index_m": round(float(site_index), 2),
+            "rotation_age_years": round(age, 2),
+            "mai_per_year": round(float(rotation["value"][k]), 4),
+            "value_at_rotation": round(float(rotation["value"][k]) * age, 2),
+            "at_grid_edge": bool(rotation["at_edge"][k]),
+            "animals_peak": {
+                "age_years": round(float(animals["age"][k]), 2),
+                "animals_per_ha_equilibrium": round(float(animals["value"][k]), 2),
+                "at_grid_edge": bool(animals["at_edge"][k]),
+            },
+        })
+    return results
+
+
+def rotation_payload(
+    data: Mapping[str, Any],
+    ages: np.ndarray,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> Dict[str, Any]:
+    column = rotation_column(data.get("metric"))
+    trees = data.get("trees")
+    if not isinstance(trees, list) or len(trees) == 0:
+        raise ValueError(
+            "La rotación requiere la estructura medida del rodal ('trees' con dap_cm y height_m) "
+            "además del índice de sitio y el marco de plantación."
+        )
+    plot = ProjectionPlot(data, allometries)
+    site_indices = data.get("site_indices")
+    if site_indices is None:
+        site_indices = [plot.site_index_m]
+    if not isinstance(site_indices, list) or len(site_indices) == 0:
+        raise ValueError("'site_indices' debe ser una lista de índices de sitio (m).")
+    site_indices = [float(si) for si in site_indices]
+    if any(not math.isfinite(si) or si <= 0 for si in site_indices):
+        raise ValueError("Los índices de sitio deben ser números finitos mayores que 0.")
+    return {"metric": column, "results": optimize_rotation(plot, site_indices, ages, column)}
@@ -36,6 +36,21 @@ class PlotSerializer(serializers.ModelSerializer):
 
 
 class MeasurementSerializer(serializers.ModelSerializer):
+    # Contenidos JSON pesados (en PayloadBlob) que se leen solo si se piden en 'fields'
+    HEAVY_FIELDS = ('input_data', 'metrics')
+
+    # Propiedades del modelo (ver Measurement.PAYLOAD_FIELDS), no columnas
+    input_data = serializers.JSONField()
+    metrics = serializers.JSONField()
+
+    def __init__(self, *args, **kwargs):
+        # Proyección opcional: MeasurementSerializer(..., fields=['id', 'created_at'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Measurement
         fields = ['id', 'plot', 'input_data', 'metrics', 'created_at']
\ No newline at end of file
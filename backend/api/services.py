@@ -0,0 +1,371 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .calculations import (
+    dominant_height_from_site_index,
+    site_index_from_dominant_height,
+    recommended_plot_area_m2,
+    plot_radius_from_area_m,
+    carbon_forest_tn_per_ha,
+    capture_kg_per_day_per_ha,
+    animals_per_ha_equilibrium,
+)
+from .engine import (
+    DEFAULT_ALLOMETRY,
+    PER_TREE_COLUMNS_FORMAT,
+    PER_TREE_FORMATS,
+    PER_TREE_NONE,
+    PER_TREE_ROWS,
+    Allometry,
+    per_tree_allometry,
+    plot_metrics,
+    stand_density,
+    trees_to_arrays,
+)
+from .uncertainty import uncertainty_bands, uncertainty_options
+
+
+# Lógica de cálculo compartida por los endpoints de /api/calc. Este módulo no depende
+# de Django para poder ejecutarse en procesos hijos (lotes grandes).
+
+TREES_REQUIRED_MESSAGE = "Debe proporcionar una lista 'trees' con dap_cm y height_m."
+
+# Claves por hectárea que se consolidan a nivel de establecimiento en los lotes
+ESTATE_PER_HA_KEYS = (
+    "ab_per_ha_m2",
+    "vol_total_cc_per_ha_m3",
+    "vol_total_sc_per_ha_m3",
+    "vol_merchantable15_cc_per_ha_m3",
+    "vol_merchantable15_sc_per_ha_m3",
+    "biomass_above_tn_per_ha",
+    "biomass_root_tn_per_ha",
+    "biomass_total_tn_per_ha",
+)
+
+
+def finite_parameter(data: Mapping[str, Any], name: str, default: Any) -> float:
+    # NaN/Infinity (el JSON de Python los acepta, y 1e400 se lee como inf) se rechazan acá
+    value = float(data.get(name, default))
+    if not math.isfinite(value):
+        raise ValueError(f"'{name}' debe ser un número finito.")
+    return value
+
+
+def stand_area_ha(data: Mapping[str, Any]) -> float:
+    # Superficie del rodal para el resumen del lote (ausente o 0 = sin superficie)
+    if data.get("stand_area_ha") is None:
+        return 0.0
+    value = finite_parameter(data, "stand_area_ha", None)
+    if value < 0:
+        raise ValueError("'stand_area_ha' debe ser un número finito mayor o igual que 0.")
+    return value
+
+
+def plot_parameters(data: Mapping[str, Any]) -> Dict[str, Any]:
+    # Parámetros de parcela comunes a todos los modos de entrada (JSON, lote, streaming)
+    for name in ("site_index_m", "dominant_height_m"):
+        if data.get(name) is not None:
+            finite_parameter(data, name, None)
+    return {
+        "dist_in_row_m": finite_parameter(data, "distance_in_row_m", 0),
+        "dist_between_rows_m": finite_parameter(data, "distance_between_rows_m", 0),
+        "plot_area_m2": finite_parameter(data, "plot_area_m2", 0),
+        "min_trees_for_plot": int(finite_parameter(data, "min_trees_for_plot", 20)),
+        "age_years": finite_parameter(data, "age_years", 0),
+        "animal_emission_kg_day": finite_parameter(data, "animal_emission_kg_day", 5.0),
+        "site_index_m": data.get("site_index_m"),
+        "dominant_height_m": data.get("dominant_height_m"),
+        "root_ratio": finite_parameter(data, "species_root_ratio", 0.263),
+    }
+
+
+def per_tree_format(value: Any, default: str = PER_TREE_ROWS) -> str:
+    # Acepta 'rows' | 'columns' | 'none' y también booleanos ('0', 'false', False -> 'none')
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return default if value else PER_TREE_NONE
+    text = str(value).strip().lower()
+    if text in PER_TREE_FORMATS:
+        return text
+    if text in ("0", "false", "no"):
+        return PER_TREE_NONE
+    if text in ("1", "true", "yes"):
+        return default
+    raise ValueError("'per_tree' debe ser 'rows', 'columns' o 'none'.")
+
+
+def plot_summary(agg: Dict[str, Any], params: Mapping[str, Any]) -> Dict[str, Any]:
+    dist_in_row_m = params["dist_in_row_m"]
+    dist_between_rows_m = params["dist_between_rows_m"]
+    plot_area_m2 = params["plot_area_m2"]
+    min_trees_for_plot = params["min_trees_for_plot"]
+    age_years = params["age_years"]
+    animal_emission_kg_day = params["animal_emission_kg_day"]
+    site_index_m = params["site_index_m"]
+    dominant_height_m_input = params["dominant_height_m"]
+
+    # Site index / dominant height
+    dominant_height_calc = None
+    site_index_calc = None
+    if site_index_m is not None and age_years:
+        try:
+            dominant_height_calc = round(
+                dominant_height_from_site_index(float(site_index_m), age_years), 2
+            )
+        except Exception:
+            dominant_height_calc = None
+    if dominant_height_m_input is not None and age_years:
+        try:
+            site_index_calc = round(
+                site_index_from_dominant_height(float(dominant_height_m_input), age_years), 2
+            )
+        except Exception:
+            site_index_calc = None
+
+    # Parcela recomendada para mínimo de árboles y radio
+    recommended_area_m2 = recommended_plot_area_m2(dist_in_row_m, dist_between_rows_m, min_trees_for_plot)
+    recommended_radius_m = plot_radius_from_area_m(recommended_area_m2)
+    radius_from_provided_area_m = plot_radius_from_area_m(plot_area_m2) if plot_area_m2 else None
+
+    # Carbono y equilibrio animales/ha
+    c_bosque_tn_ha = carbon_forest_tn_per_ha(agg["biomass_total_tn_per_ha"]) if agg.get("biomass_total_tn_per_ha") is not None else 0.0
+    capture_kg_day_ha = capture_kg_per_day_per_ha(c_bosque_tn_ha, age_years) if age_years else 0.0
+    animals_equilibrium = animals_per_ha_equilibrium(capture_kg_day_ha, animal_emission_kg_day) if animal_emission_kg_day else 0.0
+
+    return {
+        "aggregates": agg,
+        "site": {
+            "dominant_height_from_site_index_m": dominant_height_calc,
+            "site_index_from_dominant_height_m": site_index_calc,
+            "age_years": age_years,
+        },
+        "plot": {
+            "recommended_area_m2_for_min_trees": round(recommended_area_m2, 2),
+            "recommended_radius_m": round(recommended_radius_m, 2),
+            "provided_area_m2": plot_area_m2 if plot_area_m2 else None,
+            "radius_from_provided_area_m": round(radius_from_provided_area_m, 2) if radius_from_provided_area_m else None,
+            "min_trees_for_plot": min_trees_for_plot,
+        },
+        "carbon": {
+            "c_bosque_tn_per_ha": round(c_bosque_tn_ha, 2),
+            "capture_kg_per_day_per_ha": round(capture_kg_day_ha, 3),
+            "animal_emission_kg_day": animal_emission_kg_day,
+            "animals_per_ha_equilibrium": round(animals_equilibrium, 2),
+        },
+    }
+
+
+def plot_allometry(
+    data: Mapping[str, Any],
+    trees: Sequence[Mapping[str, Any]],
+    allometries: Optional[Mapping[str, Allometry]],
+) -> Tuple[Allometry, Optional[float]]:
+    # Ecuaciones por especie ('species' de la parcela y/o de cada árbol) y relación
+    # raíz/aérea: la explícita del cuerpo ('species_root_ratio') tiene prioridad; si no, la
+    # de cada especie (None = tomarla de la alometría).
+    root_ratio = float(data.get("species_root_ratio", 0.263))
+    if allometries is None:
+        return DEFAULT_ALLOMETRY, root_ratio
+    plot_species = data.get("species")
+    if plot_species in (None, "") and not any(isinstance(t, Mapping) and t.get("species") not in (None, "") for t in trees):
+        return DEFAULT_ALLOMETRY, root_ratio
+    allometry = per_tree_allometry(trees, plot_species, allometries)
+    return allometry, (root_ratio if "species_root_ratio" in data else None)
+
+
+def compute_plot_metrics(
+    data: Mapping[str, Any],
+    default_per_tree: str = PER_TREE_ROWS,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> Dict[str, Any]:
+    if not isinstance(data, Mapping):
+        raise ValueError("Cada parcela debe ser un objeto JSON.")
+    trees = data.get("trees", [])
+    params = plot_parameters(data)
+    output_format = per_tree_format(data.get("per_tree"), default_per_tree)
+
+    # Validación mínima
+    if not isinstance(trees, list) or len(trees) == 0:
+        raise ValueError(TREES_REQUIRED_MESSAGE)
+    uncertainty = uncertainty_options(data["uncertainty"]) if data.get("uncertainty") else None
+    allometry, root_ratio = plot_allometry(data, trees, allometries)
+
+    # Cálculo por árbol y agregados de parcela / hectárea (motor columnar)
+    per_tree, agg = plot_metrics(
+        trees,
+        params["dist_in_row_m"],
+        params["dist_between_rows_m"],
+        plot_area_m2=params["plot_area_m2"],
+        root_ratio=root_ratio,
+        per_tree_format=output_format,
+        allometry=allometry,
+    )
+    result = {"per_tree": per_tree, **plot_summary(agg, params)}
+    if uncertainty is not None:
+        # Modo opcional: bandas Monte Carlo de los agregados por hectárea
+        # Con la densidad sin redondear (agg["trees_per_ha"] es entera)
+        dap, height = trees_to_arrays(trees)
+        tph, _, _ = stand_density(len(dap), params["dist_in_row_m"], params["dist_between_rows_m"], params["plot_area_m2"])
+        result["uncertainty"] = uncertainty_bands(dap, height, tph, root_ratio, uncertainty, allometry)
+    return result
+
+
+def compute_record_metrics(
+    input_data: Mapping[str, Any],
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> Dict[str, float]:
+    # Agregados que se guardan con una medición (POST /api/records sin 'metrics')
+    trees = input_data.get('trees', [])
+    params = plot_parameters(input_data)
+    allometry, root_ratio = plot_allometry(input_data, trees, allometries)
+    _, metrics = plot_metrics(
+        trees,
+        params["dist_in_row_m"],
+        params["dist_between_rows_m"],
+        plot_area_m2=params["plot_area_m2"],
+        root_ratio=root_ratio,
+        per_tree_format=PER_TREE_NONE,
+        allometry=allometry,
+    )
+    return metrics
+
+
+def recompute_metrics(
+    input_data: Mapping[str, Any],
+    stored: Any,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> Dict[str, Any]:
+    # Recalcula el 'metrics' de una medición guardada conservando su forma: respuesta
+    # completa de /api/calc/metrics (con 'aggregates' y el mismo formato per_tree) o solo
+    # los agregados (POST /api/records sin 'metrics')
+    if isinstance(stored, Mapping) and isinstance(stored.get("aggregates"), Mapping):
+        per_tree = stored.get("per_tree")
+        if isinstance(per_tree, list) and per_tree:
+            output_format = PER_TREE_ROWS
+        elif isinstance(per_tree, Mapping) and per_tree:
+            output_format = PER_TREE_COLUMNS_FORMAT
+        else:
+            output_format = PER_TREE_NONE
+        return compute_plot_metrics(input_data, output_format, allometries)
+    return compute_record_metrics(input_data, allometries)
+
+
+def compute_batch_item(
+    index: int,
+    data: Any,
+    default_per_tree: str = PER_TREE_ROWS,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> Dict[str, Any]:
+    # Los errores se informan por parcela para no abortar el lote completo
+    try:
+        result = compute_plot_metrics(data, default_per_tree, allometries)
+        stand_area_ha(data)
+    except (TypeError, ValueError, AttributeError, OverflowError) as exc:
+        return {"index": index, "ok": False, "error": str(exc)}
+    return {"index": index, "ok": True, "result": result}
+
+
+def compute_batch_chunk(
+    start: int,
+    plots: Sequence[Any],
+    default_per_tree: str = PER_TREE_ROWS,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> List[Dict[str, Any]]:
+    return [compute_batch_item(start + offset, data, default_per_tree, allometries) for offset, data in enumerate(plots)]
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = Lock()
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    # Un pool por proceso (cada worker de gunicorn crea el suyo al primer lote grande)
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=max_workers)
+            _executor_workers = max_workers
+        return _executor
+
+
+def _discard_executor(broken: ProcessPoolExecutor) -> None:
+    # Un pool con un proceso caído (OOM, señal) ya no acepta tareas: el próximo lote crea otro
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def compute_batch(
+    plots: Sequence[Any],
+    parallel_min_plots: int = 64,
+    max_workers: Optional[int] = None,
+    default_per_tree: str = PER_TREE_ROWS,
+    allometries: Optional[Mapping[str, Allometry]] = None,
+) -> List[Dict[str, Any]]:
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(plots) < max(parallel_min_plots, 2):
+        return compute_batch_chunk(0, plots, default_per_tree, allometries)
+
+    # Bloques contiguos: menos overhead de serialización entre procesos que ítem a ítem
+    chunk_size = max(1, -(-len(plots) // (workers * 4)))
+    starts = list(range(0, len(plots), chunk_size))
+    chunks = [plots[s:s + chunk_size] for s in starts]
+    repeat = len(starts)
+    # Si el pool se rompe se reintenta una vez con uno nuevo y, si no, se calcula en serie
+    for _ in range(2):
+        executor = _get_executor(workers)
+        results: List[Dict[str, Any]] = []
+        try:
+            for chunk in executor.map(compute_batch_chunk, starts, chunks, [default_per_tree] * repeat, [allometries] * repeat):
+                results.extend(chunk)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            continue
+        return results
+    return compute_batch_chunk(0, plots, default_per_tree, allometries)
+
+
+def estate_rollup(plots: Sequence[Any], results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    # Promedios por hectárea ponderados por la superficie del rodal ('stand_area_ha') si
+    # todas las parcelas calculadas la informan; si falta en alguna, cada parcela pesa lo
+    # mismo. Los totales suman solo las parcelas con superficie.
+    ok = [(plots[r["index"]], r["result"]) for r in results if r["ok"]]
+    areas = [stand_area_ha(data) for data, _ in ok]
+    by_area = bool(ok) and all(area > 0 for area in areas)
+    weight_sum = 0.0
+    weighted = {key: 0.0 for key in ESTATE_PER_HA_KEYS + ("c_bosque_tn_per_ha",)}
+    totals = {key: 0.0 for key in weighted}
+    trees_count = 0
+    for (data, result), area in zip(ok, areas):
+        values = dict(result["aggregates"])
+        values["c_bosque_tn_per_ha"] = result["carbon"]["c_bosque_tn_per_ha"]
+        trees_count += values["trees_count"]
+        weight = area if by_area else 1.0
+        weight_sum += weight
+        for key in weighted:
+            weighted[key] += values.get(key, 0.0) * weight
+            totals[key] += values.get(key, 0.0) * area
+    area_ha = sum(areas)
+    if not all(math.isfinite(value) for value in (weight_sum, area_ha, *weighted.values(), *totals.values())):
+        raise ValueError("El resumen del establecimiento excede el rango numérico: revisar 'stand_area_ha' y los árboles.")
+
+    return {
+        "plots_count": len(results),
+        "plots_ok": len(ok),
+        "plots_failed": len(results) - len(ok),
+        "trees_count": trees_count,
+        "stand_area_ha": round(area_ha, 4) if area_ha > 0 else None,
+        "weighted_by_area": by_area,
+        "mean_per_ha": {key: round(value / weight_sum, 2) for key, value in weighted.items()} if weight_sum else None,
+        "totals": {key.replace("_per_ha", ""): round(value, 2) for key, value in totals.items()} if area_ha > 0 else None,
+    }
@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .analytics import bump_version
+from .models import Measurement, Plot, Producer, Species, Tree
+from .species import registry
+from .stored_metrics import apply_tree_change, mark_accumulators_stale, plot_allometry
+
+
+@receiver(post_save, sender=Measurement)
+@receiver(post_delete, sender=Measurement)
+@receiver(post_save, sender=Producer)
+@receiver(post_delete, sender=Producer)
+@receiver(post_delete, sender=Plot)
+def invalidate_analytics(sender, **kwargs):
+    # La analítica agrupa por parcela -> productor/especie/clase de sitio: cambiar o borrar
+    # cualquiera de ellos también cambia los resultados
+    bump_version()
+
+
+@receiver(pre_save, sender=Tree)
+def remember_previous_tree(sender, instance, raw=False, **kwargs):
+    # Valores anteriores para restar su aporte al acumulador (una consulta por guardado)
+    instance._accumulator_previous = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._accumulator_previous = (
+            Tree.objects.filter(pk=instance.pk).values_list('plot_id', 'dap_cm', 'height_m').first()
+        )
+
+
+@receiver(post_save, sender=Tree)
+def accumulate_saved_tree(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_accumulator_previous', None)
+    allometry = plot_allometry(instance.plot_id)
+    if previous is not None:
+        plot_id, dap_cm, height_m = previous
+        previous_allometry = allometry if plot_id == instance.plot_id else plot_allometry(plot_id)
+        apply_tree_change(plot_id, dap_cm, height_m, previous_allometry, -1)
+    apply_tree_change(instance.plot_id, instance.dap_cm, instance.height_m, allometry, +1)
+
+
+@receiver(post_delete, sender=Tree)
+def accumulate_deleted_tree(sender, instance, origin=None, **kwargs):
+    # Al borrar la parcela completa su acumulador se elimina en cascada: nada que restar
+    if isinstance(origin, Plot):
+        return
+    allometry = plot_allometry(instance.plot_id)
+    apply_tree_change(instance.plot_id, instance.dap_cm, instance.height_m, allometry, -1)
+
+
+@receiver(post_save, sender=Species)
+@receiver(pre_delete, sender=Species)
+def invalidate_species(sender, instance, **kwargs):
+    # Nuevos coeficientes: se recarga el registro y se recalculan las parcelas de la especie
+    # (al borrar, antes de que SET_NULL las desvincule)
+    registry.invalidate()
+    bump_version()
+    mark_accumulators_stale(Plot.objects.filter(species_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Species)
+def forget_species(sender, **kwargs):
+    registry.invalidate()
+
+
+@receiver(pre_save, sender=Plot)
+def remember_previous_species(sender, instance, raw=False, **kwargs):
+    instance._previous_species_id = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._previous_species_id = Plot.objects.filter(pk=instance.pk).values_list('species_id', flat=True).first()
+
+
+@receiver(post_save, sender=Plot)
+def species_changed(sender, instance, created=False, raw=False, **kwargs):
+    # Cambió la especie de la parcela: su acumulador se calculó con otras ecuaciones
+    if not raw and not created and getattr(instance, '_previous_species_id', None) != instance.species_id:
+        mark_accumulators_stale([instance.pk])
+    # Una parcela existente reasignada (productor, especie, clase) cambia la analítica
+    if not raw and not created:
+        bump_version()
@@ -0,0 +1,99 @@
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F
+
+from .engine import DEFAULT_ALLOMETRY, Allometry, species_key
+from .models import Species, SpeciesVersion
+
+
+# Registro de ecuaciones por especie: los coeficientes de Species se leen de la base una
+# sola vez (una consulta para todas las especies) y quedan en memoria como Allometry,
+# indexados por id y por nombre. Guardar o borrar una especie incrementa la versión guardada
+# en la base (SpeciesVersion); cada proceso la vuelve a leer cada
+# CIEFAP_SPECIES_RECHECK_SECONDS como máximo y recarga el registro si cambió. El proceso
+# que hizo el cambio lo ve de inmediato.
+#   biomass_above_a -> multiplicador de la biomasa aérea (0.0206 por defecto)
+#   biomass_above_b -> exponente del DAP (2.337 por defecto)
+#   root_ratio      -> relación raíz/aérea (0.263 por defecto)
+
+VERSION_PK = 1
+
+
+def species_allometry(biomass_above_a: Optional[float], biomass_above_b: Optional[float], root_ratio: Optional[float]) -> Allometry:
+    # Los coeficientes nulos conservan el valor por defecto
+    overrides = {}
+    if biomass_above_a is not None:
+        overrides["biomass_above_a"] = biomass_above_a
+    if biomass_above_b is not None:
+        overrides["biomass_above_b"] = biomass_above_b
+    if root_ratio is not None:
+        overrides["root_ratio"] = root_ratio
+    return DEFAULT_ALLOMETRY._replace(**overrides)
+
+
+class SpeciesRegistry:
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._version: Optional[int] = None
+        self._allometries: Dict[str, Allometry] = {}
+        self._by_id: Dict[int, Allometry] = {}
+        # Última versión leída de la base y cuándo (time.monotonic)
+        self._stored_version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def version(self) -> int:
+        recheck = getattr(settings, "CIEFAP_SPECIES_RECHECK_SECONDS", 2.0)
+        now = time.monotonic()
+        if self._stored_version is None or now - self._checked_at >= recheck:
+            stored = SpeciesVersion.objects.filter(pk=VERSION_PK).values_list("version", flat=True).first()
+            self._stored_version, self._checked_at = stored or 0, now
+        return self._stored_version
+
+    def _load(self, version: int) -> None:
+        rows = list(Species.objects.values_list("pk", "name", "biomass_above_a", "biomass_above_b", "root_ratio"))
+        by_id = {pk: species_allometry(a, b, root_ratio) for pk, _, a, b, root_ratio in rows}
+        by_key = {species_key(pk): allometry for pk, allometry in by_id.items()}
+        for pk, name, *_ in rows:
+            by_key.setdefault(species_key(name), by_id[pk])
+        self._by_id, self._allometries, self._version = by_id, by_key, version
+
+    def allometries(self) -> Dict[str, Allometry]:
+        # Especie (id o nombre normalizado) -> Allometry; se recarga si cambió la versión
+        version = self.version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._load(version)
+        return self._allometries
+
+    def snapshot(self) -> Tuple[int, Dict[str, Allometry]]:
+        allometries = self.allometries()
+        return self._version, allometries
+
+    def for_species_id(self, species_id: Optional[int]) -> Allometry:
+        if species_id is None:
+            return DEFAULT_ALLOMETRY
+        self.allometries()
+        return self._by_id.get(species_id, DEFAULT_ALLOMETRY)
+
+    def has_custom_equations(self) -> bool:
+        # Sin coeficientes propios de biomasa/volumen todas las especies usan las ecuaciones
+        # por defecto (la relación raíz/aérea se aplica recién al leer los agregados)
+        self.allometries()
+        default = DEFAULT_ALLOMETRY.root_ratio
+        return any(allometry._replace(root_ratio=default) != DEFAULT_ALLOMETRY for allometry in self._by_id.values())
+
+    def invalidate(self) -> None:
+        # Dentro de la transacción de quien guarda: la nueva versión se publica con el cambio
+        if not SpeciesVersion.objects.filter(pk=VERSION_PK).update(version=F("version") + 1):
+            SpeciesVersion.objects.get_or_create(pk=VERSION_PK)
+            SpeciesVersion.objects.filter(pk=VERSION_PK).update(version=F("version") + 1)
+        with self._lock:
+            self._version = None
+            self._stored_version = None
+
+
+registry = SpeciesRegistry()
@@ -0,0 +1,209 @@
+import math
+from itertools import islice
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, F, Sum
+
+from .calculations import (
+    basal_area_m2,
+    volume_total_cc_m3,
+    volume_total_sc_m3,
+    volume_merchantable15_cc_m3,
+    volume_merchantable15_sc_m3,
+    biomass_above_kg,
+)
+from .engine import (
+    DEFAULT_ALLOMETRY,
+    TREE_VALUES_MESSAGE,
+    Allometry,
+    aggregate_from_sums,
+    invalid_trees,
+    tree_columns,
+)
+from .models import Plot, PlotAccumulator
+from .services import plot_parameters, plot_summary
+from .species import registry
+from .streaming import tree_values
+
+
+# Métricas de una parcela guardada (Plot/Tree) sin traer objetos del ORM: los términos
+# lineales en DAP² y DAP²·H salen de un único SUM() en SQL; solo los términos no lineales
+# (biomasa y volumen maderable s/c) se evalúan en Python, por bloques de values_list.
+# El resultado se guarda en PlotAccumulator y las altas/cambios/bajas de árboles lo
+# actualizan en O(1) (ver signals.py); la lectura usa el acumulador. Las ecuaciones son las
+# de la especie de la parcela (species.registry).
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def stored_plot_sums(
+    plot: Plot,
+    root_ratio: float,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Tuple[int, Dict[str, float]]:
+    trees = plot.trees.all()
+    linear = trees.aggregate(
+        n=Count("id"),
+        dap=Sum("dap_cm"),
+        height=Sum("height_m"),
+        dap2=Sum(F("dap_cm") * F("dap_cm")),
+        dap2_h=Sum(F("dap_cm") * F("dap_cm") * F("height_m")),
+    )
+    n = linear["n"] or 0
+    dap2 = linear["dap2"] or 0.0
+    dap2_h_m = (linear["dap2_h"] or 0.0) / 10000.0  # Σ (DAP/100)² · H
+
+    vm15_sc = 0.0
+    b_above = 0.0
+    rows = trees.order_by().values_list("number", "dap_cm", "height_m").iterator(chunk_size=chunk_size)
+    while True:
+        block = np.fromiter(islice(rows, chunk_size), dtype=np.dtype((np.float64, 3)))
+        if block.shape[0] == 0:
+            break
+        # Un árbol guardado fuera de rango daría NaN en las sumas (y en el acumulador)
+        invalid = invalid_trees(block[:, 1], block[:, 2])
+        if invalid.any():
+            raise ValueError(f"Árbol {int(block[invalid.argmax(), 0])}: {TREE_VALUES_MESSAGE}")
+        columns = tree_columns(block[:, 1], block[:, 2], root_ratio, allometry)
+        vm15_sc += float(columns["vol_maderable15_sc_m3"].sum())
+        b_above += float(columns["biomass_above_kg"].sum())
+
+    sums = {
+        "dap_cm": linear["dap"] or 0.0,
+        "height_m": linear["height"] or 0.0,
+        "dap2": dap2,
+        "ab_m2": math.pi * (dap2 / 10000.0) / 4.0,
+        "vol_total_cc_m3": allometry.vol_total_cc_a * n + allometry.vol_total_cc_b * dap2_h_m,
+        "vol_total_sc_m3": allometry.vol_total_sc_a * n + allometry.vol_total_sc_b * dap2_h_m,
+        "vol_maderable15_cc_m3": allometry.vol_merchantable15_cc_a * n + allometry.vol_merchantable15_cc_b * dap2_h_m,
+        "vol_maderable15_sc_m3": vm15_sc,
+        "biomass_above_kg": b_above,
+        "biomass_root_kg": b_above * root_ratio,
+    }
+    return n, sums
+
+
+# Campo de PlotAccumulator -> clave de las sumas de aggregate_from_sums
+ACCUMULATOR_FIELDS = {
+    "dap_sum": "dap_cm",
+    "height_sum": "height_m",
+    "dap2_sum": "dap2",
+    "ab_sum": "ab_m2",
+    "vol_total_cc_sum": "vol_total_cc_m3",
+    "vol_total_sc_sum": "vol_total_sc_m3",
+    "vol_merchantable15_cc_sum": "vol_maderable15_cc_m3",
+    "vol_merchantable15_sc_sum": "vol_maderable15_sc_m3",
+    "biomass_above_sum": "biomass_above_kg",
+}
+
+
+def tree_contribution(dap_cm: float, height_m: float, allometry: Allometry = DEFAULT_ALLOMETRY) -> Dict[str, float]:
+    # Aporte de un árbol a cada suma (funciones escalares de referencia: es un solo árbol)
+    dap_cm, height_m = tree_values(dap_cm, height_m)
+    if allometry != DEFAULT_ALLOMETRY:
+        columns = tree_columns(np.array([dap_cm]), np.array([height_m]), 0.0, allometry)
+        contribution = {name: float(columns[key][0]) for name, key in ACCUMULATOR_FIELDS.items() if key != "dap2"}
+        contribution["dap2_sum"] = dap_cm ** 2
+        return contribution
+    return {
+        "dap_sum": dap_cm,
+        "height_sum": height_m,
+        "dap2_sum": dap_cm ** 2,
+        "ab_sum": basal_area_m2(dap_cm),
+        "vol_total_cc_sum": volume_total_cc_m3(dap_cm, height_m),
+        "vol_total_sc_sum": volume_total_sc_m3(dap_cm, height_m),
+        "vol_merchantable15_cc_sum": volume_merchantable15_cc_m3(dap_cm, height_m),
+        "vol_merchantable15_sc_sum": volume_merchantable15_sc_m3(dap_cm, height_m),
+        "biomass_above_sum": biomass_above_kg(dap_cm, height_m),
+    }
+
+
+def apply_tree_delta(plot_id: int, contribution: Mapping[str, float], sign: int) -> None:
+    # UPDATE ... SET campo = campo ± aporte: atómico y sin leer la fila. Si la parcela aún no
+    # tiene acumulador no se hace nada: se construirá completo en la primera lectura.
+    PlotAccumulator.objects.filter(plot_id=plot_id, stale=False).update(
+        trees_count=F("trees_count") + sign,
+        **{name: F(name) + sign * value for name, value in contribution.items()},
+    )
+
+
+def apply_tree_change(plot_id: int, dap_cm: float, height_m: float, allometry: Allometry, sign: int) -> None:
+    # Árbol fuera de rango: en lugar de sumar NaN se marca el acumulador, y la lectura (que
+    # lo reconstruye) responde 400 hasta que se corrija el árbol
+    try:
+        contribution = tree_contribution(dap_cm, height_m, allometry)
+    except ValueError:
+        mark_accumulators_stale([plot_id])
+        return
+    apply_tree_delta(plot_id, contribution, sign)
+
+
+def plot_allometry(plot_id: int) -> Allometry:
+    # Ecuaciones de la especie de la parcela; sin coeficientes propios no hace falta consultar
+    if not registry.has_custom_equations():
+        return DEFAULT_ALLOMETRY
+    species_id = Plot.objects.filter(pk=plot_id).values_list("species_id", flat=True).first()
+    return registry.for_species_id(species_id)
+
+
+def mark_accumulators_stale(plot_ids) -> None:
+    PlotAccumulator.objects.filter(plot_id__in=list(plot_ids)).update(stale=True)
+
+
+def rebuild_accumulator(plot: Plot) -> PlotAccumulator:
+    n, sums = stored_plot_sums(plot, root_ratio=0.0, allometry=registry.for_species_id(plot.species_id))
+    values = {name: sums[key] for name, key in ACCUMULATOR_FIELDS.items()}
+    accumulator, _ = PlotAccumulator.objects.update_or_create(
+        plot=plot, defaults={"trees_count": n, "stale": False, **values},
+    )
+    return accumulator
+
+
+def accumulated_sums(plot: Plot, root_ratio: float) -> Tuple[int, Dict[str, float]]:
+    accumulator = PlotAccumulator.objects.filter(plot=plot).first()
+    if accumulator is None or accumulator.stale:
+        accumulator = rebuild_accumulator(plot)
+    sums = {key: getattr(accumulator, name) for name, key in ACCUMULATOR_FIELDS.items()}
+    sums["biomass_root_kg"] = sums["biomass_above_kg"] * root_ratio
+    return accumulator.trees_count, sums
+
+
+def accumulator_drift(plot: Plot, rel_tol: float = 1e-9) -> Dict[str, Tuple[float, float]]:
+    # Diferencias entre el acumulador y un recálculo completo (vacío = consistente)
+    accumulator = PlotAccumulator.objects.filter(plot=plot).first()
+    if accumulator is None or accumulator.stale:
+        return {}
+    n, sums = stored_plot_sums(plot, root_ratio=0.0, allometry=registry.for_species_id(plot.species_id))
+    drift = {}
+    if accumulator.trees_count != n:
+        drift["trees_count"] = (accumulator.trees_count, n)
+    for name, key in ACCUMULATOR_FIELDS.items():
+        stored, exact = getattr(accumulator, name), sums[key]
+        if not math.isclose(stored, exact, rel_tol=rel_tol, abs_tol=1e-6):
+            drift[name] = (stored, exact)
+    return drift
+
+
+def stored_plot_parameters(plot: Plot, overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    data = {
+        "distance_in_row_m": plot.distance_in_row_m,
+        "distance_between_rows_m": plot.distance_between_rows_m,
+        "plot_area_m2": math.pi * plot.radius_m ** 2 if plot.radius_m > 0 else 0.0,
+        "age_years": plot.age_years,
+        "dominant_height_m": plot.dominant_height_m or None,
+    }
+    if plot.species is not None and plot.species.root_ratio is not None:
+        data["species_root_ratio"] = plot.species.root_ratio
+    for key, value in (overrides or {}).items():
+        if value not in (None, ""):
+            data[key] = value
+    return plot_parameters(data)
+
+
+def stored_plot_metrics(plot: Plot, overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    params = stored_plot_parameters(plot, overrides)
+    n, sums = accumulated_sums(plot, params["root_ratio"])
+    agg = aggregate_from_sums(n, sums, params["dist_in_row_m"], params["dist_between_rows_m"], params["plot_area_m2"])
+    return {"plot_id": plot.pk, **plot_summary(agg, params)}
@@ -0,0 +1,130 @@
+import csv
+import json
+import math
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Mapping, Tuple
+
+import numpy as np
+
+from .engine import (
+    DEFAULT_ALLOMETRY,
+    TREE_VALUES_MESSAGE,
+    Allometry,
+    RunningAggregate,
+    per_tree_rows,
+    tree_columns,
+)
+from .services import TREES_REQUIRED_MESSAGE, plot_summary
+
+
+# Ingesta en streaming de listas de árboles (NDJSON o CSV `dap_cm,height_m`): las filas
+# se procesan en bloques de tamaño fijo y los resultados por árbol se devuelven como
+# NDJSON a medida que se calculan, sin acumular la lista completa en memoria.
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines", "application/json-seq")
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class RowError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"Fila {line}: {message}")
+        self.line = line
+
+
+def stream_format(content_type: str) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    if media_type in CSV_CONTENT_TYPES:
+        return "csv"
+    return ""
+
+
+def text_lines(lines: Iterable[Any]) -> Iterator[str]:
+    for raw in lines:
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        yield line.lstrip("\ufeff")
+
+
+def tree_values(dap_cm: float, height_m: float) -> Tuple[float, float]:
+    # Misma validación que engine.check_tree_arrays, fila por fila (con su número de línea)
+    if not (math.isfinite(dap_cm) and math.isfinite(height_m) and dap_cm > 0 and height_m > 0):
+        raise ValueError(TREE_VALUES_MESSAGE)
+    return dap_cm, height_m
+
+
+def iter_ndjson_rows(lines: Iterable[Any]) -> Iterator[Tuple[float, float]]:
+    for number, line in enumerate(text_lines(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            yield tree_values(float(row.get("dap_cm", 0.0)), float(row.get("height_m", 0.0)))
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise RowError(number, str(exc)) from exc
+
+
+def iter_csv_rows(lines: Iterable[Any]) -> Iterator[Tuple[float, float]]:
+    # Encabezado opcional con las columnas dap_cm y height_m (en cualquier orden)
+    dap_index, height_index = 0, 1
+    for number, row in enumerate(csv.reader(text_lines(lines)), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if number == 1:
+            names = [cell.strip().lower() for cell in row]
+            if "dap_cm" in names or "height_m" in names:
+                try:
+                    dap_index, height_index = names.index("dap_cm"), names.index("height_m")
+                except ValueError as exc:
+                    raise RowError(number, "el encabezado debe incluir dap_cm y height_m") from exc
+                continue
+        try:
+            yield tree_values(float(row[dap_index]), float(row[height_index]))
+        except (IndexError, ValueError) as exc:
+            raise RowError(number, str(exc)) from exc
+
+
+def iter_tree_chunks(rows: Iterator[Tuple[float, float]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    while True:
+        block = np.fromiter(islice(rows, chunk_size), dtype=np.dtype((np.float64, 2)))
+        if block.shape[0] == 0:
+            return
+        yield block[:, 0], block[:, 1]
+
+
+def _ndjson(obj: Mapping[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def stream_plot_metrics(
+    lines: Iterable[Any],
+    fmt: str,
+    params: Mapping[str, Any],
+    with_per_tree: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Iterator[bytes]:
+    # Emite una línea NDJSON por árbol y, al final, {"summary": {...}} con los agregados
+    # (mismo contenido que /api/calc/metrics sin 'per_tree'). Los errores de entrada se
+    # informan como {"error": ...} porque el estado HTTP ya fue enviado.
+    rows = iter_ndjson_rows(lines) if fmt == "ndjson" else iter_csv_rows(lines)
+    running = RunningAggregate()
+    try:
+        for dap, height in iter_tree_chunks(rows, chunk_size):
+            columns = tree_columns(dap, height, params["root_ratio"], allometry)
+            running.update(columns)
+            if with_per_tree:
+                yield b"".join(_ndjson(row) for row in per_tree_rows(columns))
+    except RowError as exc:
+        yield _ndjson({"error": str(exc), "line": exc.line})
+        return
+
+    if running.n == 0:
+        yield _ndjson({"error": TREES_REQUIRED_MESSAGE})
+        return
+
+    agg = running.aggregates(params["dist_in_row_m"], params["dist_between_rows_m"], params["plot_area_m2"])
+    summary: Dict[str, Any] = plot_summary(agg, params)
+    yield _ndjson({"summary": summary})
@@ -1,5 +1,26 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
 from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
 from .calculations import (
@@ -11,9 +32,28 @@ from .calculations import (
     biomass_above_kg,
     biomass_root_kg,
     trees_per_hectare,
+    carbon_forest_tn_per_ha,
+    aggregate_plot_metrics,
     dominant_height_from_site_index,
     site_index_from_dominant_height,
 )
+from .async_views import AsyncMeasurementListCreateView, AsyncMeasurementRetrieveUpdateDeleteView, AsyncPlotMetricsView
+from .benchmarking import compare_to_baseline, measure, synthetic_trees
+from . import export as export_module, services
+from .cache import LocalResultCache, get_result_cache, payload_key
+from .engine import plot_metrics, tree_columns, trees_to_arrays
+from .jobs import JobRunner, purge_expired
+from .instrumentation import metrics as instrumentation_metrics, phase
+from .parsers import FastJSONParser
+from .payloads import decode_payload, encode_payload, payload_digest
+from .recompute import empty_stats, recompute_range, save_checkpoint
+from .projection import ProjectionPlot, age_grid, trajectory_arrays
+from .renderers import FastJSONRenderer
+from .rotation import refine_maximum
+from .services import compute_batch_item, compute_plot_metrics, compute_record_metrics
+from .models import CalcJob, JobStatus, Measurement, PayloadBlob, Plot, PlotAccumulator, Producer, Species, Tree
+from .species import SpeciesRegistry, registry as species_registry
+from .stored_metrics import accumulator_drift
 
 
 class CalculationsUnitTests(TestCase):
@@ -54,7 +94,132 @@ class CalculationsUnitTests(TestCase):
         self.assertAlmostEqual(si_back, si, places=6)
 
 
+class EngineTests(TestCase):
+    TREES = [
+        {"dap_cm": 28.6, "height_m": 25.9},
+        {"dap_cm": 27.5, "height_m": 28.6},
+        {"dap_cm": 12.0, "height_m": 9.5},
+        {"dap_cm": 3.0, "height_m": 2.1},
+        {"dap_cm": 45.2, "height_m": 31.0},
+    ]
+
+    def test_aggregates_match_scalar_reference(self):
+        _, agg = plot_metrics(self.TREES, 4.0, 3.0, plot_area_m2=250.0, root_ratio=0.3)
+        expected = aggregate_plot_metrics(self.TREES, 4.0, 3.0, plot_area_m2=250.0, root_ratio=0.3)
+        self.assertEqual(agg.keys(), expected.keys())
+        for key, value in expected.items():
+            if value is None:
+                self.assertIsNone(agg[key])
+            else:
+                self.assertAlmostEqual(agg[key], value, places=2, msg=key)
+
+    def test_per_tree_matches_scalar_reference(self):
+        per_tree, _ = plot_metrics(self.TREES, 4.0, 3.0)
+        for tree, row in zip(self.TREES, per_tree):
+            dap, h = tree["dap_cm"], tree["height_m"]
+            b_above = biomass_above_kg(dap, h)
+            self.assertAlmostEqual(row["ab_m2"], basal_area_m2(dap), places=4)
+            self.assertAlmostEqual(row["vol_total_cc_m3"], volume_total_cc_m3(dap, h), places=4)
+            self.assertAlmostEqual(row["vol_total_sc_m3"], volume_total_sc_m3(dap, h), places=4)
+            self.assertAlmostEqual(row["vol_maderable15_cc_m3"], volume_merchantable15_cc_m3(dap, h), places=4)
+            self.assertAlmostEqual(row["vol_maderable15_sc_m3"], volume_merchantable15_sc_m3(dap, h), places=4)
+            self.assertAlmostEqual(row["biomass_above_kg"], b_above, places=3)
+            self.assertAlmostEqual(row["biomass_root_kg"], biomass_root_kg(b_above), places=3)
+
+    def test_empty_plot_matches_scalar_reference(self):
+        per_tree, agg = plot_metrics([], 5.0, 5.0)
+        self.assertEqual(per_tree, [])
+        self.assertEqual(agg, aggregate_plot_metrics([], 5.0, 5.0))
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_synthetic_inventory_is_reproducible_and_realistic(self):
+        trees = synthetic_trees(500, seed=1)
+        self.assertEqual(trees, synthetic_trees(500, seed=1))
+        self.assertTrue(all(2.5 <= t["dap_cm"] <= 120 and 1.5 <= t["height_m"] <= 55 for t in trees))
+
+    def test_measure_and_regression_detection(self):
+        result = measure(lambda: sum(range(1000)), repeat=3, items=1000)
+        self.assertEqual(set(result["latency_ms"]), {"min", "p50", "p95", "p99"})
+        self.assertGreater(result["throughput_per_s"], 0)
+
+        baseline = {"x": {"throughput_per_s": 100.0, "latency_ms": {"p95": 10.0}, "peak_memory_mb": 5.0}}
+        same = {"x": {"throughput_per_s": 95.0, "latency_ms": {"p95": 11.0}, "peak_memory_mb": 5.5}}
+        slower = {"x": {"throughput_per_s": 50.0, "latency_ms": {"p95": 20.0}, "peak_memory_mb": 9.0}}
+        self.assertEqual(compare_to_baseline(same, baseline, 0.25), [])
+        self.assertEqual(len(compare_to_baseline(slower, baseline, 0.25)), 3)
+
+    def test_command_writes_baseline_and_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            args = ["--only", "calc", "--sizes", "10", "--repeat", "1", "--baseline", path]
+            call_command("run_benchmarks", *args, "--save-baseline", stdout=io.StringIO())
+            with open(path, encoding="utf-8") as fh:
+                saved = json.load(fh)
+            self.assertIn("engine.plot_metrics[10]", saved["results"])
+
+            # Baseline imposible de alcanzar: el comando debe fallar
+            for result in saved["results"].values():
+                result["throughput_per_s"] *= 1000
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(saved, fh)
+            with self.assertRaises(CommandError):
+                call_command("run_benchmarks", *args, stdout=io.StringIO())
+
+
+class FastJSONTests(TestCase):
+    def test_renderer_output_is_byte_identical(self):
+        plot = {"trees": synthetic_trees(300, seed=3), "distance_in_row_m": 3.0, "distance_between_rows_m": 3.0, "age_years": 15}
+        edge = {
+            "floats": [0.0, -0.0, 0.1, 1 / 3, 1e-4, 1.5e-5, 2.5e-7, 1e15, 1e16, 1.2345678901234568e+17, 3.0],
+            "ints": [0, -1, 2 ** 63 - 1, 2 ** 70],
+            "text": "ñandú \u2028 línea",
+            "when": datetime(2025, 11, 11, 19, 30, tzinfo=dt_timezone.utc),
+            "numpy": np.float64(0.263),
+        }
+        for data in (compute_plot_metrics(plot, "rows"), compute_plot_metrics(plot, "columns"), edge):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(FastJSONRenderer().render(edge, indented), JSONRenderer().render(edge, indented))
+
+    def test_parser_matches_drf(self):
+        bodies = [
+            json.dumps({"trees": synthetic_trees(50, seed=4), "age_years": 15}).encode(),
+            b'{"big": 123456789012345678901234567890, "x": 1e-05}',
+        ]
+        for body in bodies:
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for invalid in (b'{"x": NaN}', b'{"x": '):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalid))
+
+
 class PlotMetricsAPITests(APITestCase):
+    def test_non_positive_or_non_finite_trees_are_rejected(self):
+        # Producirían NaN en la biomasa: 400 en todas las rutas de cálculo, nunca null en la salida
+        base = {"distance_in_row_m": 5.0, "distance_between_rows_m": 5.0}
+        for tree in ({"dap_cm": 30.0, "height_m": -5}, {"dap_cm": -1, "height_m": 20.0}, {"dap_cm": 30.0}):
+            trees = [{"dap_cm": 25.0, "height_m": 18.0}, tree]
+            for url, payload in (
+                (reverse('plot-metrics'), dict(base, trees=trees)),
+                (reverse('measurement-list-create'), {"input_data": dict(base, trees=trees)}),
+            ):
+                resp = self.client.post(url, data=payload, format='json')
+                self.assertEqual(resp.status_code, 400)
+                self.assertIn("Árbol 1", resp.json()["detail"])
+        body = '[{"trees": [{"dap_cm": 1e400, "height_m": 3}], "distance_in_row_m": 5}]'
+        resp = self.client.generic('POST', reverse('plot-metrics-batch'), body, content_type='application/json')
+        self.assertFalse(resp.json()["results"][0]["ok"])
+        for url in (reverse('plot-metrics'), reverse('plot-projection')):
+            payload = dict(base, trees=trees[:1], distance_in_row_m=1e-160, distance_between_rows_m=1e-160, age_years=10, site_index_m=20)
+            resp = self.client.post(url, data=payload, format='json')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("densidad", resp.json()["detail"])
+        body = '{"input_data": {"trees": [{"dap_cm": 30, "height_m": 20}], "distance_in_row_m": 1e400}}'
+        resp = self.client.generic('POST', reverse('measurement-list-create'), body, content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("distance_in_row_m", resp.json()["detail"])
+
     def test_plot_metrics_endpoint_calculates_expected_values(self):
         url = reverse('plot-metrics')
         payload = {
@@ -92,3 +257,1245 @@ class PlotMetricsAPITests(APITestCase):
         self.assertEqual(round((b_above) * tph / 1000.0, 2), agg['biomass_above_tn_per_ha'])
         self.assertEqual(round((b_root) * tph / 1000.0, 2), agg['biomass_root_tn_per_ha'])
         self.assertEqual(round(((b_above + b_root) * tph) / 1000.0, 2), agg['biomass_total_tn_per_ha'])
+
+    def _post_metrics(self, **extra):
+        payload = {
+            "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 22.0, "height_m": 15.5}],
+            "distance_in_row_m": 4.0,
+            "distance_between_rows_m": 4.0,
+            "age_years": 12,
+        }
+        payload.update(extra)
+        resp = self.client.post(reverse('plot-metrics'), data=payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_per_tree_output_formats_keep_aggregates(self):
+        rows = self._post_metrics()
+        columns = self._post_metrics(per_tree="columns")
+        omitted = self._post_metrics(per_tree="none")
+
+        self.assertEqual(columns["aggregates"], rows["aggregates"])
+        self.assertEqual(omitted["aggregates"], rows["aggregates"])
+        self.assertIsNone(omitted["per_tree"])
+        self.assertEqual(set(columns["per_tree"]), set(rows["per_tree"][0]))
+        for key, values in columns["per_tree"].items():
+            self.assertEqual(values, [row[key] for row in rows["per_tree"]])
+
+    def test_per_tree_query_param_and_invalid_value(self):
+        resp = self.client.post(reverse('plot-metrics') + '?per_tree=0', data={
+            "trees": [{"dap_cm": 30.0, "height_m": 20.0}],
+        }, format='json')
+        self.assertIsNone(resp.json()["per_tree"])
+        resp = self.client.post(reverse('plot-metrics'), data={
+            "trees": [{"dap_cm": 30.0, "height_m": 20.0}], "per_tree": "matrix",
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+
+class PlotMetricsBatchAPITests(APITestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+        "distance_in_row_m": 5.0,
+        "distance_between_rows_m": 5.0,
+        "age_years": 10,
+    }
+
+    def test_batch_matches_single_endpoint_and_reports_errors_per_item(self):
+        single = self.client.post(reverse('plot-metrics'), data=self.PLOT, format='json').json()
+        payload = {"plots": [self.PLOT, {"trees": []}, dict(self.PLOT, stand_area_ha=2.0)]}
+
+        resp = self.client.post(reverse('plot-metrics-batch'), data=payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+
+        self.assertEqual([r["ok"] for r in data["results"]], [True, False, True])
+        self.assertEqual(data["results"][0]["result"], single)
+        self.assertIn("trees", data["results"][1]["error"])
+        estate = data["estate"]
+        self.assertEqual(estate["plots_ok"], 2)
+        self.assertEqual(estate["plots_failed"], 1)
+        self.assertEqual(estate["trees_count"], 4)
+        self.assertEqual(estate["stand_area_ha"], 2.0)
+        vol = single["aggregates"]["vol_total_cc_per_ha_m3"]
+        self.assertAlmostEqual(estate["mean_per_ha"]["vol_total_cc_per_ha_m3"], vol, places=2)
+        self.assertAlmostEqual(estate["totals"]["vol_total_cc_m3"], vol * 2.0, places=2)
+        self.assertFalse(estate["weighted_by_area"])
+
+    def test_batch_recovers_from_broken_pool(self):
+        pool = services._get_executor(2)
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+        results = services.compute_batch([self.PLOT] * 4, parallel_min_plots=2, max_workers=2)
+        self.assertTrue(all(r["ok"] for r in results))
+        self.assertIsNot(services._executor, pool)
+
+    def test_estate_area_validation(self):
+        url = reverse('plot-metrics-batch')
+        body = '{"plots": [%s, %s, %s]}' % tuple(
+            json.dumps(dict(self.PLOT, stand_area_ha=area)) for area in (1.0, 3.0, -1.0)
+        )
+        data = self.client.generic('POST', url, body.replace('-1.0', '1e400'), content_type='application/json').json()
+        self.assertEqual([r["ok"] for r in data["results"]], [True, True, False])
+        self.assertIn("stand_area_ha", data["results"][2]["error"])
+        self.assertTrue(data["estate"]["weighted_by_area"])
+        self.assertEqual(data["estate"]["stand_area_ha"], 4.0)
+
+        resp = self.client.post(url, data={"plots": [dict(self.PLOT, stand_area_ha=-2.0)]}, format='json')
+        self.assertFalse(resp.json()["results"][0]["ok"])
+        resp = self.client.post(url, data={"plots": [dict(self.PLOT, stand_area_ha=1e308)] * 2}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+    @override_settings(CIEFAP_BATCH_PARALLEL_MIN_PLOTS=2, CIEFAP_BATCH_MAX_WORKERS=2)
+    def test_batch_parallel_keeps_order(self):
+        plots = [dict(self.PLOT, age_years=age) for age in range(1, 9)]
+        resp = self.client.post(reverse('plot-metrics-batch'), data=plots, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()["results"]
+        self.assertEqual([r["index"] for r in results], list(range(8)))
+        self.assertEqual([r["result"]["site"]["age_years"] for r in results], [float(a) for a in range(1, 9)])
+
+    def test_batch_requires_plots(self):
+        resp = self.client.post(reverse('plot-metrics-batch'), data={"plots": []}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch_reports_non_finite_parameters_per_item(self):
+        # 1e400 es JSON válido y se lee como inf
+        plot = json.dumps(self.PLOT)
+        body = '{"plots": [%s, %s, %s]}' % (
+            plot, plot[:-1] + ', "min_trees_for_plot": 1e400}', plot[:-1] + ', "plot_area_m2": -1e400}',
+        )
+        resp = self.client.generic('POST', reverse('plot-metrics-batch'), body, content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()["results"]
+        self.assertEqual([r["ok"] for r in results], [True, False, False])
+        self.assertIn("min_trees_for_plot", results[1]["error"])
+        self.assertIn("plot_area_m2", results[2]["error"])
+        self.assertFalse(compute_batch_item(0, dict(self.PLOT, site_index_m=float("nan")))["ok"])
+
+
+class PendingExecutor(Executor):
+    # Tareas que nunca terminan: trabajos que quedan en ejecución
+    def submit(self, fn, *args, **kwargs):
+        return Future()
+
+
+class NaNResultExecutor(Executor):
+    # Tareas que terminan con un resultado que no se puede guardar como JSON
+    def submit(self, fn, start, chunk, *args, **kwargs):
+        future = Future()
+        future.set_result([{"index": start + i, "ok": True, "result": {"value": float("nan")}} for i in range(len(chunk))])
+        return future
+
+
+class CalcJobTests(APITestCase):
+    PLOT = PlotMetricsBatchAPITests.PLOT
+
+    def submit(self, kind, payload):
+        response = self.client.post(reverse('calc-job-create'), data={"kind": kind, "payload": payload}, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        return response.json()["id"]
+
+    def status(self, job_id):
+        return self.client.get(reverse('calc-job-detail', args=[job_id])).json()
+
+    def test_batch_job_matches_sync_endpoint(self):
+        payload = {"plots": [self.PLOT, {"trees": []}, dict(self.PLOT, stand_area_ha=2.0)]}
+        job_id = self.submit("batch", payload)
+        self.assertEqual(self.status(job_id)["status"], "queued")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            JobRunner(executor=executor).drain()
+        state = self.status(job_id)
+        self.assertEqual(state["status"], "succeeded")
+        self.assertEqual(state["progress"], {"done": 3, "total": 3, "percent": 100.0})
+        self.assertIsNotNone(state["expires_at"])
+
+        result = self.client.get(reverse('calc-job-result', args=[job_id]))
+        sync = self.client.post(reverse('plot-metrics-batch'), data=payload, format='json')
+        self.assertEqual(result.json(), sync.json())
+
+    @override_settings(CIEFAP_JOBS={"CHUNK_SIZE": 2})
+    def test_process_pool_runner_command(self):
+        job_id = self.submit("metrics", self.PLOT)
+        batch_id = self.submit("batch", [dict(self.PLOT, age_years=age) for age in range(1, 6)])
+        call_command('run_calc_jobs', '--once', '--workers', '2', stdout=io.StringIO())
+
+        single = self.client.post(reverse('plot-metrics'), data=self.PLOT, format='json').json()
+        self.assertEqual(self.client.get(reverse('calc-job-result', args=[job_id])).json(), single)
+        results = self.client.get(reverse('calc-job-result', args=[batch_id])).json()["results"]
+        self.assertEqual([r["result"]["site"]["age_years"] for r in results], [float(a) for a in range(1, 6)])
+
+    def test_failed_job_reports_error(self):
+        job_id = self.submit("metrics", {"trees": []})
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            JobRunner(executor=executor).drain()
+        self.assertEqual(self.status(job_id)["status"], "failed")
+        response = self.client.get(reverse('calc-job-result', args=[job_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("trees", response.json()["error"])
+
+    def test_unsaveable_result_fails_job_and_runner_keeps_going(self):
+        broken = self.submit("metrics", self.PLOT)
+        JobRunner(executor=NaNResultExecutor()).drain()
+        self.assertEqual(self.status(broken)["status"], "failed")
+        self.assertTrue(CalcJob.objects.get(pk=broken).error)
+
+        job_id = self.submit("metrics", self.PLOT)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            JobRunner(executor=executor).drain()
+        self.assertEqual(self.status(job_id)["status"], "succeeded")
+
+    def test_concurrency_limit_and_cancellation(self):
+        first = self.submit("metrics", self.PLOT)
+        second = self.submit("metrics", self.PLOT)
+        runner = JobRunner(max_concurrent=1, executor=PendingExecutor())
+        self.assertTrue(runner.run_once())
+        self.assertEqual([self.status(first)["status"], self.status(second)["status"]], ["running", "queued"])
+        self.assertEqual(self.client.get(reverse('calc-job-result', args=[first])).status_code, 409)
+
+        # En cola: se cancela en el acto; en ejecución: cuando el runner vuelve a mirar
+        self.assertEqual(self.client.post(reverse('calc-job-cancel', args=[second])).status_code, 200)
+        response = self.client.post(reverse('calc-job-cancel', args=[first]))
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()["cancel_requested"])
+        self.assertFalse(runner.run_once())
+        self.assertEqual([self.status(first)["status"], self.status(second)["status"]], ["cancelled", "cancelled"])
+
+    def test_stale_jobs_are_requeued_and_results_expire(self):
+        job_id = self.submit("metrics", self.PLOT)
+        JobRunner(executor=PendingExecutor(), name="caido").run_once()
+        CalcJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        runner = JobRunner(executor=ThreadPoolExecutor(max_workers=1))
+        self.assertEqual(runner.recover_stale(), 1)
+        runner.drain()
+        self.assertEqual(self.status(job_id)["status"], "succeeded")
+
+        CalcJob.objects.filter(pk=job_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(reverse('calc-job-result', args=[job_id])).status_code, 410)
+        self.assertEqual(purge_expired(), 1)
+        self.assertEqual(self.client.get(reverse('calc-job-detail', args=[job_id])).status_code, 404)
+
+    @override_settings(CIEFAP_JOBS={"MAX_QUEUED": 1, "MAX_PLOTS": 2})
+    def test_submission_validation(self):
+        url = reverse('calc-job-create')
+        self.assertEqual(self.client.post(url, data={"kind": "otro", "payload": {}}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, data={"kind": "batch", "payload": {"plots": [self.PLOT] * 3}}, format='json').status_code, 400)
+        self.submit("batch", [self.PLOT])
+        response = self.client.post(url, data={"kind": "metrics", "payload": self.PLOT}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(CalcJob.objects.filter(status=JobStatus.QUEUED).count(), 1)
+
+class PlotProjectionAPITests(APITestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+        "distance_in_row_m": 5.0,
+        "distance_between_rows_m": 5.0,
+        "age_years": 10,
+        "dominant_height_m": 19.0,
+    }
+
+    def test_projection_at_measured_age_matches_metrics(self):
+        metrics = self.client.post(reverse('plot-metrics'), data=self.PLOT, format='json').json()
+        resp = self.client.post(reverse('plot-projection'), data=dict(self.PLOT, ages=[5, 10, 20]), format='json')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["ages"], [5.0, 10.0, 20.0])
+        trajectory = data["trajectory"]
+        self.assertEqual(trajectory["dominant_height_m"][1], 19.0)
+        for key in ("ab_per_ha_m2", "vol_total_cc_per_ha_m3", "vol_merchantable15_sc_per_ha_m3", "biomass_total_tn_per_ha"):
+            self.assertAlmostEqual(trajectory[key][1], metrics["aggregates"][key], places=2)
+        self.assertAlmostEqual(trajectory["c_bosque_tn_per_ha"][1], metrics["carbon"]["c_bosque_tn_per_ha"], delta=0.02)
+        # El volumen crece con la altura dominante
+        self.assertLess(trajectory["vol_total_cc_per_ha_m3"][0], trajectory["vol_total_cc_per_ha_m3"][2])
+
+    def test_batch_projection_over_age_grid(self):
+        payload = {
+            "plots": [self.PLOT, dict(self.PLOT, site_index_m=22.0)],
+            "ages": {"start": 5, "stop": 30, "step": 5},
+        }
+        data = self.client.post(reverse('plot-projection'), data=payload, format='json').json()
+        self.assertEqual(data["ages"], [5.0, 10.0, 15.0, 20.0, 25.0, 30.0])
+        self.assertEqual(len(data["results"]), 2)
+        # Índice de sitio: altura dominante a la edad base (10 años)
+        self.assertEqual(data["results"][1]["trajectory"]["dominant_height_m"][1], 22.0)
+        self.assertEqual(data["results"][0]["site_index_m"], 19.0)
+
+    def test_projection_reports_invalid_plot(self):
+        resp = self.client.post(reverse('plot-projection'), data={"plots": [self.PLOT, {"trees": []}]}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("Parcela 1", resp.json()["detail"])
+        resp = self.client.post(reverse('plot-projection'), data=dict(self.PLOT, ages=[0, 5]), format='json')
+        self.assertEqual(resp.status_code, 400)
+        for site_index in (0, -5.0):
+            resp = self.client.post(reverse('plot-projection'), data=dict(self.PLOT, site_index_m=site_index), format='json')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("site_index_m", resp.json()["detail"])
+
+    def test_projection_rejects_oversized_grid_before_building_it(self):
+        with self.assertRaisesMessage(ValueError, "como máximo 500"):
+            age_grid(1.0, 1e12, 1.0, max_points=500)
+        with self.assertRaisesMessage(ValueError, "finitos"):
+            age_grid(1.0, float("inf"), 1.0)
+        for ages in ({"start": 1, "stop": 2e7, "step": 1}, {"start": 1, "stop": 40, "step": 1e-9}):
+            resp = self.client.post(reverse('plot-projection'), data=dict(self.PLOT, ages=ages), format='json')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("como máximo", resp.json()["detail"])
+
+
+class PlotRotationAPITests(APITestCase):
+    PLOT = PlotProjectionAPITests.PLOT
+
+    def test_rotation_matches_fine_grid_sweep(self):
+        resp = self.client.post(reverse('plot-rotation'), data=dict(self.PLOT, site_indices=[14.0, 19.0, 24.0]), format='json')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["metric"], "vol_total_cc_per_ha_m3")
+        self.assertEqual([r["site_index_m"] for r in data["results"]], [14.0, 19.0, 24.0])
+
+        ages = np.arange(1.0, 60.0, 0.001)
+        volume = trajectory_arrays([ProjectionPlot(self.PLOT)], ages)["vol_total_cc_per_ha_m3"][0]
+        mai = volume / ages
+        result = data["results"][1]
+        self.assertAlmostEqual(result["rotation_age_years"], ages[mai.argmax()], delta=0.02)
+        self.assertAlmostEqual(result["mai_per_year"], mai.max(), places=3)
+        self.assertFalse(result["at_grid_edge"])
+        # Mayor índice de sitio, mayor incremento medio
+        self.assertLess(data["results"][0]["mai_per_year"], data["results"][2]["mai_per_year"])
+
+    def test_carbon_rotation_reports_animals_peak(self):
+        data = self.client.post(reverse('plot-rotation'), data=dict(self.PLOT, metric="carbon"), format='json').json()
+        result = data["results"][0]
+        self.assertEqual(data["metric"], "c_bosque_tn_per_ha")
+        # La captura diaria es el IMA de carbono: ambos máximos coinciden
+        self.assertAlmostEqual(result["animals_peak"]["age_years"], result["rotation_age_years"], places=1)
+        self.assertGreater(result["animals_peak"]["animals_per_ha_equilibrium"], 0)
+
+    def test_rotation_with_explicit_ages_does_not_depend_on_order_or_spacing(self):
+        results = [
+            self.client.post(reverse('plot-rotation'), data=dict(self.PLOT, ages=ages), format='json').json()["results"][0]
+            for ages in ([5, 10, 40], [40, 10, 5], [10, 40, 5, 10])
+        ]
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        # Parábola por tres puntos con separación desigual: vértice exacto
+        peak = refine_maximum(np.array([5.0, 10.0, 40.0]), -(np.array([[5.0, 10.0, 40.0]]) - 12.0) ** 2)
+        self.assertAlmostEqual(float(peak["age"][0]), 12.0, places=9)
+        self.assertAlmostEqual(float(peak["value"][0]), 0.0, places=9)
+
+    def test_rotation_rejects_unknown_metric(self):
+        resp = self.client.post(reverse('plot-rotation'), data=dict(self.PLOT, metric="height"), format='json')
+        self.assertEqual(resp.status_code, 400)
+        site_only = {key: value for key, value in self.PLOT.items() if key != "trees"}
+        resp = self.client.post(reverse('plot-rotation'), data=dict(site_only, site_indices=[20.0]), format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("trees", resp.json()["detail"])
+        body = json.dumps(dict(self.PLOT, site_indices=[20.0, 0.0])).replace("0.0]", "1e400]")
+        resp = self.client.generic('POST', reverse('plot-rotation'), body, content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("finitos", resp.json()["detail"])
+
+
+class UncertaintyTests(APITestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 20.0 + i % 15, "height_m": 14.0 + i % 9} for i in range(200)],
+        "distance_in_row_m": 3.0,
+        "distance_between_rows_m": 3.0,
+        "per_tree": "none",
+    }
+
+    def test_bands_bracket_point_estimate_and_are_reproducible(self):
+        payload = dict(self.PLOT, uncertainty={"replicates": 500, "seed": 3})
+        resp = self.client.post(reverse('plot-metrics'), data=payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        bands = data["uncertainty"]["bands"]
+        for key in ("vol_total_cc_per_ha_m3", "biomass_total_tn_per_ha"):
+            self.assertLess(bands[key]["p2.5"], data["aggregates"][key])
+            self.assertGreater(bands[key]["p97.5"], data["aggregates"][key])
+        self.assertLess(bands["c_bosque_tn_per_ha"]["p2.5"], data["carbon"]["c_bosque_tn_per_ha"])
+
+        get_result_cache().clear()
+        again = self.client.post(reverse('plot-metrics'), data=payload, format='json').json()
+        self.assertEqual(again["uncertainty"], data["uncertainty"])
+        other = self.client.post(reverse('plot-metrics'), data=dict(payload, uncertainty={"replicates": 500, "seed": 4}), format='json').json()
+        self.assertNotEqual(other["uncertainty"]["bands"], data["uncertainty"]["bands"])
+
+    def test_without_noise_bands_collapse_to_point_estimate(self):
+        options = {"replicates": 10, "bootstrap": False, "coefficient_cv": 0, "exponent_cv": 0, "root_ratio_cv": 0}
+        # Con área de parcela la densidad no es entera: 2 árboles en 1500 m² = 13.33 árboles/ha
+        trees = [{"dap_cm": 20.0, "height_m": 15.0}, {"dap_cm": 28.0, "height_m": 19.0}]
+        for plot in (self.PLOT, {"trees": trees, "plot_area_m2": 1500, "per_tree": "none"}):
+            data = self.client.post(reverse('plot-metrics'), data=dict(plot, uncertainty=options), format='json').json()
+            columns = tree_columns(*trees_to_arrays(plot["trees"]), 0.263)
+            tph = 2 * 10000.0 / 1500 if "plot_area_m2" in plot else 10000.0 / 9.0
+            per_ha = tph / len(plot["trees"])
+            biomass_total = (columns["biomass_above_kg"].sum() + columns["biomass_root_kg"].sum()) * per_ha / 1000.0
+            expected = {
+                "vol_total_cc_per_ha_m3": columns["vol_total_cc_m3"].sum() * per_ha,
+                "biomass_total_tn_per_ha": biomass_total,
+                "c_bosque_tn_per_ha": carbon_forest_tn_per_ha(biomass_total),
+            }
+            bands = data["uncertainty"]["bands"]
+            for key, value in expected.items():
+                self.assertAlmostEqual(bands[key]["mean"], round(value, 4), delta=1e-9)
+                self.assertAlmostEqual(bands[key]["p50"], round(value, 4), delta=1e-9)
+                self.assertEqual(bands[key]["std"], 0.0)
+            self.assertEqual(round(bands["vol_total_cc_per_ha_m3"]["mean"], 2), data["aggregates"]["vol_total_cc_per_ha_m3"])
+
+    def test_invalid_options(self):
+        cases = (
+            ({"replicates": 0}, "'replicates' debe estar entre"),
+            ({"percentiles": 5}, "'percentiles' debe ser una lista"),
+            ({"bootstrap": "false"}, "'bootstrap' debe ser true o false"),
+            ({"coefficient_cv": 5}, "'coefficient_cv' debe estar entre 0 y 1"),
+            ({"exponent_cv": "nan"}, "'exponent_cv' debe ser un número finito"),
+            ({"seed": 1.5}, "'seed' debe ser un número entero"),
+        )
+        for options, message in cases:
+            resp = self.client.post(reverse('plot-metrics'), data=dict(self.PLOT, uncertainty=options), format='json')
+            self.assertEqual(resp.status_code, 400, options)
+            self.assertIn(message, resp.json()["detail"])
+
+
+class PlotMetricsStreamAPITests(APITestCase):
+    TREES = [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}, {"dap_cm": 12.5, "height_m": 9.0}]
+    QUERY = "?distance_in_row_m=5&distance_between_rows_m=5&age_years=10"
+
+    def _post_stream(self, body, content_type, query=QUERY):
+        resp = self.client.generic('POST', reverse('plot-metrics-stream') + query, body, content_type=content_type)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+
+    def test_ndjson_stream_matches_json_endpoint(self):
+        expected = self.client.post(reverse('plot-metrics'), data={
+            "trees": self.TREES, "distance_in_row_m": 5, "distance_between_rows_m": 5, "age_years": 10,
+        }, format='json').json()
+        body = "\n".join(json.dumps(t) for t in self.TREES)
+
+        lines = self._post_stream(body, 'application/x-ndjson')
+        self.assertEqual(lines[:-1], expected["per_tree"])
+        summary = lines[-1]["summary"]
+        self.assertEqual(summary["aggregates"], expected["aggregates"])
+        self.assertEqual(summary["carbon"], expected["carbon"])
+
+    def test_csv_stream_with_header_and_without_per_tree(self):
+        body = "height_m,dap_cm\n20,30\n18,25\n9,12.5\n"
+        lines = self._post_stream(body, 'text/csv', self.QUERY + "&per_tree=0")
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["summary"]["aggregates"]["trees_count"], 3)
+        self.assertEqual(lines[0]["summary"]["aggregates"]["dap_mean_cm"], 22.5)
+
+    def test_stream_reports_bad_rows_inline(self):
+        lines = self._post_stream("30,20\nabc,1\n", 'text/csv')
+        self.assertEqual(lines[-1]["line"], 2)
+        self.assertIn("error", lines[-1])
+        lines = self._post_stream('{"dap_cm": 30, "height_m": 20}\n{"dap_cm": 30, "height_m": -5}\n', 'application/x-ndjson')
+        self.assertEqual(lines[-1]["line"], 2)
+        self.assertIn("mayores que 0", lines[-1]["error"])
+
+    def test_stream_rejects_unknown_content_type(self):
+        resp = self.client.generic('POST', reverse('plot-metrics-stream'), "{}", content_type='application/json')
+        self.assertEqual(resp.status_code, 415)
+
+    def test_stream_rejects_per_tree_columns(self):
+        url = reverse('plot-metrics-stream') + self.QUERY + "&per_tree=columns"
+        resp = self.client.generic('POST', url, json.dumps(self.TREES[0]), content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("per_tree", resp.json()["detail"])
+
+
+class ResultCacheTests(APITestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+        "distance_in_row_m": 5.0,
+        "distance_between_rows_m": 5.0,
+        "age_years": 10,
+    }
+
+    def setUp(self):
+        get_result_cache().clear()
+
+    def test_repeat_request_is_served_from_cache(self):
+        url = reverse('plot-metrics')
+        first = self.client.post(url, data=self.PLOT, format='json')
+        second = self.client.post(url, data=self.PLOT, format='json')
+        other = self.client.post(url, data=dict(self.PLOT, distance_in_row_m=4.0), format='json')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(other['X-Cache'], 'MISS')
+        self.assertEqual(first.json(), second.json())
+        stats = self.client.get(reverse('plot-metrics-cache')).json()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 2))
+
+    def test_key_is_canonical(self):
+        same = dict(self.PLOT, distance_in_row_m="5", age_years=10.0)
+        self.assertEqual(payload_key(self.PLOT, "rows"), payload_key(same, "rows"))
+        self.assertNotEqual(payload_key(self.PLOT, "rows"), payload_key(self.PLOT, "none"))
+        reordered = dict(self.PLOT, trees=list(reversed(self.PLOT["trees"])))
+        self.assertNotEqual(payload_key(self.PLOT, "rows"), payload_key(reordered, "rows"))
+
+    def test_local_cache_lru_and_ttl(self):
+        now = [0.0]
+        cache = LocalResultCache(max_entries=2, ttl=10.0, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # desaloja 'b', el menos usado
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        now[0] = 11.0
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_local_cache_is_bounded_by_bytes(self):
+        rows = lambda n: {"per_tree": [{}] * n}
+        cache = LocalResultCache(max_entries=100, ttl=60.0, max_bytes=200_000, max_entry_bytes=100_000)
+        cache.set("huge", rows(1000))  # ~520 KB estimados: no se guarda
+        self.assertIsNone(cache.get("huge"))
+        for key in ("a", "b", "c"):
+            cache.set(key, rows(150))  # ~82 KB cada uno: el tercero desaloja al primero
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache.get("c")["per_tree"]), 150)
+        self.assertLessEqual(cache.stats()["bytes"], 200_000)
+
+    @override_settings(CIEFAP_RESULT_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TTL': 60})
+    def test_clearing_django_cache_drops_results(self):
+        url = reverse('plot-metrics')
+        self.client.post(url, data=self.PLOT, format='json')
+        self.assertEqual(self.client.post(url, data=self.PLOT, format='json')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.delete(reverse('plot-metrics-cache')).status_code, 204)
+        self.assertEqual(self.client.post(url, data=self.PLOT, format='json')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('plot-metrics-cache')).json()["misses"], 1)
+
+    @override_settings(CIEFAP_RESULT_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TTL': 60})
+    def test_django_cache_backend(self):
+        url = reverse('plot-metrics')
+        self.client.post(url, data=self.PLOT, format='json')
+        resp = self.client.post(url, data=self.PLOT, format='json')
+        self.assertEqual(resp['X-Cache'], 'HIT')
+        stats = self.client.get(reverse('plot-metrics-cache')).json()
+        self.assertEqual(stats["backend"], "django")
+        self.assertGreaterEqual(stats["hits"], 1)
+
+
+@override_settings(CIEFAP_INSTRUMENTATION={"ENABLED": True, "PROFILE_TOKEN": "secreto"})
+class InstrumentationTests(APITestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+        "distance_in_row_m": 5.0,
+        "distance_between_rows_m": 5.0,
+    }
+
+    def setUp(self):
+        get_result_cache().clear()
+        instrumentation_metrics.clear()
+
+    def test_server_timing_and_prometheus_metrics(self):
+        response = self.client.post(reverse('plot-metrics'), data=self.PLOT, format='json')
+        timing = response['Server-Timing']
+        for name in ('parse;dur=', 'per_tree;dur=', 'aggregate;dur=', 'render;dur=', 'db;dur=', 'trees;desc="2"', 'total;dur='):
+            self.assertIn(name, timing)
+
+        created = self.client.post(reverse('measurement-list-create'), data={"input_data": self.PLOT}, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertIn('db_write;dur=', created['Server-Timing'])
+        self.assertNotIn('desc="0 queries"', created['Server-Timing'])
+
+        exposition = self.client.get(reverse('prometheus-metrics'))
+        self.assertTrue(exposition['Content-Type'].startswith('text/plain'))
+        text = exposition.content.decode()
+        self.assertIn('ciefap_trees_total{method="POST",view="plot-metrics"} 2', text)
+        self.assertIn('ciefap_phase_duration_seconds_count{method="POST",phase="db_write",view="measurement-list-create"} 1', text)
+
+    def test_profile_dump_on_demand(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {"ENABLED": True, "PROFILE_TOKEN": "secreto", "PROFILE_DIR": tmp}
+            with override_settings(CIEFAP_INSTRUMENTATION=config):
+                self.client = self.client_class()
+                url = reverse('plot-metrics')
+                plain = self.client.post(url, data=self.PLOT, format='json')
+                wrong = self.client.post(url, data=self.PLOT, format='json', HTTP_X_CIEFAP_PROFILE='otro')
+                profiled = self.client.post(url, data=self.PLOT, format='json', HTTP_X_CIEFAP_PROFILE='secreto')
+            self.assertNotIn('X-Ciefap-Profile-Dump', plain)
+            self.assertNotIn('X-Ciefap-Profile-Dump', wrong)
+            self.assertTrue(os.path.exists(os.path.join(tmp, profiled['X-Ciefap-Profile-Dump'])))
+
+    @override_settings(CIEFAP_INSTRUMENTATION={"ENABLED": False})
+    def test_disabled_is_transparent(self):
+        self.client = self.client_class()
+        response = self.client.post(reverse('plot-metrics'), data=self.PLOT, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('prometheus-metrics')).status_code, 404)
+        with phase("nada") as marker:
+            self.assertIsNotNone(marker)
+
+
+class MeasurementListAPITests(APITestCase):
+    def setUp(self):
+        self.plot_a = Plot.objects.create()
+        self.plot_b = Plot.objects.create()
+        for i in range(5):
+            Measurement.objects.create(
+                plot=self.plot_a if i % 2 == 0 else self.plot_b,
+                input_data={"trees": [{"dap_cm": 20.0 + i, "height_m": 15.0}]},
+                metrics={"trees_count": 1},
+            )
+
+    def test_cursor_pagination_walks_all_rows_newest_first(self):
+        url = reverse('measurement-list-create') + '?page_size=2'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data["results"]), 2)
+            seen += [row["id"] for row in data["results"]]
+            url = data["next"]
+        expected = list(Measurement.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_fields_projection_drops_heavy_columns(self):
+        resp = self.client.get(reverse('measurement-list-create') + '?fields=id,created_at')
+        row = resp.json()["results"][0]
+        self.assertEqual(set(row), {"id", "created_at"})
+        resp = self.client.get(reverse('measurement-list-create') + '?fields=id,bogus')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_filters_by_plot_and_date_range(self):
+        url = reverse('measurement-list-create')
+        data = self.client.get(url, {"plot": self.plot_a.pk}).json()
+        self.assertEqual(len(data["results"]), 3)
+        self.assertTrue(all(row["plot"] == self.plot_a.pk for row in data["results"]))
+        self.assertEqual(len(self.client.get(url, {"created_after": "2999-01-01"}).json()["results"]), 0)
+        self.assertEqual(len(self.client.get(url, {"created_before": "2999-01-01"}).json()["results"]), 5)
+        self.assertEqual(self.client.get(url, {"created_after": "ayer"}).status_code, 400)
+
+    def test_invalid_cursor_returns_404(self):
+        resp = self.client.get(reverse('measurement-list-create') + '?cursor=zzz')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_conditional_get_returns_304_without_serializing(self):
+        url = reverse('measurement-list-create') + '?page_size=2'
+        first = self.client.get(url)
+        etag = first['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertNotIn('Last-Modified', first)
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((cached.status_code, cached.content), (304, b''))
+        self.assertEqual(self.client.get(url + '&fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Measurement.objects.create(input_data={"trees": []}, metrics={"trees_count": 0})
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_list_ignores_if_modified_since_after_delete(self):
+        url = reverse('measurement-list-create') + '?page_size=2'
+        first = self.client.get(url)
+        newest = first.json()["results"][0]["id"]
+        since = http_date(time.time() + 3600)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        # Borrar la más reciente desplaza la página sin cambiar ningún updated_at
+        self.client.delete(reverse('measurement-rud', args=[newest]))
+        changed = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotIn(newest, [row["id"] for row in changed.json()["results"]])
+
+    def test_detail_etag_changes_on_update(self):
+        record = Measurement.objects.first()
+        url = reverse('measurement-rud', args=[record.pk])
+        detail = self.client.get(url)
+        etag = detail['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=detail['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.patch(url, data={"metrics": {"trees_count": 2}}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('measurement-rud', args=[10 ** 6]), HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    @override_settings(CIEFAP_COMPRESSION={"ENABLED": True, "MIN_SIZE": 200})
+    def test_large_responses_are_compressed(self):
+        self.client = self.client_class()
+        url = reverse('measurement-list-create')
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=compressed['ETag']).status_code, 304)
+
+        refused = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        small = self.client.get(url + '?fields=id&page_size=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+class AsyncViewTests(TestCase):
+    PLOT = {
+        "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+        "distance_in_row_m": 5.0,
+        "distance_between_rows_m": 5.0,
+    }
+
+    def setUp(self):
+        get_result_cache().clear()
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view_class, request, **kwargs):
+        response = await view_class.as_view()(request, **kwargs)
+        response.render()
+        return response
+
+    def test_middleware_chain_is_fully_async_capable(self):
+        # Un middleware solo sincrónico haría pasar cada pedido ASGI por un hilo
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), 'async_capable', False), path)
+
+    async def test_calc_matches_sync_view(self):
+        body = json.dumps(self.PLOT)
+        response = await self.call(AsyncPlotMetricsView, self.factory.post('/api/calc/metrics', body, content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), compute_plot_metrics(self.PLOT, "rows"))
+        bad = await self.call(AsyncPlotMetricsView, self.factory.post('/api/calc/metrics', '{"trees": []}', content_type='application/json'))
+        self.assertEqual(bad.status_code, 400)
+
+    async def test_records_create_list_and_detail(self):
+        body = json.dumps({"input_data": self.PLOT})
+        created = await self.call(AsyncMeasurementListCreateView, self.factory.post('/api/records', body, content_type='application/json'))
+        self.assertEqual(created.status_code, 201)
+        record = await Measurement.objects.aget(pk=json.loads(created.content)["id"])
+        self.assertEqual(record.trees_count, 2)
+
+        listed = await self.call(AsyncMeasurementListCreateView, self.factory.get('/api/records'))
+        self.assertEqual([row["id"] for row in json.loads(listed.content)["results"]], [record.pk])
+        cached = await self.call(AsyncMeasurementListCreateView, self.factory.get('/api/records', headers={'If-None-Match': listed['ETag']}))
+        self.assertEqual(cached.status_code, 304)
+
+        detail = await self.call(AsyncMeasurementRetrieveUpdateDeleteView, self.factory.get(f'/api/records/{record.pk}'), pk=record.pk)
+        self.assertEqual(json.loads(detail.content)["metrics"], record.metrics)
+        missing = await self.call(AsyncMeasurementRetrieveUpdateDeleteView, self.factory.get('/api/records/0', headers={'If-None-Match': '"x"'}), pk=0)
+        self.assertEqual(missing.status_code, 404)
+        deleted = await self.call(AsyncMeasurementRetrieveUpdateDeleteView, self.factory.delete(f'/api/records/{record.pk}'), pk=record.pk)
+        self.assertEqual(deleted.status_code, 204)
+        self.assertFalse(await Measurement.objects.filter(pk=record.pk).aexists())
+
+
+class MeasurementSummaryTests(APITestCase):
+    PAYLOAD = {
+        "input_data": {
+            "trees": [{"dap_cm": 30.0, "height_m": 20.0}, {"dap_cm": 25.0, "height_m": 18.0}],
+            "distance_in_row_m": 5.0,
+            "distance_between_rows_m": 5.0,
+        },
+    }
+
+    def test_summary_columns_filled_on_create(self):
+        resp = self.client.post(reverse('measurement-list-create'), data=self.PAYLOAD, format='json')
+        self.assertEqual(resp.status_code, 201)
+        measurement = Measurement.objects.get(pk=resp.json()["id"])
+        self.assertEqual(measurement.trees_count, 2)
+        self.assertEqual(measurement.vol_total_cc_per_ha_m3, measurement.metrics["vol_total_cc_per_ha_m3"])
+        self.assertAlmostEqual(measurement.c_bosque_tn_per_ha, measurement.metrics["biomass_total_tn_per_ha"] * 0.49, places=2)
+
+    def test_summary_reads_full_calc_response_and_filters(self):
+        Measurement.objects.create(input_data={}, metrics={
+            "aggregates": {"trees_count": 10, "vol_total_cc_per_ha_m3": 350.0},
+            "carbon": {"c_bosque_tn_per_ha": 80.5},
+        })
+        Measurement.objects.create(input_data={}, metrics={"vol_total_cc_per_ha_m3": 120.0})
+        url = reverse('measurement-list-create')
+        rows = self.client.get(url, {"vol_total_cc_per_ha_m3_min": 300}).json()["results"]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(Measurement.objects.get(pk=rows[0]["id"]).c_bosque_tn_per_ha, 80.5)
+        self.assertEqual(self.client.get(url, {"c_bosque_tn_per_ha_max": "x"}).status_code, 400)
+
+    def test_out_of_range_metrics_leave_columns_empty(self):
+        for metrics in ({"trees_count": -1}, {"trees_count": "1e400", "ab_per_ha_m2": "inf"}, {"trees_count": 1e12}):
+            measurement = Measurement.objects.create(input_data={}, metrics=dict(metrics, vol_total_cc_per_ha_m3=-3.0))
+            self.assertIsNone(measurement.trees_count)
+            self.assertIsNone(measurement.vol_total_cc_per_ha_m3)
+        resp = self.client.patch(reverse('measurement-rud', args=[measurement.pk]), data={"metrics": {"trees_count": -1}}, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_backfill_command(self):
+        measurement = Measurement.objects.create(input_data={}, metrics={"trees_count": 3, "ab_per_ha_m2": 12.5})
+        Measurement.objects.filter(pk=measurement.pk).update(trees_count=None, ab_per_ha_m2=None)
+        call_command('backfill_measurement_summary', '--batch-size', '1', stdout=io.StringIO())
+        measurement.refresh_from_db()
+        self.assertEqual((measurement.trees_count, measurement.ab_per_ha_m2), (3, 12.5))
+
+class PayloadStorageTests(APITestCase):
+    INPUT = {"trees": [{"dap_cm": 20.0 + i, "height_m": 15.0} for i in range(20)], "distance_in_row_m": 5.0, "distance_between_rows_m": 5.0}
+
+    def test_payload_roundtrip_and_canonical_digest(self):
+        encoded = encode_payload(self.INPUT)
+        self.assertEqual(encoded.encoding, "zlib1")
+        self.assertLess(len(encoded.data), encoded.size / 3)
+        self.assertEqual(decode_payload(encoded.encoding, encoded.data), self.INPUT)
+        self.assertEqual(payload_digest(dict(reversed(list(self.INPUT.items())))), encoded.digest)
+        self.assertEqual(encode_payload({"a": 1}).encoding, "json")
+
+    def test_resubmissions_share_blobs_and_responses_are_unchanged(self):
+        url = reverse('measurement-list-create')
+        first = self.client.post(url, data={"input_data": self.INPUT}, format='json')
+        reordered = dict(reversed(list(self.INPUT.items())))
+        second = self.client.post(url, data={"input_data": reordered}, format='json')
+        self.assertEqual(second.json()["input_data"], self.INPUT)
+        a, b = Measurement.objects.filter(pk__in=[first.json()["id"], second.json()["id"]]).order_by('pk')
+        self.assertEqual((a.input_blob_id, a.metrics_blob_id), (b.input_blob_id, b.metrics_blob_id))
+        self.assertEqual(PayloadBlob.objects.count(), 2)
+        detail = self.client.get(reverse('measurement-rud', args=[a.pk])).json()
+        self.assertEqual((detail["input_data"], detail["metrics"]), (self.INPUT, a.metrics))
+
+    def test_updates_store_new_blobs_and_prune_removes_unused(self):
+        measurement = Measurement.objects.create(input_data=self.INPUT, metrics={"trees_count": 20})
+        old_blob = measurement.metrics_blob_id
+        # Cambio en el lugar (como con JSONField) y guardado parcial
+        measurement.metrics["trees_count"] = 21
+        measurement.save(update_fields=['metrics'])
+        measurement = Measurement.objects.get(pk=measurement.pk)
+        self.assertEqual((measurement.metrics, measurement.trees_count), ({"trees_count": 21}, 21))
+        self.assertNotEqual(measurement.metrics_blob_id, old_blob)
+
+        response = self.client.patch(reverse('measurement-rud', args=[measurement.pk]), data={"input_data": {"trees": []}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Measurement.objects.get(pk=measurement.pk).input_data, {"trees": []})
+        self.assertEqual(PayloadBlob.objects.count(), 4)
+        call_command('prune_payload_blobs', '--grace', '0', stdout=io.StringIO())
+        current = Measurement.objects.get(pk=measurement.pk)
+        self.assertEqual(set(PayloadBlob.objects.values_list('pk', flat=True)), {current.input_blob_id, current.metrics_blob_id})
+
+
+class RecomputeMetricsTests(APITestCase):
+    INPUT = PlotMetricsBatchAPITests.PLOT
+
+    def setUp(self):
+        current = compute_record_metrics(self.INPUT)
+        # Métricas calculadas con coeficientes anteriores, una al día, una sin árboles y una completa
+        self.stale = Measurement.objects.create(input_data=self.INPUT, metrics=dict(current, vol_total_cc_per_ha_m3=1.0))
+        self.fresh = Measurement.objects.create(input_data=self.INPUT, metrics=current)
+        self.manual = Measurement.objects.create(input_data={}, metrics={"vol_total_cc_per_ha_m3": 5.0})
+        full = compute_plot_metrics(self.INPUT)
+        full["aggregates"]["ab_per_ha_m2"] = 0.0
+        self.full = Measurement.objects.create(input_data=self.INPUT, metrics=full)
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), "recompute.json")
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('recompute_measurement_metrics', '--workers', '1', '--chunk-size', '1', '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_diff_without_writing(self):
+        before = list(Measurement.objects.order_by('pk').values_list('metrics_blob', 'updated_at'))
+        output = self.run_command('--dry-run')
+        self.assertIn('4 registros: 2 cambiarían, 1 sin árboles', output)
+        self.assertIn(f'Medición #{self.stale.pk}:', output)
+        self.assertIn('vol_total_cc_per_ha_m3: 1.0 ->', output)
+        self.assertIn('aggregates.ab_per_ha_m2: 1', output)
+        self.assertEqual(list(Measurement.objects.order_by('pk').values_list('metrics_blob', 'updated_at')), before)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_recompute_updates_metrics_summary_and_updated_at(self):
+        fresh_updated_at = self.fresh.updated_at
+        self.run_command()
+        self.stale.refresh_from_db()
+        self.fresh.refresh_from_db()
+        self.full.refresh_from_db()
+        self.assertEqual(self.stale.metrics, compute_record_metrics(self.INPUT))
+        self.assertEqual(self.stale.vol_total_cc_per_ha_m3, self.stale.metrics["vol_total_cc_per_ha_m3"])
+        self.assertGreater(self.stale.updated_at, fresh_updated_at)
+        self.assertEqual(self.fresh.updated_at, fresh_updated_at)
+        self.assertEqual(self.full.metrics, compute_plot_metrics(self.INPUT))
+        self.assertEqual(Measurement.objects.get(pk=self.manual.pk).metrics, {"vol_total_cc_per_ha_m3": 5.0})
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        # Terminados: hasta 'stale' y, fuera de orden, el rango de 'full'
+        finished = [(self.full.pk - 1, self.full.pk)]
+        save_checkpoint(self.checkpoint, self.stale.pk, dict(empty_stats(), records=2, changed=2), finished)
+        output = self.run_command()
+        self.assertIn(f'Reanudando desde el id {self.stale.pk}', output)
+        self.assertIn('4 registros: 2 actualizados', output)
+        self.assertEqual(Measurement.objects.get(pk=self.stale.pk).vol_total_cc_per_ha_m3, 1.0)
+        self.assertEqual(Measurement.objects.get(pk=self.full.pk).metrics["aggregates"]["ab_per_ha_m2"], 0.0)
+
+    def test_overflowing_input_counts_as_failed(self):
+        # Un marco minúsculo lleva los árboles/ha a infinito
+        broken = Measurement.objects.create(
+            input_data=dict(self.INPUT, distance_in_row_m=1e-160, distance_between_rows_m=1e-160), metrics={},
+        )
+        stats = recompute_range(0, broken.pk, dry_run=True)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["records"], 5)
+
+
+class MeasurementExportTests(APITestCase):
+    INPUT = PlotMetricsBatchAPITests.PLOT
+
+    def setUp(self):
+        self.plot = Plot.objects.create()
+        self.first = Measurement.objects.create(plot=self.plot, input_data=self.INPUT, metrics=compute_record_metrics(self.INPUT))
+        self.other = Measurement.objects.create(input_data={}, metrics={"vol_total_cc_per_ha_m3": 5.0})
+
+    def export(self, **params):
+        response = self.client.get(reverse('measurement-export'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_one_row_per_measurement(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="measurements.csv"')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([int(row["id"]) for row in rows], [self.first.pk, self.other.pk])
+        self.assertEqual(rows[0]["plot_id"], str(self.plot.pk))
+        self.assertEqual(float(rows[0]["age_years"]), 10.0)
+        self.assertEqual(float(rows[0]["vol_total_cc_per_ha_m3"]), self.first.vol_total_cc_per_ha_m3)
+        self.assertEqual(rows[1]["plot_id"], "")
+        _, filtered = self.export(plot=self.plot.pk)
+        self.assertEqual(len(filtered.decode().splitlines()), 2)
+
+    def test_csv_per_tree_matches_calc_endpoint(self):
+        _, body = self.export(trees=1)
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        per_tree = compute_plot_metrics(self.INPUT)["per_tree"]
+        self.assertEqual(len(rows), len(per_tree))
+        for index, (row, expected) in enumerate(zip(rows, per_tree)):
+            self.assertEqual(int(row["measurement_id"]), self.first.pk)
+            self.assertEqual(int(row["tree_index"]), index)
+            for name in ("dap_cm", "ab_m2", "vol_total_cc_m3", "biomass_total_kg"):
+                self.assertEqual(float(row[name]), expected[name])
+
+    def test_rejects_unknown_format(self):
+        response = self.client.get(reverse('measurement-export'), {"output": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(export_module.pyarrow, "requiere pyarrow")
+    def test_parquet_and_arrow(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        _, body = self.export(output="parquet", trees=1)
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(body))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column("vol_total_cc_m3").to_pylist(), [t["vol_total_cc_m3"] for t in compute_plot_metrics(self.INPUT)["per_tree"]])
+        _, body = self.export(output="arrow")
+        table = pyarrow.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column("id").to_pylist(), [self.first.pk, self.other.pk])
+
+    def test_command_writes_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "mediciones.csv")
+        call_command('export_measurements', path, '--trees', stdout=io.StringIO())
+        with open(path, encoding='utf-8') as fh:
+            self.assertEqual(len(fh.read().splitlines()), 3)
+        with self.assertRaises(CommandError):
+            call_command('export_measurements', path, '--plot', 'x', stdout=io.StringIO())
+
+
+class MeasurementAnalyticsAPITests(APITestCase):
+    def setUp(self):
+        self.producer_a = Producer.objects.create(name="A")
+        self.producer_b = Producer.objects.create(name="B")
+        plot_a = Plot.objects.create(producer=self.producer_a)
+        plot_b = Plot.objects.create(producer=self.producer_b)
+        for volume in (100.0, 200.0, 300.0, 400.0):
+            Measurement.objects.create(plot=plot_a, input_data={}, metrics={"vol_total_cc_per_ha_m3": volume})
+        Measurement.objects.create(plot=plot_b, input_data={}, metrics={"vol_total_cc_per_ha_m3": 50.0})
+
+    def _get(self, **params):
+        resp = self.client.get(reverse('measurement-analytics'), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_grouped_statistics_by_producer(self):
+        data = self._get(group_by="producer", metrics="vol_total_cc_per_ha_m3", percentiles="50,90")
+        self.assertEqual(data["count"], 2)
+        by_key = {row["key"]: row for row in data["results"]}
+        stats = by_key[self.producer_a.pk]["metrics"]["vol_total_cc_per_ha_m3"]
+        self.assertEqual(by_key[self.producer_a.pk]["label"], "A")
+        self.assertEqual((stats["count"], stats["mean"], stats["sum"]), (4, 250.0, 1000.0))
+        self.assertEqual((stats["min"], stats["max"]), (100.0, 400.0))
+        self.assertAlmostEqual(stats["p50"], 250.0)
+        self.assertAlmostEqual(stats["p90"], 370.0)
+        self.assertEqual(by_key[self.producer_b.pk]["metrics"]["vol_total_cc_per_ha_m3"]["p90"], 50.0)
+
+    def test_pagination_and_cache_invalidation(self):
+        first = self._get(group_by="producer", page_size=1)
+        self.assertEqual(len(first["results"]), 1)
+        self.assertEqual(first["next_page"], 2)
+        month = self._get(group_by="month", metrics="vol_total_cc_per_ha_m3")
+        self.assertEqual(month["results"][0]["measurements"], 5)
+        Measurement.objects.create(input_data={}, metrics={"vol_total_cc_per_ha_m3": 1.0})
+        month = self._get(group_by="month", metrics="vol_total_cc_per_ha_m3")
+        self.assertEqual(month["results"][0]["measurements"], 6)
+
+    def test_plot_changes_and_bulk_writes_invalidate_cache(self):
+        def counts():
+            data = self._get(group_by="producer", metrics="vol_total_cc_per_ha_m3")
+            return {row["key"]: row["measurements"] for row in data["results"]}
+
+        self.assertEqual(counts(), {self.producer_a.pk: 4, self.producer_b.pk: 1})
+        plot_b = Plot.objects.get(producer=self.producer_b)
+        plot_b.producer = self.producer_a
+        plot_b.save()
+        self.assertEqual(counts(), {self.producer_a.pk: 5})
+        plot_b.delete()
+        self.assertEqual(counts(), {self.producer_a.pk: 4, None: 1})
+
+        # update()/bulk_update no disparan señales: el backfill invalida al terminar
+        Measurement.objects.update(vol_total_cc_per_ha_m3=None)
+        def total():
+            return self._get(group_by="month")["results"][0]["metrics"]["vol_total_cc_per_ha_m3"]["sum"]
+
+        stale = total()
+        call_command('backfill_measurement_summary', stdout=io.StringIO())
+        self.assertNotEqual(stale, 1050.0)
+        self.assertEqual(total(), 1050.0)
+
+    def test_invalid_parameters(self):
+        url = reverse('measurement-analytics')
+        self.assertEqual(self.client.get(url, {"group_by": "planet"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"group_by": "month", "metrics": "input_data"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"group_by": "month", "percentiles": "120"}).status_code, 400)
+
+
+class TreeImportTests(APITestCase):
+    def test_csv_import_is_idempotent_upsert(self):
+        plot = Plot.objects.create()
+        url = reverse('tree-import') + f'?plot={plot.pk}&batch_size=2'
+        body = "number,dap_cm,height_m\n1,20,15\n2,25,18\n3,30,20\n"
+        resp = self.client.generic('POST', url, body, content_type='text/csv')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"rows": 3, "batches": 2, "plots_created": 0})
+
+        resp = self.client.generic('POST', url, "number,dap_cm,height_m\n2,26,19\n", content_type='text/csv')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Tree.objects.filter(plot=plot).count(), 3)
+        self.assertEqual(Tree.objects.get(plot=plot, number=2).dap_cm, 26.0)
+
+    def test_ndjson_import_creates_plots_on_request(self):
+        body = '{"plot": 900, "number": 1, "dap_cm": 20, "height_m": 15}\n'
+        url = reverse('tree-import')
+        resp = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.generic('POST', url + '?create_plots=1', body, content_type='application/x-ndjson')
+        self.assertEqual(resp.json()["plots_created"], 1)
+        self.assertTrue(Tree.objects.filter(plot_id=900, number=1).exists())
+
+    def test_bad_row_reports_line(self):
+        plot = Plot.objects.create()
+        body = "number,dap_cm,height_m\n1,20,15\n2,x,18\n"
+        resp = self.client.generic('POST', reverse('tree-import') + f'?plot={plot.pk}', body, content_type='text/csv')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["line"], 3)
+
+    def test_out_of_range_values_report_line(self):
+        plot = Plot.objects.create()
+        url = reverse('tree-import') + f'?plot={plot.pk}'
+        for row in ("2,inf,18", "2,-3,18", "2,20,nan", "-1,20,18", "1e400,20,18"):
+            body = f"number,dap_cm,height_m\n1,20,15\n{row}\n"
+            resp = self.client.generic('POST', url, body, content_type='text/csv')
+            self.assertEqual(resp.status_code, 400, row)
+            self.assertEqual(resp.json()["line"], 3)
+        self.assertFalse(Tree.objects.filter(plot=plot).exists())
+
+    def test_management_command(self):
+        plot = Plot.objects.create()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("plot,number,dap_cm,height_m\n")
+            for number in range(1, 11):
+                handle.write(f"{plot.pk},{number},{10 + number},{8 + number}\n")
+        self.addCleanup(os.remove, handle.name)
+        call_command('import_trees', handle.name, '--batch-size', '4', stdout=io.StringIO())
+        self.assertEqual(Tree.objects.filter(plot=plot).count(), 10)
+
+
+class SpeciesAllometryTests(APITestCase):
+    TREES = [
+        {"dap_cm": 30.0, "height_m": 20.0, "species": "A"},
+        {"dap_cm": 25.0, "height_m": 18.0},
+        {"dap_cm": 18.0, "height_m": 12.0, "species": "A"},
+    ]
+
+    def setUp(self):
+        self.pine = Species.objects.create(name="Pino", biomass_above_a=0.03, biomass_above_b=2.2, root_ratio=0.3)
+        self.other = Species.objects.create(name="A", root_ratio=0.2)
+        get_result_cache().clear()
+
+    def _expected_biomass(self, trees, allometry_by_tree):
+        above = root = 0.0
+        for tree, (a, b, ratio) in zip(trees, allometry_by_tree):
+            value = -0.0808 + a * tree["dap_cm"] ** b * tree["height_m"] ** 0.614
+            above += value
+            root += value * ratio
+        return above, root
+
+    def test_mixed_species_plot_uses_each_species_equations(self):
+        payload = {"trees": self.TREES, "species": self.pine.pk, "distance_in_row_m": 3.0, "distance_between_rows_m": 3.0}
+        species_registry.allometries()  # registro ya cargado: el cálculo no consulta la base
+        with self.assertNumQueries(0):
+            resp = self.client.post(reverse('plot-metrics'), data=payload, format='json')
+        self.assertEqual(resp.status_code, 200)
+        rows = resp.json()["per_tree"]
+        coefficients = [(0.0206, 2.337, 0.2), (0.03, 2.2, 0.3), (0.0206, 2.337, 0.2)]
+        for tree, row, (a, b, ratio) in zip(self.TREES, rows, coefficients):
+            above, root = self._expected_biomass([tree], [(a, b, ratio)])
+            self.assertAlmostEqual(row["biomass_above_kg"], round(above, 3), places=3)
+            self.assertAlmostEqual(row["biomass_root_kg"], round(root, 3), places=3)
+        # Volúmenes: mismas ecuaciones por defecto para ambas especies
+        self.assertEqual(rows[0]["vol_total_cc_m3"], round(volume_total_cc_m3(30.0, 20.0), 4))
+
+    def test_projection_uses_plot_species(self):
+        trees = [{"dap_cm": t["dap_cm"], "height_m": t["height_m"]} for t in self.TREES]
+        payload = {
+            "trees": trees, "species": "pino", "distance_in_row_m": 3.0, "distance_between_rows_m": 3.0,
+            "age_years": 10, "dominant_height_m": 19.0,
+        }
+        metrics = self.client.post(reverse('plot-metrics'), data=payload, format='json').json()["aggregates"]
+        resp = self.client.post(reverse('plot-projection'), data=dict(payload, ages=[10]), format='json')
+        self.assertEqual(resp.status_code, 200)
+        trajectory = resp.json()["trajectory"]
+        for key in ("biomass_above_tn_per_ha", "biomass_root_tn_per_ha", "vol_merchantable15_sc_per_ha_m3"):
+            self.assertAlmostEqual(trajectory[key][0], metrics[key], places=2)
+
+        resp = self.client.post(reverse('plot-projection'), data=dict(payload, trees=self.TREES), format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("una sola especie", resp.json()["detail"])
+
+    def test_unknown_species_is_rejected(self):
+        payload = {"trees": self.TREES, "species": "roble", "distance_in_row_m": 3.0, "distance_between_rows_m": 3.0}
+        resp = self.client.post(reverse('plot-metrics'), data=payload, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("roble", resp.json()["detail"])
+
+    def test_saving_species_invalidates_registry_and_accumulators(self):
+        plot = Plot.objects.create(species=self.pine, distance_in_row_m=3.0, distance_between_rows_m=3.0)
+        trees = [{"dap_cm": t["dap_cm"], "height_m": t["height_m"]} for t in self.TREES]
+        for i, tree in enumerate(trees, start=1):
+            Tree.objects.create(plot=plot, number=i, **tree)
+        url = reverse('plot-stored-metrics', args=[plot.pk])
+        before = self.client.get(url).json()["aggregates"]["biomass_above_tn_per_ha"]
+        above, _ = self._expected_biomass(trees, [(0.03, 2.2, 0.3)] * 3)
+        self.assertAlmostEqual(before, round(above / 3 * 1111.1111 / 1000.0, 2), delta=0.02)
+
+        self.pine.biomass_above_a = 0.04
+        self.pine.save()
+        self.assertEqual(species_registry.allometries()["pino"].biomass_above_a, 0.04)
+        after = self.client.get(url).json()["aggregates"]["biomass_above_tn_per_ha"]
+        above, _ = self._expected_biomass(trees, [(0.04, 2.2, 0.3)] * 3)
+        self.assertAlmostEqual(after, round(above / 3 * 1111.1111 / 1000.0, 2), delta=0.02)
+        # Altas posteriores usan las nuevas ecuaciones y el acumulador sigue consistente
+        Tree.objects.create(plot=plot, number=10, dap_cm=22.0, height_m=15.0)
+        self.assertEqual(accumulator_drift(plot), {})
+
+    def test_other_processes_see_species_changes_through_the_database(self):
+        # Registro de otro worker: no recibe la señal, solo ve la versión guardada en la base
+        worker = SpeciesRegistry()
+        with override_settings(CIEFAP_SPECIES_RECHECK_SECONDS=3600):
+            version = worker.version()
+            self.assertEqual(worker.allometries()["pino"].biomass_above_a, 0.03)
+            self.pine.biomass_above_a = 0.05
+            self.pine.save()
+            # Dentro del intervalo de relectura conserva la versión anterior
+            self.assertEqual(worker.allometries()["pino"].biomass_above_a, 0.03)
+        with override_settings(CIEFAP_SPECIES_RECHECK_SECONDS=0):
+            self.assertGreater(worker.version(), version)
+            self.assertEqual(worker.allometries()["pino"].biomass_above_a, 0.05)
+            self.pine.delete()
+            self.assertNotIn("pino", worker.allometries())
+
+
+class StoredPlotMetricsAPITests(APITestCase):
+    TREES = [
+        {"dap_cm": 30.0, "height_m": 20.0},
+        {"dap_cm": 25.0, "height_m": 18.0},
+        {"dap_cm": 12.5, "height_m": 9.0},
+        {"dap_cm": 41.0, "height_m": 27.5},
+    ]
+
+    def test_matches_payload_endpoint(self):
+        species = Species.objects.create(name="Pino", root_ratio=0.3)
+        plot = Plot.objects.create(species=species, distance_in_row_m=4.0, distance_between_rows_m=3.0, age_years=12)
+        Tree.objects.bulk_create([Tree(plot=plot, number=i, **t) for i, t in enumerate(self.TREES, start=1)])
+
+        self.client.get(reverse('plot-stored-metrics', args=[plot.pk]))  # construye el acumulador
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('plot-stored-metrics', args=[plot.pk]), {"animal_emission_kg_day": 4})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        expected = self.client.post(reverse('plot-metrics'), data={
+            "trees": self.TREES, "distance_in_row_m": 4.0, "distance_between_rows_m": 3.0,
+            "age_years": 12, "species_root_ratio": 0.3, "animal_emission_kg_day": 4, "per_tree": "none",
+        }, format='json').json()
+        self.assertEqual(data["plot_id"], plot.pk)
+        for key, value in expected["aggregates"].items():
+            self.assertAlmostEqual(data["aggregates"][key], value, places=2, msg=key)
+        self.assertEqual(data["carbon"], expected["carbon"])
+
+    def test_unknown_plot_returns_404(self):
+        self.assertEqual(self.client.get(reverse('plot-stored-metrics', args=[999])).status_code, 404)
+
+
+class PlotAccumulatorTests(APITestCase):
+    def setUp(self):
+        self.plot = Plot.objects.create(distance_in_row_m=3.0, distance_between_rows_m=3.0)
+        Tree.objects.bulk_create([
+            Tree(plot=self.plot, number=i, dap_cm=10.0 + i, height_m=8.0 + i) for i in range(1, 21)
+        ])
+
+    def _aggregates(self):
+        return self.client.get(reverse('plot-stored-metrics', args=[self.plot.pk])).json()["aggregates"]
+
+    def test_tree_writes_update_accumulator_incrementally(self):
+        self._aggregates()
+        tree = Tree.objects.create(plot=self.plot, number=21, dap_cm=50.0, height_m=30.0)
+        tree.dap_cm = 45.0
+        tree.save()
+        Tree.objects.get(plot=self.plot, number=1).delete()
+
+        accumulator = PlotAccumulator.objects.get(plot=self.plot)
+        self.assertFalse(accumulator.stale)
+        self.assertEqual(accumulator.trees_count, 20)
+        self.assertEqual(accumulator_drift(self.plot), {})
+
+    def test_tree_moved_between_plots(self):
+        other = Plot.objects.create()
+        self._aggregates()
+        self.client.get(reverse('plot-stored-metrics', args=[other.pk]))
+        tree = Tree.objects.get(plot=self.plot, number=5)
+        tree.plot = other
+        tree.save()
+        self.assertEqual(PlotAccumulator.objects.get(plot=self.plot).trees_count, 19)
+        self.assertEqual(PlotAccumulator.objects.get(plot=other).trees_count, 1)
+        self.assertEqual(accumulator_drift(self.plot), {})
+        self.assertEqual(accumulator_drift(other), {})
+
+    def test_invalid_stored_tree_is_400_not_nan(self):
+        self._aggregates()
+        tree = Tree.objects.create(plot=self.plot, number=21, dap_cm=-5.0, height_m=30.0)
+        self.assertTrue(PlotAccumulator.objects.get(plot=self.plot).stale)
+        url = reverse('plot-stored-metrics', args=[self.plot.pk])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("Árbol 21", resp.json()["detail"])
+
+        tree.dap_cm = 25.0
+        tree.save()
+        self.assertEqual(self.client.get(url).json()["aggregates"]["trees_count"], 21)
+        self.assertEqual(accumulator_drift(self.plot), {})
+
+    def test_bulk_import_marks_stale_and_check_command_fixes_drift(self):
+        self._aggregates()
+        body = "number,dap_cm,height_m\n99,40,25\n"
+        self.client.generic('POST', reverse('tree-import') + f'?plot={self.plot.pk}', body, content_type='text/csv')
+        self.assertTrue(PlotAccumulator.objects.get(plot=self.plot).stale)
+        self.assertEqual(self._aggregates()["trees_count"], 21)
+
+        PlotAccumulator.objects.filter(plot=self.plot).update(dap_sum=0.0)
+        out = io.StringIO()
+        call_command('check_plot_accumulators', '--fix', stdout=out)
+        self.assertIn('dap_sum', out.getvalue())
+        self.assertEqual(accumulator_drift(self.plot), {})
@@ -0,0 +1,253 @@
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .calculations import carbon_forest_tn_per_ha
+from .engine import DEFAULT_ALLOMETRY, Allometry
+
+
+# Bandas de incertidumbre Monte Carlo para los agregados por hectárea. Cada réplica
+# remuestrea los árboles con reposición (bootstrap) y perturba los coeficientes de las
+# ecuaciones alométricas y la relación raíz/aérea con ruido normal relativo. Las réplicas
+# se evalúan en bloques (réplicas × árboles) y cada bloque tiene su propia semilla
+# derivada de la semilla del pedido (SeedSequence.spawn): el resultado es reproducible y
+# no depende de cómo se repartan los bloques.
+
+DEFAULT_REPLICATES = 1000
+MAX_REPLICATES = 20000
+DEFAULT_PERCENTILES = (2.5, 50.0, 97.5)
+DEFAULT_COEFFICIENT_CV = 0.05
+DEFAULT_EXPONENT_CV = 0.01
+DEFAULT_ROOT_RATIO_CV = 0.10
+MAX_CV = 1.0
+# Réplicas por bloque: fija para que el reparto de semillas no dependa del tamaño de la parcela
+BLOCK_REPLICATES = 256
+# Máximo de celdas réplicas × árboles por paso (acota la memoria con parcelas grandes)
+MAX_BLOCK_CELLS = 2_000_000
+
+BAND_KEYS = (
+    "ab_per_ha_m2",
+    "vol_total_cc_per_ha_m3",
+    "vol_total_sc_per_ha_m3",
+    "vol_merchantable15_cc_per_ha_m3",
+    "vol_merchantable15_sc_per_ha_m3",
+    "biomass_above_tn_per_ha",
+    "biomass_root_tn_per_ha",
+    "biomass_total_tn_per_ha",
+    "c_bosque_tn_per_ha",
+)
+
+
+def _finite(value: Any, name: str) -> float:
+    try:
+        number = float(value) if not isinstance(value, bool) else math.nan
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number):
+        raise ValueError(f"'{name}' debe ser un número finito.")
+    return number
+
+
+def _integer(value: Any, name: str) -> int:
+    number = _finite(value, name)
+    if number != int(number):
+        raise ValueError(f"'{name}' debe ser un número entero.")
+    return int(number)
+
+
+def uncertainty_options(value: Any) -> Dict[str, Any]:
+    # 'uncertainty': true para los valores por defecto, o un objeto con las opciones
+    options = {} if value is True else value
+    if not isinstance(options, Mapping):
+        raise ValueError("'uncertainty' debe ser true o un objeto con las opciones.")
+    replicates = _integer(options.get("replicates", DEFAULT_REPLICATES), "replicates")
+    if not 1 <= replicates <= MAX_REPLICATES:
+        raise ValueError(f"'replicates' debe estar entre 1 y {MAX_REPLICATES}.")
+    seed = _integer(options.get("seed", 0), "seed")
+    if seed < 0:
+        raise ValueError("'seed' debe ser un entero mayor o igual que 0.")
+    percentiles = options.get("percentiles", DEFAULT_PERCENTILES)
+    if not isinstance(percentiles, (list, tuple)) or not percentiles:
+        raise ValueError("'percentiles' debe ser una lista de valores entre 0 y 100.")
+    percentiles = [_finite(p, "percentiles") for p in percentiles]
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError("'percentiles' debe ser una lista de valores entre 0 y 100.")
+    bootstrap = options.get("bootstrap", True)
+    if not isinstance(bootstrap, bool):
+        raise ValueError("'bootstrap' debe ser true o false.")
+    parsed = {"replicates": replicates, "seed": seed, "percentiles": percentiles, "bootstrap": bootstrap}
+    # Coeficientes de variación relativos (1 = 100 %)
+    for name, default in (
+        ("coefficient_cv", DEFAULT_COEFFICIENT_CV),
+        ("exponent_cv", DEFAULT_EXPONENT_CV),
+        ("root_ratio_cv", DEFAULT_ROOT_RATIO_CV),
+    ):
+        parsed[name] = _finite(options.get(name, default), name)
+        if not 0 <= parsed[name] <= MAX_CV:
+            raise ValueError(f"'{name}' debe estar entre 0 y {MAX_CV:g}.")
+    return parsed
+
+
+# Columnas por árbol que se remuestrean en cada réplica
+TREE_COLUMNS = ("dap_m2", "dap_m2_h", "dap_exponent_log", "height_exponent_log")
+
+
+def _factors(rng: np.random.Generator, cv: float, size: int) -> np.ndarray:
+    # Factor multiplicativo por réplica (1 + cv·z), como columna para operar con réplicas × árboles
+    if cv == 0:
+        return np.ones((size, 1))
+    return 1.0 + cv * rng.standard_normal((size, 1))
+
+
+def _take(column: Any, index: Any) -> Any:
+    # Coeficiente escalar (una especie) o columna por árbol remuestreada
+    return column if np.ndim(column) == 0 else column[index]
+
+
+def _row_sums(values: Any, n: int) -> np.ndarray:
+    return n * values if np.ndim(values) == 0 else values.sum(axis=1, keepdims=True)
+
+
+def _replicate_sums(
+    rng: np.random.Generator,
+    columns: Mapping[str, Any],
+    replicates: int,
+    options: Mapping[str, Any],
+) -> Dict[str, np.ndarray]:
+    # Sumas de la parcela para 'replicates' réplicas (un valor por réplica)
+    n = columns["dap_m2"].shape[0]
+    cv = options["coefficient_cv"]
+    f = {name: _factors(rng, cv, replicates) for name in (
+        "vt_cc_a", "vt_cc_b", "vt_sc_a", "vt_sc_b", "vm15_cc_a", "vm15_cc_b", "biomass_c", "biomass_a",
+    )}
+    f_dap = _factors(rng, options["exponent_cv"], replicates)
+    f_height = _factors(rng, options["exponent_cv"], replicates)
+    f_root = np.clip(_factors(rng, options["root_ratio_cv"], replicates), 0.0, None)
+
+    if options["bootstrap"]:
+        index = rng.integers(0, n, size=(replicates, n))
+    else:
+        index = np.broadcast_to(np.arange(n), (replicates, n))
+    take = {name: columns[name][index] for name in TREE_COLUMNS}
+    x = take["dap_m2_h"]
+    eq = columns["allometry"]
+
+    sums = {"ab_m2": np.pi / 4.0 * take["dap_m2"].sum(axis=1)}
+    # Términos lineales: Σ(a·fa + b·fb·x) = fa·Σa + fb·Σ(b·x)
+    a_cc, a_sc, a_15 = (_take(getattr(eq, name), index) for name in ("vol_total_cc_a", "vol_total_sc_a", "vol_merchantable15_cc_a"))
+    b_cc, b_sc, b_15 = (_take(getattr(eq, name), index) for name in ("vol_total_cc_b", "vol_total_sc_b", "vol_merchantable15_cc_b"))
+    sums["vol_total_cc_m3"] = (f["vt_cc_a"] * _row_sums(a_cc, n) + f["vt_cc_b"] * _row_sums(b_cc * x, n))[:, 0]
+    sums["vol_total_sc_m3"] = (f["vt_sc_a"] * _row_sums(a_sc, n) + f["vt_sc_b"] * _row_sums(b_sc * x, n))[:, 0]
+    sums["vol_maderable15_cc_m3"] = (f["vm15_cc_a"] * _row_sums(a_15, n) + f["vm15_cc_b"] * _row_sums(b_15 * x, n))[:, 0]
+
+    # Volumen maderable s/c: razón s/c ÷ c/c por árbol (no lineal), como en engine.tree_columns
+    vt_cc = a_cc * f["vt_cc_a"] + b_cc * f["vt_cc_b"] * x
+    positive = vt_cc > 0
+    ratio = np.where(positive, (a_sc * f["vt_sc_a"] + b_sc * f["vt_sc_b"] * x) / np.where(positive, vt_cc, 1.0), 0.93)
+    sums["vol_maderable15_sc_m3"] = ((a_15 * f["vm15_cc_a"] + b_15 * f["vm15_cc_b"] * x) * ratio).sum(axis=1)
+
+    # Biomasa: los exponentes se perturban sobre b·ln(DAP) y h·ln(H), precalculados por árbol
+    power = np.exp(f_dap * take["dap_exponent_log"] + f_height * take["height_exponent_log"])
+    above = _take(eq.biomass_above_c, index) * f["biomass_c"] + _take(eq.biomass_above_a, index) * f["biomass_a"] * power
+    b_above = above.sum(axis=1)
+    sums["biomass_above_kg"] = b_above
+    root_ratio = columns["root_ratio"]
+    if np.ndim(root_ratio) == 0:
+        sums["biomass_root_kg"] = b_above * root_ratio * f_root[:, 0]
+    else:
+        sums["biomass_root_kg"] = (above * root_ratio[index]).sum(axis=1) * f_root[:, 0]
+    return sums
+
+
+def _block_sums(
+    seed: np.random.SeedSequence,
+    columns: Mapping[str, Any],
+    replicates: int,
+    options: Mapping[str, Any],
+) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    step = max(1, MAX_BLOCK_CELLS // max(1, columns["dap_m2"].shape[0]))
+    parts: List[Dict[str, np.ndarray]] = []
+    for start in range(0, replicates, step):
+        parts.append(_replicate_sums(rng, columns, min(step, replicates - start), options))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def monte_carlo_sums(
+    dap_cm: np.ndarray,
+    height_m: np.ndarray,
+    root_ratio: Optional[float],
+    options: Mapping[str, Any],
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Dict[str, np.ndarray]:
+    # root_ratio=None usa la relación raíz/aérea de 'allometry' (escalar o por árbol)
+    dap_cm = np.asarray(dap_cm, dtype=np.float64)
+    height_m = np.asarray(height_m, dtype=np.float64)
+    # Columnas por árbol que se remuestrean (los coeficientes por árbol, en parcelas mixtas,
+    # se indexan dentro de _replicate_sums); los logaritmos permiten variar los exponentes
+    # de la biomasa por réplica con un solo exp()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns = {
+            "dap_m2": (dap_cm / 100.0) ** 2,
+            "dap_m2_h": (dap_cm / 100.0) ** 2 * height_m,
+            "dap_exponent_log": allometry.biomass_above_b * np.log(dap_cm),
+            "height_exponent_log": allometry.biomass_above_h * np.log(height_m),
+        }
+    columns = {
+        **columns,
+        "allometry": allometry,
+        "root_ratio": np.asarray(allometry.root_ratio if root_ratio is None else root_ratio, dtype=np.float64),
+    }
+    replicates = options["replicates"]
+    blocks = -(-replicates // BLOCK_REPLICATES)
+    seeds = np.random.SeedSequence(options["seed"]).spawn(blocks)
+    parts = [
+        _block_sums(seeds[k], columns, min(BLOCK_REPLICATES, replicates - k * BLOCK_REPLICATES), options)
+        for k in range(blocks)
+    ]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def uncertainty_bands(
+    dap_cm: np.ndarray,
+    height_m: np.ndarray,
+    trees_per_ha: float,
+    root_ratio: Optional[float],
+    options: Mapping[str, Any],
+    allometry: Allometry = DEFAULT_ALLOMETRY,
+) -> Dict[str, Any]:
+    n = int(np.asarray(dap_cm).shape[0])
+    sums = monte_carlo_sums(dap_cm, height_m, root_ratio, options, allometry)
+    per_ha = trees_per_ha / n
+    biomass_total_tn = (sums["biomass_above_kg"] + sums["biomass_root_kg"]) * per_ha / 1000.0
+    values = {
+        "ab_per_ha_m2": sums["ab_m2"] * per_ha,
+        "vol_total_cc_per_ha_m3": sums["vol_total_cc_m3"] * per_ha,
+        "vol_total_sc_per_ha_m3": sums["vol_total_sc_m3"] * per_ha,
+        "vol_merchantable15_cc_per_ha_m3": sums["vol_maderable15_cc_m3"] * per_ha,
+        "vol_merchantable15_sc_per_ha_m3": sums["vol_maderable15_sc_m3"] * per_ha,
+        "biomass_above_tn_per_ha": sums["biomass_above_kg"] * per_ha / 1000.0,
+        "biomass_root_tn_per_ha": sums["biomass_root_kg"] * per_ha / 1000.0,
+        "biomass_total_tn_per_ha": biomass_total_tn,
+        "c_bosque_tn_per_ha": carbon_forest_tn_per_ha(biomass_total_tn),
+    }
+    percentiles: Sequence[float] = options["percentiles"]
+    bands = {}
+    for key in BAND_KEYS:
+        sample = values[key]
+        quantiles = np.percentile(sample, percentiles)
+        bands[key] = {
+            "mean": round(float(sample.mean()), 4),
+            "std": round(float(sample.std(ddof=1)) if sample.shape[0] > 1 else 0.0, 4),
+            **{f"p{p:g}": round(float(q), 4) for p, q in zip(percentiles, quantiles)},
+        }
+    return {
+        "replicates": options["replicates"],
+        "seed": options["seed"],
+        "bootstrap": options["bootstrap"],
+        "coefficient_cv": options["coefficient_cv"],
+        "exponent_cv": options["exponent_cv"],
+        "root_ratio_cv": options["root_ratio_cv"],
+        "bands": bands,
+    }
@@ -1,12 +1,49 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     PlotMetricsView,
+    PlotMetricsBatchView,
+    PlotMetricsStreamView,
+    PlotProjectionView,
+    PlotRotationView,
+    PlotMetricsCacheView,
+    CalcJobCreateView,
+    CalcJobDetailView,
+    CalcJobResultView,
+    CalcJobCancelView,
+    TreeImportView,
+    StoredPlotMetricsView,
     MeasurementListCreateView,
+    MeasurementExportView,
     MeasurementRetrieveUpdateDeleteView,
+    MeasurementAnalyticsView,
+    prometheus_metrics,
 )
 
+if getattr(settings, 'CIEFAP_ASYNC_VIEWS', False):
+    # Despliegue ASGI (uvicorn): cálculo y mediciones con vistas asíncronas
+    from .async_views import (
+        AsyncMeasurementListCreateView as MeasurementListCreateView,
+        AsyncMeasurementRetrieveUpdateDeleteView as MeasurementRetrieveUpdateDeleteView,
+        AsyncPlotMetricsView as PlotMetricsView,
+    )
+
 urlpatterns = [
     path('calc/metrics', PlotMetricsView.as_view(), name='plot-metrics'),
+    path('calc/metrics/batch', PlotMetricsBatchView.as_view(), name='plot-metrics-batch'),
+    path('calc/metrics/stream', PlotMetricsStreamView.as_view(), name='plot-metrics-stream'),
+    path('calc/projection', PlotProjectionView.as_view(), name='plot-projection'),
+    path('calc/rotation', PlotRotationView.as_view(), name='plot-rotation'),
+    path('calc/cache', PlotMetricsCacheView.as_view(), name='plot-metrics-cache'),
+    path('jobs', CalcJobCreateView.as_view(), name='calc-job-create'),
+    path('jobs/<uuid:pk>', CalcJobDetailView.as_view(), name='calc-job-detail'),
+    path('jobs/<uuid:pk>/result', CalcJobResultView.as_view(), name='calc-job-result'),
+    path('jobs/<uuid:pk>/cancel', CalcJobCancelView.as_view(), name='calc-job-cancel'),
+    path('trees/import', TreeImportView.as_view(), name='tree-import'),
+    path('plots/<int:pk>/metrics', StoredPlotMetricsView.as_view(), name='plot-stored-metrics'),
     path('records', MeasurementListCreateView.as_view(), name='measurement-list-create'),
+    path('records/export', MeasurementExportView.as_view(), name='measurement-export'),
     path('records/<int:pk>', MeasurementRetrieveUpdateDeleteView.as_view(), name='measurement-rud'),
+    path('analytics', MeasurementAnalyticsView.as_view(), name='measurement-analytics'),
+    path('ops/metrics', prometheus_metrics, name='prometheus-metrics'),
 ]
\ No newline at end of file
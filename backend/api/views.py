@@ -1,166 +1,510 @@
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
 
-from .calculations import (
-    basal_area_m2,
-    volume_total_cc_m3,
-    volume_total_sc_m3,
-    volume_merchantable15_cc_m3,
-    volume_merchantable15_sc_m3,
-    biomass_above_kg,
-    biomass_root_kg,
-    aggregate_plot_metrics,
-    dominant_height_from_site_index,
-    site_index_from_dominant_height,
-    recommended_plot_area_m2,
-    plot_radius_from_area_m,
-    carbon_forest_tn_per_ha,
-    capture_kg_per_day_per_ha,
-    animals_per_ha_equilibrium,
-)
-from .models import Measurement, Plot
+from .models import SUMMARY_FIELDS, CalcJob, JobStatus, Measurement, Plot
+from .pagination import KeysetPagination
 from .serializers import MeasurementSerializer
+from .analytics import DEFAULT_METRICS, GROUPINGS, grouped_statistics
+from .analytics import cache_key as analytics_cache_key
+from .cache import get_result_cache, payload_key
+from .conditional import has_conditional_headers, make_etag, not_modified_response, set_validators
+from .engine import PER_TREE_COLUMNS_FORMAT, PER_TREE_NONE
+from .services import compute_plot_metrics, compute_batch, compute_record_metrics, estate_rollup, per_tree_format, plot_allometry, plot_parameters
+from .species import registry as species_registry
+from .instrumentation import metrics as instrumentation_metrics, phase
+from .middleware import instrumentation_settings
+from .jobs import QueueFull, cancel_job, is_expired, job_status, submit_job
+from .export import CONTENT_TYPES, EXPORT_CSV, EXPORT_FORMATS, export_available, export_chunks, export_filename
+from .importing import DEFAULT_BATCH_SIZE as DEFAULT_IMPORT_BATCH_SIZE, import_trees, iter_inventory_rows
+from .projection import ages_from_payload, project_payload
+from .rotation import DEFAULT_ROTATION_GRID, rotation_payload
+from .stored_metrics import stored_plot_metrics
+from .streaming import RowError, stream_format, stream_plot_metrics
 
 
 class PlotMetricsView(APIView):
+    @staticmethod
+    def output_formats(request, data):
+        # 'per_tree' en el cuerpo o en la query: rows (por defecto), columns o none
+        default_per_tree = per_tree_format(request.query_params.get("per_tree"))
+        return default_per_tree, per_tree_format(data.get("per_tree"), default_per_tree)
+
+    @staticmethod
+    def result_cache_key(result_cache, data, output_format, species_version):
+        if result_cache is None:
+            return None
+        try:
+            return payload_key(data, output_format, species_version)
+        except (TypeError, ValueError, AttributeError):
+            return None  # entrada inválida: compute_plot_metrics informa el error
+
+    def post(self, request):
+        with phase("parse"):
+            data = request.data or {}
+        try:
+            default_per_tree, output_format = self.output_formats(request, data)
+        except (TypeError, ValueError, AttributeError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        species_version, allometries = species_registry.snapshot()
+        result_cache = get_result_cache()
+        cache_key = self.result_cache_key(result_cache, data, output_format, species_version)
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK, headers={"X-Cache": "HIT"})
+
+        try:
+            result = compute_plot_metrics(data, default_per_tree, allometries)
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if cache_key:
+            result_cache.set(cache_key, result)
+        return Response(result, status=status.HTTP_200_OK, headers={"X-Cache": "MISS"} if cache_key else None)
+
+
+class PlotMetricsCacheView(APIView):
+    def get(self, request):
+        result_cache = get_result_cache()
+        if result_cache is None:
+            return Response({"backend": None}, status=status.HTTP_200_OK)
+        return Response(result_cache.stats(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            result_cache.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class PlotMetricsBatchView(APIView):
+    def post(self, request):
+        data = request.data
+        plots = data.get("plots") if isinstance(data, dict) else data
+        if not isinstance(plots, list) or len(plots) == 0:
+            return Response({"detail": "Debe proporcionar una lista 'plots' con los datos de cada parcela."}, status=status.HTTP_400_BAD_REQUEST)
+        max_plots = getattr(settings, 'CIEFAP_BATCH_MAX_PLOTS', 5000)
+        if len(plots) > max_plots:
+            return Response({"detail": f"El lote admite como máximo {max_plots} parcelas."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            default_per_tree = per_tree_format(
+                data.get("per_tree") if isinstance(data, dict) else None,
+                per_tree_format(request.query_params.get("per_tree")),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = compute_batch(
+            plots,
+            parallel_min_plots=getattr(settings, 'CIEFAP_BATCH_PARALLEL_MIN_PLOTS', 64),
+            max_workers=getattr(settings, 'CIEFAP_BATCH_MAX_WORKERS', None),
+            default_per_tree=default_per_tree,
+            allometries=species_registry.allometries(),
+        )
+        try:
+            estate = estate_rollup(plots, results)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": results, "estate": estate}, status=status.HTTP_200_OK)
+
+
+class CalcJobCreateView(APIView):
+    # POST /api/jobs {"kind": "metrics"|"batch", "payload": <cuerpo de /api/calc/metrics[/batch]>}
+    # -> 202 con el estado; lo ejecuta el comando run_calc_jobs (ver api/jobs.py)
+    def post(self, request):
+        data = request.data
+        if not isinstance(data, dict):
+            return Response({"detail": "Se esperaba un objeto JSON con 'kind' y 'payload'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = submit_job(data.get("kind"), data.get("payload"))
+        except QueueFull as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "30"})
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED, headers={"Location": reverse('calc-job-detail', args=[job.pk])})
+
+
+class CalcJobDetailView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(CalcJob.objects.defer('payload', 'result'), pk=pk)
+        return Response(job_status(job), status=status.HTTP_200_OK)
+
+
+class CalcJobResultView(APIView):
+    # Mismo cuerpo que la respuesta del endpoint sincrónico; 409 si no terminó bien, 410 si expiró
+    def get(self, request, pk):
+        job = get_object_or_404(CalcJob.objects.defer('payload'), pk=pk)
+        if is_expired(job):
+            return Response({"detail": "El resultado del trabajo expiró."}, status=status.HTTP_410_GONE)
+        if job.status != JobStatus.SUCCEEDED:
+            return Response({"detail": "El trabajo no tiene resultado.", "status": job.status, "error": job.error or None}, status=status.HTTP_409_CONFLICT)
+        return Response(job.result, status=status.HTTP_200_OK)
+
+
+class CalcJobCancelView(APIView):
+    def post(self, request, pk):
+        job = cancel_job(pk)
+        if job is None:
+            return Response({"detail": "No encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            return Response({"detail": "El trabajo ya terminó.", **job_status(job)}, status=status.HTTP_409_CONFLICT)
+        # En ejecución la cancelación es asíncrona: 202 hasta que el runner la aplique
+        code = status.HTTP_200_OK if job.status == JobStatus.CANCELLED else status.HTTP_202_ACCEPTED
+        return Response(job_status(job), status=code)
+
+class PlotProjectionView(APIView):
+    # Trayectorias por edad sobre la curva de sitio, para una parcela o un lote {"plots": [...]}
     def post(self, request):
         data = request.data or {}
-        trees = data.get("trees", [])
-        dist_in_row_m = float(data.get("distance_in_row_m", 0))
-        dist_between_rows_m = float(data.get("distance_between_rows_m", 0))
-        plot_area_m2 = float(data.get("plot_area_m2", 0))
-        min_trees_for_plot = int(data.get("min_trees_for_plot", 20))
-        age_years = float(data.get("age_years", 0))
-        animal_emission_kg_day = float(data.get("animal_emission_kg_day", 5.0))
-        site_index_m = data.get("site_index_m")
-        dominant_height_m_input = data.get("dominant_height_m")
-        root_ratio = float(data.get("species_root_ratio", 0.263))
-
-        # Validación mínima
-        if not isinstance(trees, list) or len(trees) == 0:
-            return Response({"detail": "Debe proporcionar una lista 'trees' con dap_cm y height_m."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Cálculo por árbol
-        per_tree = []
-        for t in trees:
-            dap = float(t.get("dap_cm", 0))
-            h = float(t.get("height_m", 0))
-            b_above = biomass_above_kg(dap, h)
-            b_root = biomass_root_kg(b_above, root_ratio)
-            per_tree.append({
-                "dap_cm": dap,
-                "height_m": h,
-                "ab_m2": round(basal_area_m2(dap), 4),
-                "vol_total_cc_m3": round(volume_total_cc_m3(dap, h), 4),
-                "vol_total_sc_m3": round(volume_total_sc_m3(dap, h), 4),
-                "vol_maderable15_cc_m3": round(volume_merchantable15_cc_m3(dap, h), 4),
-                "vol_maderable15_sc_m3": round(volume_merchantable15_sc_m3(dap, h), 4),
-                "biomass_above_kg": round(b_above, 3),
-                "biomass_root_kg": round(b_root, 3),
-                "biomass_total_kg": round(b_above + b_root, 3),
-            })
-
-        # Agregados de parcela / hectárea
-        agg = aggregate_plot_metrics(
-            trees,
-            dist_in_row_m,
-            dist_between_rows_m,
-            plot_area_m2=plot_area_m2,
-            age_years=age_years,
-            animal_emission_kg_day=animal_emission_kg_day,
-            root_ratio=root_ratio,
+        if not isinstance(data, dict):
+            return Response({"detail": "Se esperaba un objeto JSON."}, status=status.HTTP_400_BAD_REQUEST)
+        plots = data.get("plots")
+        single = plots is None
+        if single:
+            plots = [data]
+        if not isinstance(plots, list) or len(plots) == 0:
+            return Response({"detail": "Debe proporcionar una lista 'plots' con los datos de cada parcela."}, status=status.HTTP_400_BAD_REQUEST)
+        max_plots = getattr(settings, 'CIEFAP_BATCH_MAX_PLOTS', 5000)
+        if len(plots) > max_plots:
+            return Response({"detail": f"El lote admite como máximo {max_plots} parcelas."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ages = ages_from_payload(data, getattr(settings, 'CIEFAP_PROJECTION_MAX_AGES', 500))
+            results = project_payload(plots, ages, species_registry.allometries())
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        body = {"ages": ages.tolist()}
+        if single:
+            body.update(results[0])
+        else:
+            body["results"] = results
+        return Response(body, status=status.HTTP_200_OK)
+
+
+class PlotRotationView(APIView):
+    # Edad que maximiza el IMA de volumen o carbono, para uno o varios índices de sitio
+    def post(self, request):
+        data = request.data or {}
+        if not isinstance(data, dict):
+            return Response({"detail": "Se esperaba un objeto JSON."}, status=status.HTTP_400_BAD_REQUEST)
+        site_indices = data.get("site_indices")
+        max_plots = getattr(settings, 'CIEFAP_BATCH_MAX_PLOTS', 5000)
+        if isinstance(site_indices, list) and len(site_indices) > max_plots:
+            return Response({"detail": f"Se admiten como máximo {max_plots} índices de sitio."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ages = ages_from_payload(data, getattr(settings, 'CIEFAP_PROJECTION_MAX_AGES', 500), DEFAULT_ROTATION_GRID)
+            result = rotation_payload(data, ages, species_registry.allometries())
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class PlotMetricsStreamView(APIView):
+    # Cuerpo NDJSON/CSV con una fila por árbol; parámetros de parcela por query string.
+    # No se usa request.data para no cargar el cuerpo completo en memoria.
+
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def post(self, request):
+        fmt = stream_format(request.content_type)
+        if not fmt:
+            return Response({"detail": "Content-Type debe ser application/x-ndjson o text/csv."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            params = plot_parameters(request.query_params)
+            output_format = per_tree_format(request.query_params.get("per_tree"))
+            if output_format == PER_TREE_COLUMNS_FORMAT:
+                # Las columnas requieren todos los árboles antes de emitir: no hay streaming posible
+                raise ValueError("En streaming 'per_tree' admite 'rows' o 'none'.")
+            # ?species=<id|nombre>: ecuaciones de la especie para toda la parcela
+            allometry, root_ratio = plot_allometry(request.query_params, [], species_registry.allometries())
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if root_ratio is None:
+            params["root_ratio"] = allometry.root_ratio
+
+        body = request.stream if request.stream is not None else []
+        return StreamingHttpResponse(
+            stream_plot_metrics(body, fmt, params, with_per_tree=output_format != PER_TREE_NONE, allometry=allometry),
+            content_type="application/x-ndjson",
         )
 
-        # Site index / dominant height
-        dominant_height_calc = None
-        site_index_calc = None
-        if site_index_m is not None and age_years:
-            try:
-                dominant_height_calc = round(
-                    dominant_height_from_site_index(float(site_index_m), age_years), 2
-                )
-            except Exception:
-                dominant_height_calc = None
-        if dominant_height_m_input is not None and age_years:
-            try:
-                site_index_calc = round(
-                    site_index_from_dominant_height(float(dominant_height_m_input), age_years), 2
-                )
-            except Exception:
-                site_index_calc = None
-
-        # Parcela recomendada para mínimo de árboles y radio
-        recommended_area_m2 = recommended_plot_area_m2(dist_in_row_m, dist_between_rows_m, min_trees_for_plot)
-        recommended_radius_m = plot_radius_from_area_m(recommended_area_m2)
-        radius_from_provided_area_m = plot_radius_from_area_m(plot_area_m2) if plot_area_m2 else None
-
-        # Carbono y equilibrio animales/ha
-        c_bosque_tn_ha = carbon_forest_tn_per_ha(agg["biomass_total_tn_per_ha"]) if agg.get("biomass_total_tn_per_ha") is not None else 0.0
-        capture_kg_day_ha = capture_kg_per_day_per_ha(c_bosque_tn_ha, age_years) if age_years else 0.0
-        animals_equilibrium = animals_per_ha_equilibrium(capture_kg_day_ha, animal_emission_kg_day) if animal_emission_kg_day else 0.0
-
-        return Response({
-            "per_tree": per_tree,
-            "aggregates": agg,
-            "site": {
-                "dominant_height_from_site_index_m": dominant_height_calc,
-                "site_index_from_dominant_height_m": site_index_calc,
-                "age_years": age_years,
-            },
-            "plot": {
-                "recommended_area_m2_for_min_trees": round(recommended_area_m2, 2),
-                "recommended_radius_m": round(recommended_radius_m, 2),
-                "provided_area_m2": plot_area_m2 if plot_area_m2 else None,
-                "radius_from_provided_area_m": round(radius_from_provided_area_m, 2) if radius_from_provided_area_m else None,
-                "min_trees_for_plot": min_trees_for_plot,
-            },
-            "carbon": {
-                "c_bosque_tn_per_ha": round(c_bosque_tn_ha, 2),
-                "capture_kg_per_day_per_ha": round(capture_kg_day_ha, 3),
-                "animal_emission_kg_day": animal_emission_kg_day,
-                "animals_per_ha_equilibrium": round(animals_equilibrium, 2),
-            },
-        }, status=status.HTTP_200_OK)
+
+def _parse_date_param(name, value):
+    # Acepta fecha-hora ISO 8601 o solo fecha (se interpreta como las 00:00)
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is not None:
+                parsed = datetime.combine(day, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Fecha inválida (use ISO 8601, p. ej. 2025-11-11 o 2025-11-11T19:30:00Z).'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def filter_measurements(queryset, params):
+    # Filtros de /api/records (también los usa la exportación)
+    plot_id = params.get('plot')
+    if plot_id:
+        if not str(plot_id).isdigit():
+            raise ValidationError({'plot': 'Debe ser un id numérico.'})
+        queryset = queryset.filter(plot_id=int(plot_id))
+    for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+        value = params.get(param)
+        if value:
+            queryset = queryset.filter(**{lookup: _parse_date_param(param, value)})
+    # Rangos sobre las columnas de resumen: ?vol_total_cc_per_ha_m3_min=300
+    for name in SUMMARY_FIELDS:
+        for suffix, lookup in (('_min', 'gte'), ('_max', 'lte')):
+            value = params.get(name + suffix)
+            if value:
+                try:
+                    queryset = queryset.filter(**{f'{name}__{lookup}': float(value)})
+                except ValueError:
+                    raise ValidationError({name + suffix: 'Debe ser numérico.'})
+    return queryset
+
+
+class TreeImportView(APIView):
+    # Carga masiva de árboles: cuerpo CSV/NDJSON (plot, number, dap_cm, height_m), leído por lotes
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def post(self, request):
+        fmt = stream_format(request.content_type)
+        if not fmt:
+            return Response({"detail": "Content-Type debe ser application/x-ndjson o text/csv."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        params = request.query_params
+        try:
+            default_plot = int(params["plot"]) if params.get("plot") else None
+            batch_size = int(params.get("batch_size", DEFAULT_IMPORT_BATCH_SIZE))
+        except ValueError:
+            return Response({"detail": "'plot' y 'batch_size' deben ser numéricos."}, status=status.HTTP_400_BAD_REQUEST)
+        create_plots = params.get("create_plots", "0").lower() in ("1", "true", "yes")
+
+        # Los lotes ya confirmados quedan guardados si una fila posterior falla (reintentar es idempotente)
+        progress = {"rows": 0, "batches": 0, "plots_created": 0}
+        body = request.stream if request.stream is not None else []
+        try:
+            stats = import_trees(
+                iter_inventory_rows(body, fmt, default_plot),
+                batch_size=batch_size,
+                create_plots=create_plots,
+                progress=progress.update,
+            )
+        except RowError as exc:
+            return Response({"detail": str(exc), "line": exc.line, "imported": progress}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as exc:
+            return Response({"detail": str(exc), "imported": progress}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class StoredPlotMetricsView(APIView):
+    # GET /api/plots/<id>/metrics: métricas desde Plot/Tree guardados; la query puede
+    # sobrescribir parámetros de la parcela (age_years, site_index_m, animal_emission_kg_day, ...)
+    OVERRIDES = ('plot_area_m2', 'min_trees_for_plot', 'age_years', 'animal_emission_kg_day',
+                 'site_index_m', 'dominant_height_m', 'species_root_ratio')
+
+    def get(self, request, pk):
+        plot = get_object_or_404(Plot.objects.select_related('species'), pk=pk)
+        overrides = {name: request.query_params.get(name) for name in self.OVERRIDES}
+        try:
+            result = stored_plot_metrics(plot, overrides)
+        except (TypeError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
 
 
 class MeasurementListCreateView(generics.ListCreateAPIView):
-    queryset = Measurement.objects.all().order_by('-created_at')
+    queryset = Measurement.objects.all().order_by('-created_at', '-id')
     serializer_class = MeasurementSerializer
+    pagination_class = KeysetPagination
+
+    def get_projection(self):
+        # ?fields=id,plot,created_at -> solo esas columnas (None = todas)
+        raw = self.request.query_params.get('fields')
+        if self.request.method != 'GET' or not raw:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = set(fields) - set(MeasurementSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Campos desconocidos: {', '.join(sorted(unknown))}."})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', self.get_projection())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = filter_measurements(super().get_queryset(), self.request.query_params)
+        # Los blobs de input_data/metrics se leen solo si se van a serializar
+        fields = self.get_projection()
+        if fields is not None:
+            heavy = [Measurement.PAYLOAD_FIELDS[name] for name in MeasurementSerializer.HEAVY_FIELDS if name in fields]
+            queryset = queryset.select_related(None)
+            if heavy:
+                queryset = queryset.select_related(*heavy)
+        return queryset
+
+    def page_validators(self, rows, has_next):
+        # ETag de la página: URL completa (filtros, cursor, fields), formato y (id, updated_at)
+        # de sus filas. Sin Last-Modified (ver conditional.py): la página cambia también por
+        # bajas o filas que se desplazan, sin que cambie ningún updated_at
+        request = self.request
+        etag = make_etag(
+            request.build_absolute_uri(), request.accepted_renderer.format, has_next,
+            [(pk, updated_at.isoformat()) for pk, updated_at in rows],
+        )
+        return etag, None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if has_conditional_headers(request, by_date=False):
+            page_size = self.paginator.get_page_size(request)
+            rows = list(self.paginator.page_queryset(queryset, request).values_list('id', 'updated_at'))
+            not_modified = not_modified_response(request, *self.page_validators(rows[:page_size], len(rows) > page_size))
+            if not_modified is not None:
+                return not_modified
+
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        set_validators(response, *self.page_validators([(m.pk, m.updated_at) for m in page], self.paginator.has_next))
+        return response
 
     def create(self, request, *args, **kwargs):
-        payload = request.data or {}
+        with phase("parse"):
+            payload = request.data or {}
         input_data = payload.get('input_data')
         metrics = payload.get('metrics')
         plot_id = payload.get('plot_id')
 
         # Si no se envían metrics, los calculamos con los datos provistos
         if not metrics and input_data:
-            trees = input_data.get('trees', [])
-            dist_in_row_m = float(input_data.get('distance_in_row_m', 0))
-            dist_between_rows_m = float(input_data.get('distance_between_rows_m', 0))
-            plot_area_m2 = float(input_data.get('plot_area_m2', 0))
-            age_years = float(input_data.get('age_years', 0))
-            animal_emission_kg_day = float(input_data.get('animal_emission_kg_day', 5.0))
-            root_ratio = float(input_data.get('species_root_ratio', 0.263))
-            metrics = aggregate_plot_metrics(
-                trees,
-                dist_in_row_m,
-                dist_between_rows_m,
-                plot_area_m2=plot_area_m2,
-                age_years=age_years,
-                animal_emission_kg_day=animal_emission_kg_day,
-                root_ratio=root_ratio,
-            )
+            try:
+                metrics = compute_record_metrics(input_data, species_registry.allometries())
+            except ValueError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with phase("db_write"):
+            plot = Plot.objects.filter(pk=plot_id).first() if plot_id else None
+            measurement = Measurement.objects.create(plot=plot, input_data=input_data, metrics=metrics)
+        with phase("serialize"):
+            serializer = self.get_serializer(measurement)
+            data = serializer.data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
-        plot = Plot.objects.filter(pk=plot_id).first() if plot_id else None
-        measurement = Measurement.objects.create(plot=plot, input_data=input_data, metrics=metrics)
-        serializer = self.get_serializer(measurement)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+class MeasurementExportView(APIView):
+    # GET /api/records/export?output=csv|parquet|arrow&trees=1 con los filtros de /api/records.
+    # Cuerpo en streaming: se lee y escribe por bloques, sin armar el archivo en memoria.
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        params = request.query_params
+        fmt = params.get('output', EXPORT_CSV).lower()
+        if fmt not in EXPORT_FORMATS:
+            return Response({"detail": f"'output' debe ser uno de: {', '.join(EXPORT_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if not export_available(fmt):
+            return Response({"detail": "Exportar en Parquet/Arrow requiere el paquete pyarrow en el servidor."}, status=status.HTTP_406_NOT_ACCEPTABLE)
+        trees = params.get('trees', '0').lower() in ('1', 'true', 'yes')
+        queryset = filter_measurements(Measurement.objects.all(), params)
+
+        allometries = species_registry.allometries() if trees else None
+        response = StreamingHttpResponse(export_chunks(queryset, fmt, trees, allometries), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, trees)}"'
+        return response
 
 
 class MeasurementRetrieveUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Measurement.objects.all()
     serializer_class = MeasurementSerializer
+
+    def record_validators(self, pk, updated_at):
+        return make_etag(pk, updated_at.isoformat(), self.request.accepted_renderer.format), updated_at
+
+    def retrieve(self, request, *args, **kwargs):
+        if has_conditional_headers(request):
+            # Solo updated_at: sin leer ni serializar las columnas JSON
+            updated_at = get_object_or_404(self.get_queryset().values_list('updated_at', flat=True), pk=self.kwargs['pk'])
+            not_modified = not_modified_response(request, *self.record_validators(self.kwargs['pk'], updated_at))
+            if not_modified is not None:
+                return not_modified
+
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        set_validators(response, *self.record_validators(instance.pk, instance.updated_at))
+        return response
+
+
+class MeasurementAnalyticsView(APIView):
+    # GET /api/analytics?group_by=producer|species|site_class|month&metrics=...&percentiles=50,90
+    max_page_size = 500
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get('group_by', '')
+        if group_by not in GROUPINGS:
+            raise ValidationError({'group_by': f"Debe ser uno de: {', '.join(GROUPINGS)}."})
+        metrics = [name.strip() for name in params.get('metrics', ','.join(DEFAULT_METRICS)).split(',') if name.strip()]
+        unknown = set(metrics) - set(SUMMARY_FIELDS)
+        if not metrics or unknown:
+            raise ValidationError({'metrics': f"Métricas válidas: {', '.join(SUMMARY_FIELDS)}."})
+        try:
+            percentiles = [float(p) for p in params.get('percentiles', '50,90').split(',') if p.strip()]
+            page = max(1, int(params.get('page', 1)))
+            page_size = max(1, min(int(params.get('page_size', 100)), self.max_page_size))
+        except ValueError:
+            raise ValidationError({'detail': "'percentiles', 'page' y 'page_size' deben ser numéricos."})
+        if any(p < 0 or p > 100 for p in percentiles):
+            raise ValidationError({'percentiles': 'Deben estar entre 0 y 100.'})
+
+        key = analytics_cache_key(dict(params.items()))
+        cached = cache.get(key)
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK)
+
+        queryset = Measurement.objects.all()
+        for param, lookup in (('plot', 'plot_id'), ('producer', 'plot__producer_id'), ('species', 'plot__species_id')):
+            value = params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({param: 'Debe ser un id numérico.'})
+                queryset = queryset.filter(**{lookup: int(value)})
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            value = params.get(param)
+            if value:
+                queryset = queryset.filter(**{lookup: _parse_date_param(param, value)})
+
+        offset = (page - 1) * page_size
+        data = grouped_statistics(queryset, group_by, metrics, percentiles, offset=offset, limit=page_size)
+        data['next_page'] = page + 1 if offset + page_size < data['count'] else None
+        cache.set(key, data, timeout=getattr(settings, 'CIEFAP_ANALYTICS_CACHE_TTL', 300))
+        return Response(data, status=status.HTTP_200_OK)
+
+
+def prometheus_metrics(request):
+    # GET /api/ops/metrics: exposición de texto de Prometheus (métricas de este proceso)
+    if not instrumentation_settings()["ENABLED"]:
+        return HttpResponse("Instrumentación deshabilitada.\n", status=404, content_type="text/plain; charset=utf-8")
+    return HttpResponse(instrumentation_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
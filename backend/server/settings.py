@@ -47,8 +47,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero para medir el pedido completo; se desactiva solo si CIEFAP_INSTRUMENTATION lo indica
+    'api.middleware.TimingMiddleware',
+    # gzip/brotli de las respuestas JSON grandes (CIEFAP_COMPRESSION)
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise con soporte asíncrono (ver api/middleware.py)
+    'api.middleware.StaticFilesMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -208,7 +213,89 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:4200',
 ]
 
+# JSON rápido (orjson, salida idéntica a la de DRF; sin orjson instalado usa json de la
+# biblioteca estándar). CIEFAP_FAST_JSON=false vuelve al renderer/parser de DRF.
+CIEFAP_FAST_JSON = os.environ.get('CIEFAP_FAST_JSON', 'True').lower() in ('true', '1', 't')
+JSON_RENDERER = 'api.renderers.FastJSONRenderer' if CIEFAP_FAST_JSON else 'rest_framework.renderers.JSONRenderer'
+JSON_PARSER = 'api.parsers.FastJSONParser' if CIEFAP_FAST_JSON else 'rest_framework.parsers.JSONParser'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'DEFAULT_RENDERER_CLASSES': [JSON_RENDERER, 'rest_framework.renderers.BrowsableAPIRenderer'],
+    'DEFAULT_PARSER_CLASSES': [JSON_PARSER, 'rest_framework.parsers.FormParser', 'rest_framework.parsers.MultiPartParser'],
+}
+
+# Cálculo por lotes (/api/calc/metrics/batch)
+CIEFAP_BATCH_MAX_PLOTS = int(os.environ.get('CIEFAP_BATCH_MAX_PLOTS', '5000'))
+# A partir de cuántas parcelas el lote se reparte entre procesos
+CIEFAP_BATCH_PARALLEL_MIN_PLOTS = int(os.environ.get('CIEFAP_BATCH_PARALLEL_MIN_PLOTS', '64'))
+# Procesos para lotes grandes (vacío = cantidad de CPUs)
+CIEFAP_BATCH_MAX_WORKERS = int(os.environ.get('CIEFAP_BATCH_MAX_WORKERS', '0')) or None
+
+# Caché de resultados de /api/calc/metrics (clave = hash canónico de la entrada).
+# BACKEND: 'local' (LRU en memoria de cada proceso), 'django' (usa CACHES[ALIAS], compartido
+# entre workers de gunicorn si el backend es Redis/Memcached/DB) o 'none'.
+# MAX_BYTES acota la memoria de 'local' por proceso; los resultados de más de
+# MAX_ENTRY_BYTES (estimados por la cantidad de filas per_tree) no se cachean.
+CIEFAP_RESULT_CACHE = {
+    'BACKEND': os.environ.get('CIEFAP_RESULT_CACHE_BACKEND', 'local'),
+    'ALIAS': os.environ.get('CIEFAP_RESULT_CACHE_ALIAS', 'default'),
+    'MAX_ENTRIES': int(os.environ.get('CIEFAP_RESULT_CACHE_MAX_ENTRIES', '512')),
+    'MAX_BYTES': int(os.environ.get('CIEFAP_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    'MAX_ENTRY_BYTES': int(os.environ.get('CIEFAP_RESULT_CACHE_MAX_ENTRY_BYTES', str(4 * 1024 * 1024))),
+    'TTL': int(os.environ.get('CIEFAP_RESULT_CACHE_TTL', '600')),
+}
+
+# Segundos que se cachean las respuestas de /api/analytics (se invalidan al guardar mediciones)
+CIEFAP_ANALYTICS_CACHE_TTL = int(os.environ.get('CIEFAP_ANALYTICS_CACHE_TTL', '300'))
+
+# Cada cuántos segundos un proceso vuelve a leer la versión del registro de especies
+# (SpeciesVersion): demora máxima con la que otros workers ven una especie modificada
+CIEFAP_SPECIES_RECHECK_SECONDS = float(os.environ.get('CIEFAP_SPECIES_RECHECK_SECONDS', '2'))
+
+# Máximo de edades por proyección (/api/calc/projection)
+CIEFAP_PROJECTION_MAX_AGES = int(os.environ.get('CIEFAP_PROJECTION_MAX_AGES', '500'))
+
+# Instrumentación por pedido (cabecera Server-Timing, /api/ops/metrics y cProfile a pedido).
+# Deshabilitada por defecto; el perfilado requiere PROFILE_DIR y el token en X-Ciefap-Profile
+# (o una fracción de muestreo automático).
+CIEFAP_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('CIEFAP_INSTRUMENTATION', 'False').lower() in ('true', '1', 't'),
+    'PROFILE_TOKEN': os.environ.get('CIEFAP_PROFILE_TOKEN', ''),
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('CIEFAP_PROFILE_SAMPLE_RATE', '0')),
+    'PROFILE_DIR': os.environ.get('CIEFAP_PROFILE_DIR', ''),
+}
+
+# Compresión de respuestas JSON/texto (gzip; brotli si el paquete está instalado)
+CIEFAP_COMPRESSION = {
+    'ENABLED': os.environ.get('CIEFAP_COMPRESSION', 'True').lower() in ('true', '1', 't'),
+    'MIN_SIZE': int(os.environ.get('CIEFAP_COMPRESSION_MIN_SIZE', '1024')),
+    'GZIP_LEVEL': int(os.environ.get('CIEFAP_COMPRESSION_GZIP_LEVEL', '6')),
+    'BROTLI_QUALITY': int(os.environ.get('CIEFAP_COMPRESSION_BROTLI_QUALITY', '5')),
+}
+
+# Almacenamiento de input_data/metrics de las mediciones (PayloadBlob, ver api/payloads.py):
+# JSON desde COMPRESS_MIN_SIZE bytes se comprimen con zlib
+CIEFAP_PAYLOADS = {
+    'COMPRESS_MIN_SIZE': int(os.environ.get('CIEFAP_PAYLOADS_COMPRESS_MIN_SIZE', '64')),
+    'COMPRESS_LEVEL': int(os.environ.get('CIEFAP_PAYLOADS_COMPRESS_LEVEL', '6')),
+}
+
+# Vistas asíncronas de /api/calc/metrics y /api/records para el despliegue ASGI (uvicorn,
+# ver README). Bajo WSGI (gunicorn sync) conviene dejarlas desactivadas.
+CIEFAP_ASYNC_VIEWS = os.environ.get('CIEFAP_ASYNC_VIEWS', 'False').lower() in ('true', '1', 't')
+# Hilos para parseo y cálculo de las vistas asíncronas (vacío = cantidad de CPUs)
+CIEFAP_ASYNC_CPU_WORKERS = int(os.environ.get('CIEFAP_ASYNC_CPU_WORKERS', '0')) or None
+
+# Trabajos de cálculo en segundo plano (/api/jobs); los ejecuta `python manage.py run_calc_jobs`
+CIEFAP_JOBS = {
+    'MAX_CONCURRENT': int(os.environ.get('CIEFAP_JOBS_MAX_CONCURRENT', '2')),
+    'WORKERS': int(os.environ.get('CIEFAP_JOBS_WORKERS', '0')) or None,
+    'CHUNK_SIZE': int(os.environ.get('CIEFAP_JOBS_CHUNK_SIZE', '50')),
+    'MAX_QUEUED': int(os.environ.get('CIEFAP_JOBS_MAX_QUEUED', '100')),
+    'MAX_PLOTS': int(os.environ.get('CIEFAP_JOBS_MAX_PLOTS', '100000')),
+    'RESULT_TTL': int(os.environ.get('CIEFAP_JOBS_RESULT_TTL', '86400')),
+    'POLL_INTERVAL': float(os.environ.get('CIEFAP_JOBS_POLL_INTERVAL', '2')),
+    'STALE_AFTER': int(os.environ.get('CIEFAP_JOBS_STALE_AFTER', '300')),
 }